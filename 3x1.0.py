@@ -11,46 +11,45 @@ from ursina import *
 import os
 import math
 
+from meshgen import create_checker_floor
+from character import CharacterController, CharacterState, interpolate, GroundCache
+from fixedstep import FixedTimestep
+from simthread import CharacterSim, SimulationThread
+from profiler import FrameProfiler
+import colliders
+from colliders import build_static_grid, RaycastWorld
+from heightmap import bake_heightmap, HeightMapWorld
+from level import load_level, LEVEL_FOLDER
+from bake import bake_lighting
+from assets import asset_manager, MODEL_TYPES, TEXTURE_TYPES
+
 # Global toggle: external model files OFF (always use builtin cube)
 FILES_OFF = True
 
+# Global toggle: Mario's physics on its own thread (simthread.py) instead of in update()
+PHYSICS_THREAD = False
+
 
 # =============================
 # Helpers
 # =============================
 
+ASSET_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+
 def resolve_mario_model():
-    """Try to find an external Mario 3D model in common asset paths.
+    """Try to find an external Mario 3D model in the indexed assets folder.
     Returns (model_path_or_builtin, texture_path_or_None).
     Place your model under an `assets/` folder next to this script, e.g.:
       assets/mario.glb, assets/mario.gltf, assets/mario.obj, assets/mario.ursinamesh
       optional texture: assets/mario.png
+    Names are matched case-insensitively, in any subfolder.
     """
     if FILES_OFF:
         return 'cube', None
-    here = os.path.dirname(os.path.abspath(__file__))
-    assets = os.path.join(here, 'assets')
-    candidates = [
-        'mario.glb', 'mario.gltf', 'mario.obj', 'mario.ursinamesh',
-        'Mario.glb', 'Mario.gltf', 'Mario.obj', 'Mario.ursinamesh'
-    ]
-    texture_candidates = ['mario.png', 'Mario.png']
-
-    model_path = None
-    texture_path = None
-
-    if os.path.isdir(assets):
-        for name in candidates:
-            p = os.path.join(assets, name)
-            if os.path.isfile(p):
-                model_path = p
-                break
-        if model_path:
-            for tname in texture_candidates:
-                tp = os.path.join(assets, tname)
-                if os.path.isfile(tp):
-                    texture_path = tp
-                    break
+    index = asset_manager(ASSET_FOLDER).index
+    model_path = index.find('mario', MODEL_TYPES)
+    texture_path = index.find('mario', TEXTURE_TYPES) if model_path else None
 
     # Fallback to cube if no model found
     if not model_path:
@@ -76,7 +75,8 @@ def create_indoor_environment():
         color=color.rgb(150, 120, 90),  # base under the tiles
         scale=(room_size, 1, room_size),
         position=(0, -0.5, 0),   # top sits exactly at y=0
-        collider='box'
+        collider='box',
+        static=True
     )
 
     # Ceiling
@@ -86,7 +86,8 @@ def create_indoor_environment():
         color=color.rgb(160, 140, 120),
         scale=(room_size, wall_thickness, room_size),
         position=(0, wall_height, 0),
-        collider='box'
+        collider='box',
+        static=True
     )
 
     # Walls (light warm tone)
@@ -98,7 +99,8 @@ def create_indoor_environment():
         color=color.rgb(200, 180, 165),
         scale=(room_size, wall_height, wall_thickness),
         position=(0, wall_height/2, room_size/2),
-        collider='box'
+        collider='box',
+        static=True
     ))
     # South
     walls.append(Entity(
@@ -107,7 +109,8 @@ def create_indoor_environment():
         color=color.rgb(200, 180, 165),
         scale=(room_size, wall_height, wall_thickness),
         position=(0, wall_height/2, -room_size/2),
-        collider='box'
+        collider='box',
+        static=True
     ))
     # East
     walls.append(Entity(
@@ -116,7 +119,8 @@ def create_indoor_environment():
         color=color.rgb(200, 180, 165),
         scale=(wall_thickness, wall_height, room_size),
         position=(room_size/2, wall_height/2, 0),
-        collider='box'
+        collider='box',
+        static=True
     ))
     # West
     walls.append(Entity(
@@ -125,26 +129,16 @@ def create_indoor_environment():
         color=color.rgb(200, 180, 165),
         scale=(wall_thickness, wall_height, room_size),
         position=(-room_size/2, wall_height/2, 0),
-        collider='box'
+        collider='box',
+        static=True
     ))
 
-    # Checkered floor tiles (black/white) on top of the slab
-    # Keep this light: 12x12 grid over 30x30 area
-    tiles = []
+    # Checkered floor (black/white) on top of the slab
+    # One textured plane instead of one quad per tile: 1 node / 1 draw call
+    # for any grid (the old 12x12 loop cost 144 of each)
     grid = 12
-    tile_size = room_size / grid
-    start = -room_size / 2 + tile_size / 2
-    for gx in range(grid):
-        for gz in range(grid):
-            is_black = (gx + gz) % 2 == 0
-            tiles.append(Entity(
-                model='quad',
-                color=color.rgb(240, 240, 240) if not is_black else color.rgb(30, 30, 30),
-                scale=(tile_size, tile_size),
-                rotation_x=90,
-                position=(start + gx * tile_size, 0.01, start + gz * tile_size),
-                collider=None
-            ))
+    tiles = create_checker_floor(room_size, grid, y=0.01,
+                                 color_a=color.rgb(30, 30, 30), color_b=color.rgb(240, 240, 240), static=True)
 
     # Red carpet down the middle
     carpet = Entity(
@@ -152,7 +146,8 @@ def create_indoor_environment():
         color=color.rgb(170, 20, 20),
         scale=(4, 0.02, room_size * 0.8),
         position=(0, 0.02, 0),
-        collider=None
+        collider=None,
+        static=True
     )
 
     # Decorative pillars (use cubes for compatibility if 'cylinder' model is missing)
@@ -164,22 +159,23 @@ def create_indoor_environment():
                 color=color.rgb(210, 190, 175),
                 scale=(1.2, wall_height, 1.2),  # slender columns
                 position=(sx * (room_size/2 - 3), wall_height/2, sz * (room_size/2 - 3)),
-                collider='box'
+                collider='box',
+                static=True
             ))
 
     # Castle-style doors on the north wall: one star door center, two side doors
     door_z = room_size/2 - 0.51
     # Center door
     center_door = Entity(model='cube', color=color.rgb(180, 120, 60),
-                         scale=(3, 4.5, 0.3), position=(0, 2.25, door_z), collider='box')
+                         scale=(3, 4.5, 0.3), position=(0, 2.25, door_z), collider='box', static=True)
     # Star emblem
     star = Entity(parent=center_door, model='quad', color=color.yellow,
-                  scale=(1, 1), position=(0, 0.5, -0.18), rotation_x=0)
+                  scale=(1, 1), position=(0, 0.5, -0.18), rotation_x=0, static=True)
     # Side doors
     left_door = Entity(model='cube', color=color.rgb(150, 90, 50),
-                       scale=(2.4, 4, 0.3), position=(-6, 2, door_z), collider='box')
+                       scale=(2.4, 4, 0.3), position=(-6, 2, door_z), collider='box', static=True)
     right_door = Entity(model='cube', color=color.rgb(150, 90, 50),
-                        scale=(2.4, 4, 0.3), position=(6, 2, door_z), collider='box')
+                        scale=(2.4, 4, 0.3), position=(6, 2, door_z), collider='box', static=True)
 
     # Paintings along the north wall
     paintings = []
@@ -190,10 +186,11 @@ def create_indoor_environment():
             scale=(3, 2.5),
             position=(x, 3.0, door_z + 0.02),
             rotation_y=180,
-            collider=None
+            collider=None,
+            static=True
         ))
 
-    return [floor, ceiling] + walls + tiles + [carpet] + pillars + [center_door, left_door, right_door] + paintings
+    return [floor, ceiling] + walls + [tiles, carpet] + pillars + [center_door, left_door, right_door] + paintings
 
 
 def create_furniture():
@@ -203,7 +200,8 @@ def create_furniture():
         color=color.rgb(101, 67, 33),
         scale=(4, 1, 4),
         position=(0, 0.5, 0),
-        collider='box'
+        collider='box',
+        static=True
     )
 
     # Four green columns (decor) — use cubes for broad compatibility
@@ -213,7 +211,8 @@ def create_furniture():
             color=color.green,
             scale=(1, 3, 1),
             position=(8 * math.cos(i * math.pi/2), 1.5, 8 * math.sin(i * math.pi/2)),
-            collider='box'
+            collider='box',
+            static=True
         )
 
 
@@ -221,31 +220,50 @@ def create_furniture():
 # PLAYER CONTROLLER
 # =============================
 class Mario(Entity):
-    def __init__(self, **kwargs):
-        model_path, texture_path = resolve_mario_model()
+    def __init__(self, physics_rate=120, max_substeps=8, heightmap=None, **kwargs):
+        # Start on the cube placeholder; an external model is loaded in the
+        # background and swapped in when ready
         super().__init__(
-            model=model_path,
-            texture=texture_path,
-            color=color.white if texture_path else color.blue,
+            model='cube',
+            color=color.blue,
             scale=(1, 2, 1),   # 2 units tall
             origin_y=-1,       # pivot at feet
             collider='box',
             **kwargs
         )
 
-        # Movement
-        self.speed = 6
-        self.jump_speed = 10
-        self.gravity = -25
+        # Movement (engine-independent core in character.py)
+        self.controller = CharacterController(
+            speed=6,
+            jump_speed=10,
+            gravity=-25,
+            terminal=-20,
+            ground_snap=0.25,   # max snap distance to ground
+            skin=0.05,          # small cast tolerance
+            kill_y=-20,         # respawn below this
+            spawn_point=self.position,
+            radius=0.5,         # walls stop the 1x2x1 body (swept: no tunneling at any dt)
+            height=2,
+        )
+        self.state = CharacterState(*self.position)
+        self.previous_state = self.state
+        self.world = GroundCache(RaycastWorld(ignore=[self]))
+        if heightmap:   # ground probes over flat tops are a cell lookup (heightmap.py)
+            self.world = HeightMapWorld(heightmap, self.world)
+        # Fixed-rate physics, rendered interpolated between the last two states
+        self.clock = FixedTimestep(rate=physics_rate, max_substeps=max_substeps)
+        # PHYSICS_THREAD: the same steps on their own thread, against the static
+        # grid only (no Panda3D queries off the main thread)
+        self.sim = None
+        if PHYSICS_THREAD:
+            world = GroundCache(colliders.static_grid)
+            world = HeightMapWorld(heightmap, world) if heightmap else world
+            self.sim = CharacterSim(self.controller, self.state, world)
+            self.sim_thread = SimulationThread(rate=physics_rate, max_substeps=max_substeps)
+            self.sim_thread.add(self.sim)
+            self.sim_thread.start()
         self.velocity_y = 0
-        self.terminal = -20
         self.on_ground = False
-        self.ground_snap = 0.25   # max snap distance to ground
-        self.skin = 0.05          # small cast tolerance
-
-        # Respawn logic
-        self.kill_y = -20
-        self.spawn_point = Vec3(self.position)
 
         # Camera setup (Lakitu off: simple follow)
         self.camera_pivot = Entity(parent=self, y=1.5)
@@ -254,58 +272,33 @@ class Mario(Entity):
         camera.rotation = (15, 0, 0)
         camera.fov = 85
 
+        model_path, texture_path = resolve_mario_model()
+        if model_path != 'cube':
+            asset_manager(ASSET_FOLDER).request_model(self, 'mario', 'mario' if texture_path else None)
+
     def update(self):
         # Camera-relative input (WASD relative to camera yaw)
         input_x = held_keys['d'] - held_keys['a']
         input_z = held_keys['w'] - held_keys['s']
         move_dir = (camera.forward * input_z + camera.right * input_x)
-        move_dir.y = 0
-        if move_dir.length() > 0:
-            move_dir = move_dir.normalized()
-            self.look_at(self.position + move_dir)
-            self.position += move_dir * self.speed * time.dt
-
-        # Gravity
-        self.velocity_y += self.gravity * time.dt
-        if self.velocity_y < self.terminal:
-            self.velocity_y = self.terminal
-
-        # Pre-move downward sweep to prevent tunneling
-        dy = self.velocity_y * time.dt
-        if dy < 0:
-            ray_origin = self.world_position + Vec3(0, self.skin, 0)
-            sweep = abs(dy) + self.ground_snap
-            hit = raycast(ray_origin, direction=self.down, distance=sweep, ignore=[self])
-            if hit.hit:
-                # Land on ground
-                self.y = hit.world_point.y
-                self.velocity_y = 0
-                self.on_ground = True
-            else:
-                # No ground within sweep; apply full move
-                self.y += dy
-                self.on_ground = False
-        else:
-            # Moving up or stationary: apply move
-            self.y += dy
-            # Gentle ground snap if very close and not ascending fast
-            ray_origin = self.world_position + Vec3(0, self.skin, 0)
-            hit = raycast(ray_origin, direction=self.down, distance=self.ground_snap, ignore=[self])
-            if hit.hit and self.velocity_y <= 0.1:
-                self.y = hit.world_point.y
-                self.on_ground = True
-            else:
-                self.on_ground = False
-
-        # Jump
-        if held_keys['space'] and self.on_ground:
-            self.velocity_y = self.jump_speed
-            self.on_ground = False
-
-        # Kill plane
-        if self.y < self.kill_y:
-            self.position = Vec3(self.spawn_point)
-            self.velocity_y = 0
+
+        if self.sim:
+            self.sim.input.set((move_dir.x, move_dir.z, bool(held_keys['space'])))
+            x, y, z, self.rotation_y, self.velocity_y, self.on_ground = self.sim.sample()
+            self.position = (x, y, z)
+            return
+        for _ in range(self.clock.advance(time.dt)):
+            self.previous_state = self.state
+            self.state = self.controller.step(self.state, move_dir.x, move_dir.z, held_keys['space'], self.clock.dt, self.world)
+        x, y, z, yaw = interpolate(self.previous_state, self.state, self.clock.alpha)
+        self.position = (x, y, z)
+        self.rotation_y = yaw
+        self.velocity_y = self.state.velocity_y
+        self.on_ground = self.state.on_ground
+
+    def on_destroy(self):
+        if self.sim:
+            self.sim_thread.stop()
 
 
 # =============================
@@ -317,16 +310,29 @@ def main():
     window.title = "Indoor Mario Test"
     window.color = color.rgb(120, 160, 200)
 
-    # Environment
-    create_indoor_environment()
-    create_furniture()
+    # Environment: create_indoor_environment() + create_furniture(), exported to
+    # levels/indoor_hall.json (`python level.py export`) and loaded from its
+    # compiled cache
+    level = load_level(os.path.join(LEVEL_FOLDER, 'indoor_hall.json'))
+
+    # Index every static collider once; Mario's probes only visit nearby cells
+    build_static_grid()
 
-    # Lighting
-    PointLight(position=(0, 6, -2), color=color.white)
-    AmbientLight(color=color.rgba(200, 200, 200, 0.5))
+    # Lighting: baked into the room's vertex colours once (cached with the
+    # level); the live lights only reach Mario
+    lights = [PointLight(position=(0, 6, -2), color=color.white),
+              AmbientLight(color=color.rgba(200, 200, 200, 0.5))]
+    bake_lighting(level, lights)
+
+    # Walkable tops baked into a heightmap (cached with the level): Mario's
+    # ground probes there are a cell lookup, with the raycast world near edges
+    heightmap = bake_heightmap(level, colliders.static_grid, exclude=colliders.unindexed_bounds())
 
     # Player
-    Mario(position=(0, 2, 0))
+    Mario(position=(0, 2, 0), heightmap=heightmap)
+
+    # F3: frame profiler overlay, F4: dump the last 10 s to CSV
+    FrameProfiler()
 
     Sky(color=color.rgb(200, 200, 200))  # soft indoor light
 
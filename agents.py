@@ -0,0 +1,208 @@
+"""
+agents.py — vectorized Mario-style agents with NumPy (no Ursina import).
+
+Same movement rules as character.CharacterController, applied to every agent
+at once over structure-of-arrays buffers:
+
+- position (N, 3), velocity_y, on_ground, yaw, spawn (N, 3)
+- walk, gravity + terminal clamp, swept ground probe + snap against the
+  static box tops, jump, kill-plane respawn
+
+Movement tuning comes from a CharacterController. With a
+heightmap.HeightMap baked from the same grounds (bounds=True), ground checks
+cost a cell lookup instead of a pass per ground; only agents on cells with
+more grounds than the map has layers still scan them all. crowd.py draws the
+agents with one instanced node. Run this file for the headless benchmark.
+"""
+
+import math
+import numpy as np
+
+from character import CharacterController
+
+
+class AgentSystem:
+    def __init__(self, count, controller=None, spawn_points=None, grounds=(), heightmap=None):
+        self.count = count
+        self.controller = controller or CharacterController()
+        self.spawn = np.zeros((count, 3), dtype=np.float64)
+        if spawn_points is not None:
+            self.spawn[:] = spawn_points
+        self.position = self.spawn.copy()
+        self.velocity_y = np.zeros(count)
+        self.on_ground = np.zeros(count, dtype=bool)
+        self.yaw = np.zeros(count)
+        self.heightmap = heightmap      # unbound, baked from the grounds with bounds=True
+        self.set_grounds(grounds)
+
+    def set_grounds(self, shapes):
+        """Static walkable surfaces: the top face of each shape's bounding box."""
+        shapes = list(shapes)
+        bounds = np.array([(s.min[0], s.max[0], s.min[2], s.max[2], s.max[1]) for s in shapes], dtype=np.float64)
+        self._grounds = bounds.reshape(-1, 5)
+
+    @property
+    def has_grounds(self):
+        """Whether set_grounds() was given any surface."""
+        return len(self._grounds) > 0
+
+    # =============================
+    # QUERIES
+    # =============================
+    def ground_below(self, x, y, z, distance):
+        """Highest ground top in [y - distance, y] under each (x, z); -inf where none."""
+        if self.heightmap is None:
+            return self._scan_grounds(x, y, z, distance)
+        best, known = self.heightmap.ground_below(x, y, z, distance)
+        if not known.all():
+            rest = ~known
+            best[rest] = self._scan_grounds(x[rest], y[rest], z[rest], np.broadcast_to(distance, x.shape)[rest])
+        return best
+
+    def _scan_grounds(self, x, y, z, distance):
+        best = np.full(x.shape, -np.inf)
+        low = y - distance
+        for x0, x1, z0, z1, top in self._grounds:
+            mask = (x >= x0) & (x <= x1) & (z >= z0) & (z <= z1) & (y >= top) & (low <= top)
+            np.maximum(best, np.where(mask, top, -np.inf), out=best)
+        return best
+
+    # =============================
+    # STEP
+    # =============================
+    def step(self, move, jump, dt):
+        """move: (N, 2) world-space x/z directions (any length, 0 = idle);
+        jump: (N,) bool. Advances every agent by dt in place.
+        """
+        c = self.controller
+        pos = self.position
+        move = np.asarray(move, dtype=np.float64)
+        move_x, move_z = move[:, 0], move[:, 1]
+
+        # Walk
+        length = np.hypot(move_x, move_z)
+        moving = length > 0
+        scale = np.divide(c.speed * dt, length, out=np.zeros_like(length), where=moving)
+        pos[:, 0] += move_x * scale
+        pos[:, 2] += move_z * scale
+        self.yaw = np.where(moving, np.degrees(np.arctan2(move_x, move_z)), self.yaw)
+
+        # Gravity
+        velocity_y = np.maximum(self.velocity_y + c.gravity * dt, c.terminal)
+        dy = velocity_y * dt
+        falling = dy < 0
+
+        # Falling: sweep from the feet before moving. Rising / resting: move,
+        # then snap if close and not ascending fast.
+        feet = pos[:, 1] - c.foot_offset
+        origin = np.where(falling, feet, feet + dy) + c.skin
+        reach = np.where(falling, c.skin - dy + c.ground_snap, c.skin + c.ground_snap)
+        ground = self.ground_below(pos[:, 0], origin, pos[:, 2], reach)
+        hit = np.isfinite(ground) & (falling | (velocity_y <= 0.1))
+
+        pos[:, 1] = np.where(hit, ground + c.foot_offset, pos[:, 1] + dy)
+        velocity_y = np.where(hit & falling, 0.0, velocity_y)
+        on_ground = hit
+
+        # Jump
+        jumping = np.asarray(jump, dtype=bool) & on_ground
+        velocity_y = np.where(jumping, c.jump_speed, velocity_y)
+        on_ground &= ~jumping
+
+        # Kill plane
+        if c.kill_y is not None:
+            dead = pos[:, 1] < c.kill_y
+            if dead.any():
+                pos[dead] = self.spawn[dead]
+                velocity_y[dead] = 0.0
+
+        self.velocity_y = velocity_y
+        self.on_ground = on_ground
+
+    def write_instances(self, buffer, y_offset=0.0):
+        """Writes position/yaw into an (N, 12) float32 instancing.InstancedProps buffer."""
+        buffer[:, 0] = self.position[:, 0]
+        buffer[:, 1] = self.position[:, 1] + y_offset
+        buffer[:, 2] = self.position[:, 2]
+        buffer[:, 3] = np.radians(self.yaw)
+        return buffer
+
+
+# =============================
+# BEHAVIOUR
+# =============================
+class Wander:
+    """Cheap vectorized brain: random heading changes every `turn_interval`
+    seconds, occasional jumps, and heading back towards `home` once an agent
+    strays further than `radius` from it.
+    """
+    def __init__(self, count, home=(0, 0), radius=12, turn_interval=0.5, jump_rate=1.0, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.home = np.array(home, dtype=np.float64)
+        self.radius = radius
+        self.turn_interval = turn_interval
+        self.jump_rate = jump_rate
+        self.heading = self.rng.uniform(0, 2 * np.pi, count)
+        self.timer = self.rng.uniform(0, turn_interval, count)
+        self.move = np.column_stack([np.sin(self.heading), np.cos(self.heading)])
+
+    def __call__(self, system, dt):
+        """Returns (move, jump) for AgentSystem.step()."""
+        count = system.count
+        self.timer -= dt
+        turning = self.timer <= 0
+        if turning.any():
+            self.heading[turning] += self.rng.uniform(-1.5, 1.5, turning.sum())
+            self.timer[turning] += self.turn_interval
+            offset = system.position[:, [0, 2]] - self.home
+            away = turning & (np.einsum('ij,ij->i', offset, offset) > self.radius * self.radius)
+            self.heading[away] = np.arctan2(-offset[away, 0], -offset[away, 1])
+            self.move[:, 0] = np.sin(self.heading)
+            self.move[:, 1] = np.cos(self.heading)
+        jump = self.rng.random(count) < self.jump_rate * dt
+        return self.move, jump
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import time
+    from shapes import Box, Cylinder
+
+    # The 3x1.0.py room floor, table and columns, with walls out of the way
+    grounds = [
+        Box.from_center((0, -0.5, 0), (30, 1, 30)),
+        Box.from_center((0, 0.5, 0), (4, 1, 4)),
+    ] + [Box.from_center((sx * 12, 5, sz * 12), (1.2, 10, 1.2)) for sx in (-1, 1) for sz in (-1, 1)] \
+      + [Cylinder((8 * math.cos(i * math.pi / 2), 0, 8 * math.sin(i * math.pi / 2)), (1, 3, 1)) for i in range(4)]
+
+    # ...and the same floor with 48 crates and steps on it, in the style of
+    # the castle grounds: the ground scan costs a pass per shape
+    crowded = grounds[:1] + [Box.from_center((x, h / 2, z), (1.5, h, 1.5))
+                             for x, z, h in zip(np.tile(np.arange(-12.5, 13, 5), 8)[:48],
+                                                np.repeat(np.arange(-12.5, 13, 3.6), 6)[:48],
+                                                np.tile((.5, 1, 1.5, .75), 12))]
+
+    def run(label, shapes, count, heightmap=None, ticks=120):
+        rng = np.random.default_rng(7)
+        spawn = np.column_stack([rng.uniform(-14, 14, count), rng.uniform(0, 4, count), rng.uniform(-14, 14, count)])
+        system = AgentSystem(count, CharacterController(), spawn, shapes, heightmap=heightmap)
+        brain = Wander(count, seed=7)
+        start = time.perf_counter()
+        for tick in range(ticks):
+            move, jump = brain(system, 1 / 60)
+            system.step(move, jump, 1 / 60)
+        elapsed = (time.perf_counter() - start) / ticks
+        print(f'{label:>22} {count:>7} agents: {elapsed * 1e3:6.2f} ms/tick '
+              f'({elapsed / (1 / 60) * 100:5.1f}% of a 60 Hz frame), {system.on_ground.mean() * 100:.0f}% grounded')
+        return system.position
+
+    from heightmap import HeightMap
+    for label, shapes in (('room', grounds), ('room + 48 crates', crowded)):
+        heightmap = HeightMap.bake(shapes, bounds=True)
+        print(f'{label}: {len(shapes)} grounds, heightmap {heightmap.coverage:.0%} exact')
+        for count in (1_000, 10_000, 100_000):
+            scanned = run('ground scan', shapes, count)
+            mapped = run('heightmap', shapes, count, heightmap)
+            print(f'{"largest difference":>22}: {np.abs(scanned - mapped).max():.2e}')
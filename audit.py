@@ -0,0 +1,325 @@
+"""
+audit.py — what a level costs, without running it.
+
+- scene_stats(entities) counts Entities, Geoms, vertices, triangles, distinct
+  render states, colliders by type, predicted draw calls (one per visible Geom,
+  one per instanced Geom with rows) and estimated GPU memory (vertex and index
+  buffers plus textures, each shared buffer counted once)
+- findings(entities) flags expensive patterns: mesh colliders on primitives
+  that have a box / sphere / analytic equivalent, decorations with no collider
+  and no update() that Ursina's update loop still visits every frame (not
+  counting load_level() / freeze_static() roots, already merged; InstancedProps
+  and entities under a merged root, which freezing skips, are told to set
+  ignore=True instead), and more draw calls than render states (left unflattened)
+- `python audit.py [level ...] [--json]` builds each level twice with no main
+  loop: from the scene scripts' create_* functions (level.level_builders()) and
+  through the compiled cache (level.load_level()), and reports both side by side
+"""
+
+from ursina import *
+from ursina.collider import BoxCollider, SphereCollider, CapsuleCollider, MeshCollider
+from panda3d.core import GeomNode, GeomPrimitive, TextureAttrib, CollisionNode
+from collections import Counter
+import time as _time
+
+import colliders
+from instancing import InstancedProps
+
+
+# Ursina collider class -> report name
+_collider_kinds = {
+    BoxCollider: 'box',
+    SphereCollider: 'sphere',
+    CapsuleCollider: 'capsule',
+    MeshCollider: 'mesh',
+}
+
+# What a mesh collider on each primitive should be instead
+_cheaper_colliders = {
+    'cube': "collider='box'",
+    'sphere': "collider='sphere'",
+    'cylinder': 'colliders.use_analytic_colliders()',
+    'cone': 'colliders.use_analytic_colliders()',
+    'capsule': 'colliders.use_analytic_colliders()',
+}
+
+
+# =============================
+# HELPERS
+# =============================
+def _model_name(entity):
+    if not entity.model:
+        return None
+    name = str(entity.model.name).split('.')[0].lower()
+    return colliders.primitive_name(entity) or name
+
+
+def _geom_nodes(entities):
+    """Every GeomNode path under `entities`, each once. Keyed by the whole path:
+    Entities copying one of Ursina's models share its GeomNode as an instance.
+    """
+    seen = {}
+    for e in entities:
+        for geom_np in [e, *e.findAllMatches('**/+GeomNode')]:
+            if isinstance(geom_np.node(), GeomNode):
+                seen.setdefault(tuple(n.node().this for n in geom_np.getAncestors()), geom_np)
+    return list(seen.values())
+
+
+def _instances(geom_np, entities):
+    """How many times geom_np is drawn: its InstancedProps' row count, else 1."""
+    for e in entities:
+        if isinstance(e, InstancedProps) and (geom_np == e or e.isAncestorOf(geom_np)):
+            return e.instance_count
+    return 1
+
+
+def _collider_counts(entity):
+    """Counter of collider kinds on entity (one per instance for InstancedProps)."""
+    counts = Counter()
+    collider = entity.collider
+    if not collider:
+        return counts
+    if isinstance(entity, InstancedProps) and entity.collider_shape:
+        counts[entity.collider_shape] += len(entity.positions)
+        return counts
+    kind = _collider_kinds.get(type(collider))
+    if kind:
+        counts[kind] += 1
+    elif isinstance(collider.node(), CollisionNode):     # a bare Collider of Panda3D solids
+        for i in range(collider.node().getNumSolids()):
+            counts[type(collider.node().getSolid(i)).__name__.replace('Collision', '').lower()] += 1
+    return counts
+
+
+# =============================
+# STATS
+# =============================
+def scene_stats(entities):
+    """Counts and estimates for `entities` and everything under them (see the
+    module docstring). Memory is in bytes.
+    """
+    entities = list(entities)
+    geoms = vertices = triangles = draw_calls = 0
+    vertex_buffers, index_buffers, textures = {}, {}, {}
+    mesh_triangles = 0
+
+    geom_nps = _geom_nodes(entities)
+    for geom_np in geom_nps:
+        node = geom_np.node()
+        net = geom_np.getNetState()
+        drawn = 0 if geom_np.isHidden() else _instances(geom_np, entities)
+        for i in range(node.getNumGeoms()):
+            geom = node.getGeom(i)
+            data = geom.getVertexData()
+            geoms += 1
+            draw_calls += 1 if drawn else 0
+            rows = data.getNumRows()
+            tris = sum(geom.getPrimitive(j).decompose().getNumPrimitives() for j in range(geom.getNumPrimitives())
+                       if geom.getPrimitive(j).getPrimitiveType() == GeomPrimitive.PT_polygons)
+            vertices += rows * drawn
+            triangles += tris * drawn
+            for j in range(data.getNumArrays()):
+                array = data.getArray(j)
+                vertex_buffers[array.this] = array.getDataSizeBytes()
+            for j in range(geom.getNumPrimitives()):
+                indices = geom.getPrimitive(j).getVertices()
+                if indices:
+                    index_buffers[indices.this] = indices.getDataSizeBytes()
+            attrib = net.compose(node.getGeomState(i)).getAttrib(TextureAttrib)
+            if attrib:
+                for stage in range(attrib.getNumOnStages()):
+                    texture = attrib.getOnTexture(attrib.getOnStage(stage))
+                    textures[texture.this] = texture.estimateTextureMemory()
+    for e in entities:
+        if isinstance(e, InstancedProps):
+            textures[e.instance_texture.this] = e.instance_texture.estimateTextureMemory()
+
+    collider_counts = Counter()
+    for e in entities:
+        collider_counts += _collider_counts(e)
+        if isinstance(e.collider, MeshCollider) and e.model:
+            mesh_triangles += sum(g.getPrimitive(j).decompose().getNumPrimitives()
+                                  for n in _geom_nodes([e]) for g in n.node().getGeoms()
+                                  for j in range(g.getNumPrimitives()))
+    owned = set(id(e) for e in entities)
+    for e, shape in colliders.analytic_colliders:
+        if id(e) in owned:
+            collider_counts[f'analytic {type(shape).__name__.lower()}'] += 1
+
+    states = len({geom_np.getNetState().compose(geom_np.node().getGeomState(i))
+                  for geom_np in geom_nps if not geom_np.isHidden()
+                  for i in range(geom_np.node().getNumGeoms())})
+    return {
+        'entities': len(entities),
+        'geoms': geoms,
+        'vertices': vertices,
+        'triangles': triangles,
+        'render_states': states,
+        'draw_calls': draw_calls,
+        'colliders': dict(sorted(collider_counts.items())),
+        'mesh_collider_triangles': mesh_triangles,
+        'gpu_memory': {
+            'vertex_buffers': sum(vertex_buffers.values()),
+            'index_buffers': sum(index_buffers.values()),
+            'textures': sum(textures.values()),
+        },
+    }
+
+
+def update_loop_cost(entities, repeat=20):
+    """Seconds per frame Ursina's update loop spends just visiting `entities`
+    (the checks main.py makes before calling update()), best of `repeat`.
+    """
+    best = math.inf
+    for _ in range(repeat):
+        start = _time.perf_counter()
+        for e in entities:
+            if not e.enabled or e.ignore:
+                continue
+            if e.has_disabled_ancestor():
+                continue
+            if hasattr(e, 'update') and callable(e.update):
+                pass
+            if hasattr(e, 'scripts'):
+                for script in e.scripts:
+                    pass
+        best = min(best, _time.perf_counter() - start)
+    return best if entities else 0.0
+
+
+def _merged_static(e):
+    # A load_level() or freeze_static() root: its model already is the merged static geometry
+    return hasattr(e, 'cache_key') or hasattr(e, 'frozen')
+
+
+def _under_merged_static(e):
+    parent = e.parent
+    while isinstance(parent, Entity):
+        if _merged_static(parent):
+            return True
+        parent = parent.parent
+    return False
+
+
+def findings(entities, stats=None):
+    """Expensive patterns among `entities`, as a list of one-line strings."""
+    entities = list(entities)
+    stats = stats or scene_stats(entities)
+    found = []
+
+    mesh_on_primitive = Counter()
+    for e in entities:
+        name = _model_name(e)
+        if isinstance(e.collider, MeshCollider) and name in _cheaper_colliders:
+            mesh_on_primitive[name] += 1
+    for name, count in sorted(mesh_on_primitive.items()):
+        found.append(f'{count} mesh collider{"s" * (count != 1)} on {name} models: use {_cheaper_colliders[name]}')
+
+    decorations = [e for e in entities if e.enabled and not e.ignore and not e.collider and not _merged_static(e)
+                   and not (hasattr(e, 'update') and callable(e.update)) and not getattr(e, 'scripts', None)]
+    # freeze_static() leaves InstancedProps (LODProps levels) alone, and what
+    # hangs under a merged root goes with it: ignore=True is all that helps those
+    unfreezable = [e for e in decorations if isinstance(e, InstancedProps) or _under_merged_static(e)]
+    decorations = [e for e in decorations if e not in unfreezable]
+    if decorations:
+        cost = update_loop_cost(decorations)
+        found.append(f'{len(decorations)} decoration{"s" * (len(decorations) != 1)} with no collider or update() '
+                     f'still visited by the update loop: {cost * 1e6:.0f} us/frame '
+                     f'(freeze.freeze_static() them, or set ignore=True)')
+    if unfreezable:
+        cost = update_loop_cost(unfreezable)
+        found.append(f'{len(unfreezable)} instanced or merged-level entit{"ies" if len(unfreezable) != 1 else "y"} '
+                     f'with no update() still visited by the update loop: {cost * 1e6:.0f} us/frame (set ignore=True)')
+
+    updating = Counter(type(e).__name__ for e in entities if hasattr(e, 'update') and callable(e.update))
+    if updating:
+        found.append('update() every frame: ' + ', '.join(f'{n} x{c}' for n, c in sorted(updating.items())))
+
+    if stats['draw_calls'] > stats['render_states']:
+        found.append(f'{stats["draw_calls"]} draw calls for {stats["render_states"]} render states: '
+                     f'flattening (level.py) could merge them')
+    return found
+
+
+# =============================
+# CLI
+# =============================
+def _entities_under(root):
+    return [root] + [e for e in scene.entities if e is not root and root.isAncestorOf(e)]
+
+
+def _mb(size):
+    return f'{size / 2 ** 20:.2f} MB'
+
+
+def _rows(stats, collider_kinds):
+    yield 'entities', stats['entities']
+    yield 'geoms', stats['geoms']
+    yield 'vertices', stats['vertices']
+    yield 'triangles', stats['triangles']
+    yield 'render states', stats['render_states']
+    yield 'draw calls', stats['draw_calls']
+    for kind in collider_kinds:
+        yield f'colliders: {kind}', stats['colliders'].get(kind, 0)
+    yield 'mesh collider triangles', stats['mesh_collider_triangles']
+    for kind, size in stats['gpu_memory'].items():
+        yield f'gpu: {kind.replace("_", " ")}', _mb(size)
+    yield 'gpu: total', _mb(sum(stats['gpu_memory'].values()))
+
+
+def audit_level(name, build):
+    """{'built': report, 'compiled': report} for one level, each report being
+    scene_stats() plus its 'findings'.
+    """
+    from level import LEVEL_FOLDER, capture, load_level
+
+    report = {}
+    del colliders.analytic_colliders[:]
+    entities = capture(build)
+    report['built'] = scene_stats(entities)
+    report['built']['findings'] = findings(entities, report['built'])
+    for e in entities:
+        destroy(e)
+
+    del colliders.analytic_colliders[:]
+    root = load_level(os.path.join(LEVEL_FOLDER, name + '.json'))
+    entities = _entities_under(root)
+    report['compiled'] = scene_stats(entities)
+    report['compiled']['findings'] = findings(entities, report['compiled'])
+    destroy(root)
+    del colliders.analytic_colliders[:]
+    return report
+
+
+def print_report(name, report):
+    kinds = sorted({*report['built']['colliders'], *report['compiled']['colliders']})
+    built, compiled = dict(_rows(report['built'], kinds)), dict(_rows(report['compiled'], kinds))
+    print(f'\n{name:<32} {"built":>10} {"compiled":>10}')
+    for label in built:
+        print(f'  {label:<30} {built[label]:>10} {compiled[label]:>10}')
+    for mode in ('built', 'compiled'):
+        for line in report[mode]['findings']:
+            print(f'  [{mode}] {line}')
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import primitives
+    from level import level_builders
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('levels', nargs='*', help='level names (default: all)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    app = Ursina(window_type='none')
+    primitives.install()
+    builders = level_builders()
+    reports = {name: audit_level(name, builders[name]) for name in args.levels or builders}
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        for name, report in reports.items():
+            print_report(name, report)
@@ -0,0 +1,377 @@
+"""
+bake.py — baked static lighting for compiled levels.
+
+- bake_lighting(level, lights) lights a load_level() root's flattened static
+  geometry once with the scene's Ursina lights (ambient, point, directional)
+  and writes the result into its vertex colours; the live lights then only
+  reach dynamic entities (Mario, instanced props, streamed chunks)
+- Occlusion is traced against colliders.static_grid: a shadow ray per
+  vertex and light, plus a few short hemisphere rays for ambient occlusion.
+  Surfaces without colliders (carpets, paintings) receive light but cast no
+  shadows
+- Long triangles are lit at `max_edge` spacing and stay subdivided only where
+  the light isn't a linear blend of their corners (shadow edges, falloff):
+  every extra triangle costs draw time, unlike the per-vertex live lighting
+- Results are cached next to the level's compiled cache, keyed by the level
+  hash, the lights and the bake settings; a warm load reads one .bam
+- Run this file to compare frame times with live and baked lighting
+"""
+
+from ursina import *
+from panda3d.core import Filename, Point3, GeomVertexReader, GeomVertexWriter, GeomVertexData, GeomVertexFormat
+from panda3d.core import GeomTriangles, Geom, GeomNode, GeomVertexArrayFormat, ColorAttrib, ColorScaleAttrib
+from panda3d.core import AmbientLight as PandaAmbientLight, DirectionalLight as PandaDirectionalLight
+import hashlib
+import json
+import numpy as np
+
+import colliders
+from spatialgrid import SpatialGrid
+
+
+# Bump when the bake's output changes for the same inputs
+BAKE_VERSION = 1
+
+
+def _vertex_format(uvs):
+    # float32 colours, like the level cache's vertex data
+    array = GeomVertexArrayFormat()
+    array.addColumn('vertex', 3, Geom.NT_float32, Geom.C_point)
+    array.addColumn('color', 4, Geom.NT_float32, Geom.C_color)
+    if uvs:
+        array.addColumn('texcoord', 2, Geom.NT_float32, Geom.C_texcoord)
+    return GeomVertexFormat.registerFormat(GeomVertexFormat(array))
+
+
+VERTEX_FORMATS = {uvs: _vertex_format(uvs) for uvs in (False, True)}
+
+
+# =============================
+# LIGHTS
+# =============================
+def light_specs(lights):
+    """JSON-ready descriptions of Ursina Light entities, in world space."""
+    specs = []
+    for light in lights:
+        node = light._light
+        rgb = [round(float(c), 4) for c in tuple(light.color)[:3]]
+        if isinstance(node, PandaAmbientLight):
+            specs.append({'type': 'ambient', 'color': rgb})
+        elif isinstance(node, PandaDirectionalLight):
+            d = render.getRelativeVector(light, node.getDirection())
+            d.normalize()
+            specs.append({'type': 'directional', 'color': rgb, 'direction': [round(float(v), 4) for v in d]})
+        else:   # point lights (and spotlights, treated as points)
+            specs.append({'type': 'point', 'color': rgb,
+                          'position': [round(float(v), 4) for v in light.world_position]})
+    return specs
+
+
+def _hemisphere(count):
+    """`count` cosine-weighted directions around +y (golden-angle spiral)."""
+    i = np.arange(count) + .5
+    r = np.sqrt(i / count)
+    a = i * math.pi * (3 - math.sqrt(5))
+    return np.stack((r * np.cos(a), np.sqrt(1 - r * r), r * np.sin(a)), axis=1)
+
+
+# =============================
+# GEOMETRY
+# =============================
+def _read_column(data, name, width):
+    if not data.hasColumn(name):
+        return None
+    reader = GeomVertexReader(data, name)
+    rows = np.empty((data.getNumRows(), width), dtype=np.float64)
+    read = {2: reader.getData2, 3: reader.getData3, 4: reader.getData4}[width]
+    for i in range(len(rows)):
+        rows[i] = read()
+    return rows
+
+
+def _triangles(geom):
+    """(n, 3) vertex indices of every triangle in geom."""
+    out = []
+    for p in range(geom.getNumPrimitives()):
+        prim = geom.getPrimitive(p).decompose()
+        for k in range(prim.getNumPrimitives()):
+            start = prim.getPrimitiveStart(k)
+            out.append([prim.getVertex(start + j) for j in range(3)])
+    return np.array(out, dtype=np.int64).reshape(-1, 3)
+
+
+def _subdivide(corners, max_edge):
+    """Barycentric weights (m, 3) and sub-triangles (k, 3) splitting a triangle
+    with these corner positions into n^2 pieces, n = ceil(longest edge / max_edge).
+    Edges shared by two triangles of the same n split at the same points.
+    """
+    longest = max(np.linalg.norm(corners[a] - corners[b]) for a, b in ((0, 1), (1, 2), (2, 0)))
+    n = max(1, int(math.ceil(longest / max_edge - 1e-6)))
+    weights, index = [], {}
+    for i in range(n + 1):
+        for j in range(n + 1 - i):
+            index[i, j] = len(weights)
+            weights.append(((n - i - j) / n, i / n, j / n))
+    triangles = []
+    for i in range(n):
+        for j in range(n - i):
+            triangles.append((index[i, j], index[i + 1, j], index[i, j + 1]))
+            if i + j < n - 1:
+                triangles.append((index[i + 1, j], index[i + 1, j + 1], index[i, j + 1]))
+    return np.array(weights), np.array(triangles, dtype=np.int64)
+
+
+# =============================
+# BAKE
+# =============================
+class LightBaker:
+    """Computes lit vertex colours against `grid` (a SpatialGrid of static shapes)."""
+    def __init__(self, specs, grid, ao_rays=12, ao_distance=2.0, ao_strength=.8, bias=.02):
+        self.specs = specs
+        self.grid = grid
+        self.ao_directions = _hemisphere(ao_rays) if ao_rays else np.zeros((0, 3))
+        self.ao_distance = ao_distance
+        self.ao_strength = ao_strength
+        self.bias = bias
+        self.rays = 0
+
+    def _inside(self, x, y, z):
+        """Shapes whose bounds hold the point: rays starting in them ignore them."""
+        cs = self.grid.cell_size
+        found = []
+        for shape in list(self.grid.cells.get((math.floor(x / cs), math.floor(z / cs)), ())) + self.grid.large:
+            lo, hi = shape.min, shape.max
+            if lo[0] < x < hi[0] and lo[1] < y < hi[1] and lo[2] < z < hi[2]:
+                found.append(shape)
+        return found
+
+    def _blocked(self, origin, direction, distance, ignore):
+        self.rays += 1
+        return self.grid.raycast(origin[0], origin[1], origin[2], direction[0], direction[1], direction[2],
+                                 distance, ignore=ignore) is not None
+
+    def light(self, position, normal):
+        """RGB light arriving at a surface point (before the surface colour)."""
+        origin = position + normal * self.bias
+        ignore = self._inside(*origin)
+        total = np.zeros(3)
+        for spec in self.specs:
+            rgb = np.array(spec['color'])
+            if spec['type'] == 'ambient':
+                total += rgb * self.occlusion(origin, normal, ignore)
+                continue
+            if spec['type'] == 'directional':
+                to_light = -np.array(spec['direction'])
+                distance = 1000.0
+            else:
+                to_light = np.array(spec['position']) - origin
+                distance = float(np.linalg.norm(to_light))
+                if distance < 1e-6:
+                    continue
+                to_light /= distance
+            facing = float(np.dot(normal, to_light))
+            if facing > 0 and not self._blocked(origin, to_light, distance, ignore):
+                total += rgb * facing
+        return total
+
+    def occlusion(self, origin, normal, ignore):
+        """1 for open sky, down to 1 - ao_strength when every short ray hits."""
+        if not len(self.ao_directions):
+            return 1.0
+        # Basis around the normal
+        helper = np.array((1.0, 0, 0)) if abs(normal[0]) < .9 else np.array((0, 0, 1.0))
+        tangent = np.cross(normal, helper)
+        tangent /= np.linalg.norm(tangent)
+        bitangent = np.cross(normal, tangent)
+        hits = 0
+        for dx, dy, dz in self.ao_directions:
+            d = tangent * dx + normal * dy + bitangent * dz
+            hits += self._blocked(origin, d, self.ao_distance, ignore)
+        return 1 - self.ao_strength * hits / len(self.ao_directions)
+
+
+def _base_colors(state, colors, count):
+    """Surface colours: vertex colours (or the state's flat colour) times any colour scale."""
+    base = np.ones((count, 4))
+    attrib = state.getAttrib(ColorAttrib)
+    if attrib and attrib.getColorType() == ColorAttrib.T_flat:
+        base[:] = tuple(attrib.getColor())
+    elif colors is not None and not (attrib and attrib.getColorType() == ColorAttrib.T_off):
+        base = colors.copy()
+    scale = state.getAttrib(ColorScaleAttrib)
+    if scale and scale.hasScale():
+        base *= tuple(scale.getScale())
+    return base
+
+
+def bake_node(model, baker, max_edge=8.0, tolerance=.02):
+    """Baked copy of `model` (a flattened static NodePath): unlit, vertex-coloured,
+    one Geom per source Geom with the same render state otherwise. Triangles are
+    lit at max_edge spacing and keep that subdivision only where the light
+    differs from a linear blend of their corners by more than `tolerance`.
+    """
+    out = NodePath('baked')
+    cache = {}
+    for geom_np in model.findAllMatches('**/+GeomNode'):
+        node = geom_np.node()
+        matrix = geom_np.getMat(render)
+        baked = GeomNode(node.getName())
+        for g in range(node.getNumGeoms()):
+            geom, state = node.getGeom(g), node.getGeomState(g)
+            data = geom.getVertexData()
+            positions = _read_column(data, 'vertex', 3)
+            normals = _read_column(data, 'normal', 3)
+            colors = _read_column(data, 'color', 4)
+            uvs = _read_column(data, 'texcoord', 2)
+            if positions is None:
+                continue
+            positions = np.array([tuple(matrix.xformPoint(Point3(*p))) for p in positions])
+            if normals is not None:
+                normals = np.array([tuple(matrix.xformVec(Vec3(*n))) for n in normals])
+            base = _base_colors(state, colors, len(positions))
+
+            vdata = GeomVertexData(node.getName(), VERTEX_FORMATS[uvs is not None], Geom.UH_static)
+            vertex, color_out = GeomVertexWriter(vdata, 'vertex'), GeomVertexWriter(vdata, 'color')
+            texcoord = GeomVertexWriter(vdata, 'texcoord') if uvs is not None else None
+            triangles = GeomTriangles(Geom.UH_static)
+            triangles.setIndexType(Geom.NT_uint32)
+            rows = {}       # (position, normal, colour, uv) -> row, so neighbouring triangles share vertices
+            for tri in _triangles(geom):
+                corners = positions[tri]
+                face = np.cross(corners[1] - corners[0], corners[2] - corners[0])
+                if np.linalg.norm(face) < 1e-12:
+                    continue
+                face /= np.linalg.norm(face)
+                weights, pieces = _subdivide(corners, max_edge)
+                samples = []
+                for w in weights:
+                    p = w @ corners
+                    n = w @ normals[tri] if normals is not None else face
+                    length = np.linalg.norm(n)
+                    n = n / length if length > 1e-9 else face
+                    key = tuple(np.round(p, 4)) + tuple(np.round(n, 3))
+                    if key not in cache:
+                        cache[key] = np.clip(baker.light(p, n), 0, 1)
+                    samples.append((w, p, key))
+                # Keep the pieces only where the light isn't already linear across
+                # the triangle (shadow edges, falloff): extra triangles cost draw time
+                lit = np.array([cache[key] for w, p, key in samples])
+                corner_rows = [int(np.argmax(weights[:, k])) for k in range(3)]
+                if np.abs(weights @ lit[corner_rows] - lit).max() <= tolerance:
+                    samples = [samples[i] for i in corner_rows]
+                    pieces = [(0, 1, 2)]
+                index = []
+                for w, p, key in samples:
+                    light = cache[key]
+                    c = w @ base[tri]
+                    c = (c[0] * light[0], c[1] * light[1], c[2] * light[2], c[3])
+                    uv = tuple(w @ uvs[tri]) if texcoord else ()
+                    row_key = key + tuple(np.round(c, 3)) + tuple(np.round(uv, 4))
+                    if row_key not in rows:
+                        rows[row_key] = len(rows)
+                        vertex.addData3(*p)
+                        color_out.addData4(*c)
+                        if texcoord:
+                            texcoord.addData2(*uv)
+                    index.append(rows[row_key])
+                for a, b, c in pieces:
+                    triangles.addVertices(index[a], index[b], index[c])
+            if not rows:
+                continue
+            new_geom = Geom(vdata)
+            new_geom.addPrimitive(triangles)
+            new_state = state.removeAttrib(ColorScaleAttrib).setAttrib(ColorAttrib.makeVertex())
+            baked.addGeom(new_geom, new_state)
+        if baked.getNumGeoms():
+            out.attachNewNode(baked)
+    out.flattenStrong()
+    return out
+
+
+def bake_key(level, specs, settings):
+    source = json.dumps({'level': level.cache_key, 'lights': specs, 'settings': settings,
+                         'version': BAKE_VERSION}, sort_keys=True).encode()
+    return hashlib.sha1(source).hexdigest()[:16]
+
+
+def bake_lighting(level, lights, max_edge=8.0, tolerance=.02, ao_rays=12, ao_distance=2.0, ao_strength=.8,
+                  verbose=False):
+    """Replaces `level`'s static geometry (a load_level() root's model) with a
+    copy whose vertex colours hold `lights`, and turns live lighting off on it.
+    Call after build_static_grid(). Returns True when the bake came from cache;
+    level.bake_time is in seconds (verbose prints it).
+    """
+    start = time.perf_counter()
+    specs = light_specs(lights)
+    settings = {'max_edge': max_edge, 'tolerance': tolerance, 'ao_rays': ao_rays, 'ao_distance': ao_distance, 'ao_strength': ao_strength}
+    path = os.path.join(level.cache_folder, bake_key(level, specs, settings) + '.lit.bam')
+
+    cache_hit = os.path.isfile(path)
+    if cache_hit:
+        baked = loader.loadModel(Filename.fromOsSpecific(path))
+    else:
+        grid = colliders.static_grid
+        if not grid:
+            grid = SpatialGrid(shape for entity, shape in colliders.analytic_colliders)
+        baker = LightBaker(specs, grid, ao_rays=ao_rays, ao_distance=ao_distance, ao_strength=ao_strength)
+        baked = bake_node(level.model, baker, max_edge, tolerance)
+        baked.writeBamFile(Filename.fromOsSpecific(path))
+        if verbose:
+            print(f'baked {level.name}: {baker.rays} rays', end=', ')
+
+    level.model = baked
+    level.model.setLightOff(1)
+    level.bake_time = time.perf_counter() - start
+    if verbose:
+        print(f'lighting {level.name}: {"cached" if cache_hit else "baked"} in {level.bake_time * 1000:.1f} ms')
+    return cache_hit
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import sys
+    import time as _time
+    from panda3d.core import loadPrcFileData
+    from level import load_level, LEVEL_FOLDER
+
+    # Offscreen through EGL (Mesa runs it in software when there's no GPU);
+    # `tiny` uses Panda3D's own software rasterizer instead
+    display = 'p3tinydisplay' if 'tiny' in sys.argv[1:] else 'p3headlessgl\naux-display p3tinydisplay'
+    loadPrcFileData('bake', f'load-display {display}\nsync-video false\ngl-finish true')
+    app = Ursina(window_type='offscreen', size=(960, 540), development_mode=False)
+    name = next((a for a in sys.argv[1:] if a != 'tiny' and not a.startswith('-')), 'indoor_hall')
+
+    level = load_level(os.path.join(LEVEL_FOLDER, name + '.json'))
+    colliders.build_static_grid()
+    if name == 'peach_castle':
+        sun = DirectionalLight()
+        sun.look_at(Vec3(1, -1, -1))
+        lights = [sun]
+        eye, target = (30, 15, -40), (0, 5, 0)
+    else:
+        lights = [PointLight(position=(0, 6, -2), color=color.white), AmbientLight(color=color.rgba(200, 200, 200, 0.5))]
+        eye, target = (-12, 6, -12), (4, 1, 6)
+    Entity(model='cube', color=color.blue, scale=(1, 2, 1), origin_y=-1, position=(2, 0, 2))    # stands in for Mario
+    camera.position = eye
+    camera.look_at(Vec3(*target))
+
+    def run(label, frames=200):
+        times = []
+        for frame in range(-10, frames):
+            start = _time.perf_counter()
+            app.step()
+            if frame >= 0:
+                times.append((_time.perf_counter() - start) * 1000)
+        times.sort()
+        vertices = sum(g.getVertexData().getNumRows() for n in level.model.findAllMatches('**/+GeomNode')
+                       for g in n.node().getGeoms())
+        print(f'{label:>6}: mean {sum(times) / len(times):6.2f} ms, p99 {times[int(len(times) * .99)]:6.2f} ms, '
+              f'{vertices} static vertices')
+        if '--shots' in sys.argv:
+            app.win.saveScreenshot(Filename.fromOsSpecific(f'bake_{name}_{label}.png'))
+
+    run('live')
+    bake_lighting(level, lights, verbose=True)
+    run('baked')
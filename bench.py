@@ -0,0 +1,257 @@
+"""
+bench.py — headless frame-time benchmark for every scene script.
+
+- Each scene runs in its own process: its main() is called with Ursina swapped
+  for an offscreen window on Panda3D's software renderer (p3tinydisplay), so it
+  needs no GPU or display
+- A scripted input track is written into held_keys every frame and dt is fixed,
+  so two runs of the same commit simulate the same path; --inputs replays a
+  session recorded with replay.py instead (its keys and dt, looped)
+- Reports frame time (mean, p50, p95, p99), Python time spent in the update
+  task (every Entity.update()), scene-graph node count, draw calls and Mario's
+  ground probes (sent to the world / answered by character.GroundCache or
+  heightmap.HeightMapWorld) as JSON
+- For the Mario scenes also input latency (from a change of the held keys to
+  the end of the first frame drawn from a physics step that saw it) and the
+  wall-clock spacing of physics steps; --physics-thread sets the scene's
+  PHYSICS_THREAD toggle to compare stepping on a simthread.SimulationThread
+
+    python bench.py                          # all scenes, 600 frames
+    python bench.py 3x1.0.py --frames 2000 --out bench.json
+    python bench.py 3x1.0.py --inputs hall.inputs
+    python bench.py 3x1.0.py --physics-thread
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time as _time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCENES = ('3x1.0.py', 'floor0a.py', 'physcis4k.py', '9xv0.py', 'render9xv1.a.py')
+
+# (first frame, last frame, keys held) over one INPUT_PERIOD-frame loop
+INPUT_SCRIPT = (
+    (0, 90, 'w'),
+    (90, 150, 'w d'),
+    (120, 126, 'space'),
+    (150, 210, 'a'),
+    (210, 270, 's a'),
+    (240, 246, 'space'),
+    (270, 300, ''),
+)
+INPUT_PERIOD = 300
+INPUT_KEYS = ('w', 'a', 's', 'd', 'space')
+
+
+def scripted_keys(frame):
+    """Keys held on `frame` of the input track."""
+    frame %= INPUT_PERIOD
+    held = set()
+    for first, last, keys in INPUT_SCRIPT:
+        if first <= frame < last:
+            held.update(keys.split())
+    return held
+
+
+def percentile(sorted_values, p):
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(samples_ms):
+    ordered = sorted(samples_ms)
+    return {
+        'mean': sum(ordered) / len(ordered) if ordered else 0.0,
+        'p50': percentile(ordered, 50),
+        'p95': percentile(ordered, 95),
+        'p99': percentile(ordered, 99),
+        'max': ordered[-1] if ordered else 0.0,
+    }
+
+
+# =============================
+# CHILD: one scene in this process
+# =============================
+def run_scene(script, frames, warmup, size, dt, inputs=None, physics_thread=False):
+    from panda3d.core import loadPrcFileData, SceneGraphAnalyzer
+    loadPrcFileData('bench', 'load-display p3tinydisplay\naudio-library-name null\nsync-video false')
+    import ursina
+    from ursina import application, held_keys, scene, camera
+
+    result = {'scene': script, 'frames': frames, 'warmup': warmup, 'size': list(size), 'dt': dt}
+    frame_ms, update_ms = [], []
+    latency_ms, step_times = [], []
+    player = [None]     # the Entity with a physics clock (Mario), once found
+    log = None
+    if inputs:
+        from replay import InputLog
+        log = InputLog.load(inputs)
+        result['inputs'] = os.path.basename(inputs)
+
+    def bench_ursina(**kwargs):
+        """Stands in for Ursina(): an offscreen app whose run() drives the scripted benchmark."""
+        kwargs.update(window_type='offscreen', size=size, development_mode=False, vsync=False)
+        app = ursina.Ursina(**kwargs)
+        application.calculate_dt = False
+        update = app._update
+        frame = [0]
+
+        def timed_update(task):
+            ursina.time.dt = ursina.time.dt_unscaled = log.frames[frame[0] % len(log)][0] if log else dt
+            start = _time.perf_counter()
+            steps = player[0].clock.steps if player[0] else 0
+            status = update(task)
+            if frame[0] >= warmup:
+                update_ms.append((_time.perf_counter() - start) * 1000)
+                if player[0] and not player[0].sim:      # inline steps all run now, back to back
+                    step_times.extend([start] * (player[0].clock.steps - steps))
+            return status
+
+        def run(info=False):
+            result['startup_ms'] = (_time.perf_counter() - started) * 1000
+            player[0] = next((e for e in scene.entities if hasattr(e, 'clock') and hasattr(e, 'sim')), None)
+            keys, changed, measured = None, None, None
+            for frame[0] in range(warmup + frames):
+                if log:
+                    log.apply(log.frames[frame[0] % len(log)][1], held_keys)
+                else:
+                    held = scripted_keys(frame[0])
+                    for key in INPUT_KEYS:
+                        held_keys[key] = 1 if key in held else 0
+                start = _time.perf_counter()
+                if frame[0] == warmup:
+                    measured = start
+                if player[0] and frame[0] >= warmup and tuple(held_keys[k] for k in INPUT_KEYS) != keys:
+                    keys = tuple(held_keys[k] for k in INPUT_KEYS)
+                    changed = start, player[0].clock.steps
+                app.step()
+                end = _time.perf_counter()
+                if frame[0] >= warmup:
+                    frame_ms.append((end - start) * 1000)
+                if changed and (player[0].sim.shown >= changed[0] if player[0].sim
+                                else player[0].clock.steps > changed[1]):
+                    latency_ms.append((end - changed[0]) * 1000)
+                    changed = None
+            if player[0] and player[0].sim:
+                step_times.extend(t for t in player[0].sim.ticks if t >= measured)
+                player[0].sim_thread.stop()
+
+            result['nodes'] = scene.countNumDescendants() + camera.ui.countNumDescendants()
+            result['entities'] = len(scene.entities)
+            draws = 0
+            for region in app.win.getActiveDisplayRegions():
+                culled = region.makeCullResultGraph()
+                if culled:
+                    analyzer = SceneGraphAnalyzer()
+                    analyzer.addNode(culled)
+                    draws += analyzer.getNumGeoms()
+            result['draw_calls'] = draws
+            caches = [e.world for e in scene.entities if hasattr(getattr(e, 'world', None), 'answered')]
+            if caches:      # probes that reached the world / were answered by a wrapper (heightmap, ground cache)
+                result['ground_queries'] = result['ground_cached'] = 0
+                for world in caches:
+                    while hasattr(world.world, 'answered'):
+                        result['ground_cached'] += world.answered
+                        world = world.world
+                    result['ground_queries'] += world.queries
+                    result['ground_cached'] += world.answered
+
+        if physics_thread and hasattr(module, 'PHYSICS_THREAD'):
+            module.PHYSICS_THREAD = True
+        app.taskMgr.remove(app._update_task)
+        app._update_task = app.taskMgr.add(timed_update, 'update')
+        app.run = run
+        return app
+
+    sys.path.insert(0, HERE)
+    spec = importlib.util.spec_from_file_location('bench_scene', os.path.join(HERE, script))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.Ursina = bench_ursina
+
+    started = _time.perf_counter()
+    module.main()
+    result['frame_ms'] = summarize(frame_ms)
+    result['update_ms'] = summarize(update_ms)
+    if latency_ms:
+        result['physics_thread'] = physics_thread
+        result['input_latency_ms'] = summarize(latency_ms)
+        gaps = [(b - a) * 1000 for a, b in zip(step_times, step_times[1:])]
+        mean = sum(gaps) / len(gaps) if gaps else 0.0
+        result['step_spacing_ms'] = summarize(gaps)
+        result['step_spacing_ms']['sd'] = (sum((g - mean) ** 2 for g in gaps) / max(1, len(gaps))) ** .5
+    return result
+
+
+# =============================
+# PARENT: every scene in a fresh process
+# =============================
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('scenes', nargs='*', default=SCENES, help='scene scripts (default: all)')
+    parser.add_argument('--frames', type=int, default=600, help='measured frames per scene')
+    parser.add_argument('--warmup', type=int, default=60, help='unmeasured frames before timing')
+    parser.add_argument('--size', default='640x360', help='offscreen buffer size, WxH')
+    parser.add_argument('--dt', type=float, default=1 / 60, help='fixed simulation dt per frame')
+    parser.add_argument('--inputs', help='replay this recorded session (replay.py) instead of the scripted track')
+    parser.add_argument('--physics-thread', action='store_true',
+                        help="step Mario on a physics thread (the scene's PHYSICS_THREAD toggle)")
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.split('x'))
+
+    if args.child:
+        result = run_scene(args.scenes[0], args.frames, args.warmup, size, args.dt, args.inputs, args.physics_thread)
+        print('RESULT ' + json.dumps(result))
+        return
+
+    report = {'revision': git_revision(), 'python': sys.version.split()[0], 'scenes': {}}
+    for script in args.scenes:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), script, '--child',
+                              '--frames', str(args.frames), '--warmup', str(args.warmup),
+                              '--size', args.size, '--dt', str(args.dt)]
+                             + (['--inputs', os.path.abspath(args.inputs)] if args.inputs else [])
+                             + (['--physics-thread'] if args.physics_thread else []),
+                             cwd=HERE, capture_output=True, text=True)
+        line = next((l for l in out.stdout.splitlines() if l.startswith('RESULT ')), None)
+        if line is None:
+            report['scenes'][script] = {'error': (out.stderr.strip().splitlines() or ['no result'])[-1]}
+        else:
+            report['scenes'][script] = json.loads(line[len('RESULT '):])
+        stats = report['scenes'][script]
+        if 'frame_ms' in stats:
+            print(f'{script:>16}: mean {stats["frame_ms"]["mean"]:.2f} ms, p99 {stats["frame_ms"]["p99"]:.2f} ms, '
+                  f'{stats["draw_calls"]} draw calls' + (f', input latency {stats["input_latency_ms"]["mean"]:.1f} ms, '
+                  f'step spacing sd {stats["step_spacing_ms"]["sd"]:.2f} ms' if 'input_latency_ms' in stats else ''),
+                  file=sys.stderr)
+        else:
+            print(f'{script:>16}: {stats["error"]}', file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
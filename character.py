@@ -0,0 +1,345 @@
+"""
+character.py — headless kinematic character controller (no Ursina import).
+
+The Mario controllers in 3x1.0.py, floor0a.py and physcis4k.py are thin
+adapters over CharacterController.step(): they turn held_keys into a world
+space move vector and hand over time.dt and a collision-query object.
+
+- Walk with swept move-and-slide against walls (any step length, several
+  contact planes per step), gravity with terminal velocity, swept ground
+  probe + ground snap
+- Jump, optional kill plane with respawn
+- Carries the vertical velocity of the surface it lands on
+- interpolate() blends two fixed-step states for rendering (see fixedstep.py)
+
+A world is anything with
+    probe_down(x, y, z, distance) -> (hit_y, surface, surface_velocity_y) or None
+    sweep_box(x, z, y0, y1, radius, dx, dz) -> (fraction, (nx, nz), surface) or None
+StaticWorld answers those from a list of shapes.py shapes. GroundCache wraps a
+world that also offers ground_patch() / patch_valid() (spatialgrid.SpatialGrid,
+colliders.RaycastWorld) and answers ground probes from the last contact's flat
+patch while the character stays over it. Run this file to measure headless
+steps per second.
+"""
+
+import math
+
+from fixedstep import lerp, lerp_angle
+
+
+# =============================
+# STATE
+# =============================
+class CharacterState:
+    """Feet position (x, y, z), vertical velocity, grounded flag and facing (degrees)."""
+    __slots__ = ('x', 'y', 'z', 'velocity_y', 'on_ground', 'yaw', 'ground', 'teleported')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0, velocity_y=0.0, on_ground=False, yaw=0.0, ground=None, teleported=False):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.velocity_y = velocity_y
+        self.on_ground = on_ground
+        self.yaw = yaw
+        self.ground = ground            # surface stood on, as returned by the world
+        self.teleported = teleported    # respawned this step: don't interpolate into it
+
+    def copy(self):
+        return CharacterState(self.x, self.y, self.z, self.velocity_y, self.on_ground, self.yaw, self.ground, self.teleported)
+
+    def __repr__(self):
+        return (f'CharacterState(x={self.x:.3f}, y={self.y:.3f}, z={self.z:.3f}, '
+                f'velocity_y={self.velocity_y:.3f}, on_ground={self.on_ground})')
+
+
+# =============================
+# CONTROLLER
+# =============================
+class CharacterController:
+    """Movement tuning plus the step function. Defaults are 3x1.0.py's Mario.
+    Ground probes start `skin` above the feet and reach `ground_snap` below them
+    (plus this step's fall). foot_offset is the height of the reported y above
+    the feet (0 for a pivot at the feet). kill_y=None disables the kill plane.
+    With a `radius`, walking is swept as a square body (half-width radius,
+    `height` tall) that slides along what it hits; anything lower than `skin`
+    above the feet is left to the ground probe, so it is stepped onto.
+    """
+    def __init__(self, speed=6, jump_speed=10, gravity=-25, terminal=-20, ground_snap=0.25, skin=0.05,
+                 kill_y=-20, spawn_point=(0, 0, 0), foot_offset=0, radius=None, height=2,
+                 contact_offset=1e-3, max_slides=4):
+        self.speed = speed
+        self.jump_speed = jump_speed
+        self.gravity = gravity
+        self.terminal = terminal
+        self.ground_snap = ground_snap
+        self.skin = skin
+        self.kill_y = kill_y
+        self.spawn_point = tuple(spawn_point)
+        self.foot_offset = foot_offset
+        self.radius = radius
+        self.height = height
+        self.contact_offset = contact_offset    # gap kept from walls
+        self.max_slides = max_slides            # contact planes handled per step
+
+    def slide(self, x, y, z, dx, dz, world):
+        """Moves the body by (dx, dz) from feet height y, stopping at the first
+        wall and sliding the rest of the move along it; a move pushed back into
+        an earlier wall (a corner) stops. Returns the new (x, z).
+        """
+        y0, y1 = y + self.skin, y + self.height
+        radius = self.radius
+        normals = []
+        for _ in range(self.max_slides):
+            length = math.sqrt(dx * dx + dz * dz)
+            if length < 1e-9:
+                break
+            hit = world.sweep_box(x, z, y0, y1, radius, dx, dz)
+            if hit is None:
+                return x + dx, z + dz
+            nx, nz = hit[1]
+            advance = hit[0] - self.contact_offset / length
+            if advance < 0:
+                advance = 0.0
+            x += dx * advance
+            z += dz * advance
+            # What is left of the move, minus its part into the wall
+            dx *= 1 - advance
+            dz *= 1 - advance
+            into = dx * nx + dz * nz
+            dx -= into * nx
+            dz -= into * nz
+            for px, pz in normals:
+                if dx * px + dz * pz < -1e-9:
+                    return x, z
+            normals.append((nx, nz))
+        return x, z
+
+    def step(self, state, move_x, move_z, jump, dt, world):
+        """Advances `state` by dt and returns the new CharacterState.
+        move_x / move_z is the desired world-space direction (any length; 0 = idle).
+        """
+        x, y, z = state.x, state.y, state.z
+        yaw = state.yaw
+
+        # Walk
+        length = math.sqrt(move_x * move_x + move_z * move_z)
+        if length > 0:
+            step = self.speed * dt / length
+            if self.radius is None:
+                x += move_x * step
+                z += move_z * step
+            else:
+                x, z = self.slide(x, y - self.foot_offset, z, move_x * step, move_z * step, world)
+            yaw = math.degrees(math.atan2(move_x, move_z))
+
+        # Gravity
+        velocity_y = state.velocity_y + self.gravity * dt
+        if velocity_y < self.terminal:
+            velocity_y = self.terminal
+
+        # Pre-move downward sweep to prevent tunneling
+        feet = y - self.foot_offset
+        dy = velocity_y * dt
+        ground = None
+        if dy < 0:
+            hit = world.probe_down(x, feet + self.skin, z, self.skin - dy + self.ground_snap)
+            if hit is not None:
+                # Land on ground, riding upwards with a rising surface
+                y = hit[0] + self.foot_offset
+                velocity_y = hit[2] if hit[2] > 0 else 0.0
+                ground = hit[1]
+            else:
+                y += dy
+        else:
+            # Moving up or stationary: apply move, then snap if very close
+            y += dy
+            if velocity_y <= 0.1:
+                hit = world.probe_down(x, y - self.foot_offset + self.skin, z, self.skin + self.ground_snap)
+                if hit is not None:
+                    y = hit[0] + self.foot_offset
+                    ground = hit[1]
+        on_ground = ground is not None
+
+        # Jump
+        if jump and on_ground:
+            velocity_y = self.jump_speed
+            on_ground = False
+            ground = None
+
+        # Kill plane
+        teleported = False
+        if self.kill_y is not None and y < self.kill_y:
+            x, y, z = self.spawn_point
+            velocity_y = 0.0
+            teleported = True
+
+        return CharacterState(x, y, z, velocity_y, on_ground, yaw, ground, teleported)
+
+
+def interpolate(previous, current, alpha):
+    """Render transform (x, y, z, yaw) between two fixed-step states."""
+    if current.teleported:
+        return current.x, current.y, current.z, current.yaw
+    return (lerp(previous.x, current.x, alpha),
+            lerp(previous.y, current.y, alpha),
+            lerp(previous.z, current.z, alpha),
+            lerp_angle(previous.yaw, current.yaw, alpha))
+
+
+# =============================
+# GROUND CACHE
+# =============================
+class GroundCache:
+    """World wrapper remembering the last ground contact: the flat top it was
+    on and the rectangle of it where nothing else can be hit first (see
+    SpatialGrid.ground_patch()). Probes from inside that rectangle, between
+    the top and whatever hangs over it, are answered without a query: the same
+    hit within reach, else nothing. Walking off the rectangle, rising above
+    its ceiling (jumps) or the world changing under it (patch_valid(), e.g. a
+    platform moved) sends the probe to the world again. A world without
+    ground_patch() is passed every probe. One per character.
+    """
+    def __init__(self, world):
+        self.world = world
+        self.patch = None
+        self.hit = None
+        self.queries = 0        # probes passed to the world
+        self.answered = 0       # probes answered from the patch
+
+    def probe_down(self, x, y, z, distance):
+        patch = self.patch
+        if (patch is not None and patch[0] <= x < patch[2] and patch[1] <= z < patch[3]
+                and patch[4] <= y <= patch[5] and self.world.patch_valid(patch)):
+            self.answered += 1
+            return self.hit if y - patch[4] <= distance else None
+        self.queries += 1
+        hit = self.world.probe_down(x, y, z, distance)
+        if hit is not None and hasattr(self.world, 'ground_patch'):
+            self.patch = self.world.ground_patch(x, z, hit[0])
+            self.hit = hit
+        return hit
+
+    def sweep_box(self, x, z, y0, y1, radius, dx, dz):
+        return self.world.sweep_box(x, z, y0, y1, radius, dx, dz)
+
+    def invalidate(self):
+        self.patch = None
+
+
+# =============================
+# HEADLESS WORLD
+# =============================
+class StaticWorld:
+    """Collision queries against a fixed list of shapes.py shapes (linear scan)."""
+    def __init__(self, shapes=()):
+        self.shapes = list(shapes)
+
+    def add(self, shape):
+        self.shapes.append(shape)
+        return shape
+
+    def probe_down(self, x, y, z, distance):
+        best = None
+        best_t = distance
+        for shape in self.shapes:
+            lo, hi = shape.min, shape.max
+            if not (lo[0] <= x <= hi[0] and lo[2] <= z <= hi[2]) or lo[1] > y or hi[1] < y - best_t:
+                continue
+            hit = shape.raycast(x, y, z, 0, -1, 0, best_t)
+            if hit is not None:
+                best_t = hit[0]
+                best = shape
+        if best is None:
+            return None
+        return y - best_t, best, getattr(best, 'velocity_y', 0.0)
+
+    def sweep_box(self, x, z, y0, y1, radius, dx, dz):
+        best = None
+        for shape in self.shapes:
+            hit = shape.sweep_box(x, z, y0, y1, radius, dx, dz)
+            if hit is not None and (best is None or hit[0] < best[0]):
+                best = hit[0], hit[1], shape
+        return best
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import time
+    from shapes import Box, Cylinder
+
+    # The 3x1.0.py room: slab, ceiling, walls, pillars, table and columns
+    room = StaticWorld([
+        Box.from_center((0, -0.5, 0), (30, 1, 30)),
+        Box.from_center((0, 10, 0), (30, 1, 30)),
+        Box.from_center((0, 5, 15), (30, 10, 1)), Box.from_center((0, 5, -15), (30, 10, 1)),
+        Box.from_center((15, 5, 0), (1, 10, 30)), Box.from_center((-15, 5, 0), (1, 10, 30)),
+        Box.from_center((0, 0.5, 0), (4, 1, 4)),
+    ] + [Box.from_center((sx * 12, 5, sz * 12), (1.2, 10, 1.2)) for sx in (-1, 1) for sz in (-1, 1)]
+      + [Cylinder((8 * math.cos(i * math.pi / 2), 0, 8 * math.sin(i * math.pi / 2)), (1, 3, 1)) for i in range(4)])
+
+    from spatialgrid import SpatialGrid
+    grid = SpatialGrid(room.shapes)
+    solid = [s for s in room.shapes if s.max[1] > .05 and s.min[1] < 2]   # walls, pillars, table, columns
+
+    def misplaced(state):
+        # Body (half-width .5) through the outer walls, or overlapping a wall /
+        # pillar / table / column by more than the contact gap
+        if abs(state.x) > 14.5 or abs(state.z) > 14.5:
+            return True
+        return any(s.min[0] - .49 < state.x < s.max[0] + .49 and s.min[2] - .49 < state.z < s.max[2] + .49
+                   and s.max[1] > state.y + .05 for s in solid)
+
+    def run(label, world, radius=None, speed=6, dt=1 / 60, steps=200_000, repeat=3):
+        # Fastest of `repeat` identical runs (as timeit does): a shared machine
+        # only ever adds time
+        controller = CharacterController(speed=speed, spawn_point=(0, 2, 0), radius=radius)
+        turn = max(1, int(2 / dt))      # change direction every 2 s
+        elapsed = math.inf
+        for _ in range(repeat):
+            state = CharacterState(6, 2, 6)
+            states = []
+            start = time.perf_counter()
+            for i in range(steps):
+                phase = (i // turn) % 4
+                state = controller.step(state, (0, 1, 0, -1)[phase] + .3, (1, 0, -1, 0)[phase], i % 90 == 0, dt, world)
+                states.append(state)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        bad = sum(misplaced(s) for s in states[::16])
+        print(f'{label:>37}: {steps / elapsed:9,.0f} steps/s ({elapsed / steps * 1e6:5.2f} us/step), '
+              f'{bad / len(states[::16]):6.1%} of sampled steps in or through a wall')
+
+    class GridOnly:
+        # The grid without ground_patch(): every probe is a query
+        probe_down = staticmethod(grid.probe_down)
+        sweep_box = staticmethod(grid.sweep_box)
+
+    def probes(label, cached, steps=60 * 120, dt=1 / 60):
+        # Two minutes of walking the room, jumping every 1.5 s: world queries
+        # per simulated second, and the largest difference from the uncached path
+        controller = CharacterController(spawn_point=(0, 2, 0), radius=.5)
+        world = GroundCache(grid if cached else GridOnly())
+        state = CharacterState(6, 2, 6)
+        trail = []
+        start = time.perf_counter()
+        for i in range(steps):
+            phase = (i // 120) % 4
+            state = controller.step(state, (0, 1, 0, -1)[phase] + .3, (1, 0, -1, 0)[phase], i % 90 == 0, dt, world)
+            trail.append((state.x, state.y, state.z))
+        elapsed = time.perf_counter() - start
+        print(f'{label:>37}: {world.queries / (steps * dt):6.1f} ground queries/s, '
+              f'{world.answered / (steps * dt):6.1f} from the cache, {elapsed / steps * 1e6:5.2f} us/step')
+        return trail
+
+    uncached = probes('ground probes, spatial grid', False)
+    cached = probes('ground probes, spatial grid + cache', True)
+    print(f'{"largest cached / uncached difference":>37}: '
+          f'{max(max(abs(a - b) for a, b in zip(p, q)) for p, q in zip(uncached, cached)):.2e}')
+
+    run('no walls, 60 Hz', room)
+    run('swept, linear scan, 60 Hz', room, radius=.5)
+    run('swept, spatial grid, 60 Hz', grid, radius=.5)
+    # 10 Hz ticks at 5x speed: 3 units per step, three times a wall's thickness
+    run('no walls, 10 Hz, speed 30', grid, speed=30, dt=1 / 10, steps=20_000)
+    run('swept, spatial grid, 10 Hz, speed 30', grid, radius=.5, speed=30, dt=1 / 10, steps=20_000)
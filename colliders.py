@@ -0,0 +1,471 @@
+"""
+colliders.py — analytic primitive colliders for Ursina entities.
+
+- use_analytic_colliders() swaps collider='mesh' on cylinder / cone / capsule
+  models (and squashed cylinders, as discs) for exact analytic shapes
+- raycast() has Ursina's signature and HitInfo result; it merges Panda3D's
+  collision traversal with the analytic shapes and returns the nearest hit
+- build_static_grid() moves every static box / sphere / plane / analytic
+  collider into one spatialgrid.SpatialGrid, so queries only look at the
+  cells they touch and Panda3D only traverses what is left (e.g. Mario);
+  add_static_shapes() / remove_static_shapes() keep it current for geometry
+  streamed in and out later; unindexed_bounds() lists what stays with Panda3D.
+  A disabled entity's shapes leave the grid until it's enabled again (its
+  on_disable / on_enable are hooked), restamping their columns like any other edit
+- RaycastWorld answers character.py ground probes with that raycast(), and
+  horizontal body sweeps from the static grid and analytic colliders; which
+  Panda3D colliders it still has to ask is recomputed only when
+  scene.collidables changes
+- Run this file to benchmark ground probes in the castle scene
+"""
+
+from ursina import *
+from ursina import raycast as _ursina_raycast
+from ursina.hit_info import HitInfo
+
+import shapes
+from instancing import InstancedProps
+from spatialgrid import SpatialGrid
+from primitives import shape_of
+
+
+# A cylinder this flat (height / radius) is treated as a disc, e.g. the moat
+DISC_RATIO = 0.05
+
+_shape_types = {
+    'cylinder': shapes.Cylinder,
+    'cone': shapes.Cone,
+    'capsule': shapes.Capsule,
+}
+
+# (entity, shape) pairs tested by raycast() in addition to Panda3D colliders
+analytic_colliders = []
+
+# Static colliders indexed by build_static_grid(); shapes carry .entity
+static_grid = None
+_grid_shapes = {}   # entity -> its shapes in static_grid
+_disabled = set()   # entities in _grid_shapes whose shapes are out of static_grid
+
+
+class _Collidables(set):
+    # scene.collidables, counting its changes (Ursina only adds and removes)
+    version = 0
+
+    def add(self, entity):
+        super().add(entity)
+        self.version += 1
+
+    def remove(self, entity):
+        super().remove(entity)
+        self.version += 1
+
+    def discard(self, entity):
+        super().discard(entity)
+        self.version += 1
+
+
+if not isinstance(scene.collidables, _Collidables):
+    scene.collidables = _Collidables(scene.collidables)
+
+
+# =============================
+# Helpers
+# =============================
+
+def primitive_name(entity):
+    """'cylinder' / 'cone' / 'capsule' for loaded or procedural models, else None."""
+    model = entity.model
+    if not model:
+        return None
+    for name in (type(model).__name__.lower(), str(model.name).split('.')[0].lower()):
+        name = shape_of(name) or name      # e.g. primitives.py's 'cylinder_24'
+        if name in _shape_types:
+            return name
+    return None
+
+
+def _fit_shape(name, world_position, world_scale, bounds):
+    """Fits the unit shape to the model's local bounds, then to the world transform."""
+    start, end = bounds
+    cx, cz = (start[0] + end[0]) / 2, (start[2] + end[2]) / 2
+    size = (end[0] - start[0], end[1] - start[1], end[2] - start[2])
+    sx, sy, sz = size[0] * world_scale[0], size[1] * world_scale[1], size[2] * world_scale[2]
+    x = world_position[0] + cx * world_scale[0]
+    y = world_position[1] + start[1] * world_scale[1]
+    z = world_position[2] + cz * world_scale[2]
+
+    if name == 'cylinder' and abs(sy) < DISC_RATIO * min(abs(sx), abs(sz)) / 2:
+        return shapes.Disc((x, y + sy, z), (sx, 1, sz))
+    if name == 'capsule':
+        sy /= 2   # unit capsule is 2 tall
+    if name == 'plane' or (name == 'box' and abs(sy) < 1e-3):
+        return shapes.Box((x, y + sy - 1e-3, z), (sx, 1e-3, sz))   # give flat surfaces a skin
+    if name == 'box':
+        return shapes.Box((x, y, z), (sx, sy, sz))
+    if name == 'sphere':
+        return shapes.Sphere((x, y, z), (sx, sy, sz))
+    return _shape_types[name]((x, y, z), (sx, sy, sz))
+
+
+def _model_bounds(entity):
+    bounds = entity.model.getTightBounds()
+    if not bounds:
+        return (-.5, 0, -.5), (.5, 1, .5)
+    return tuple(bounds[0]), tuple(bounds[1])
+
+
+def _analytic_shapes(entity, name):
+    if not name or any(entity.world_rotation):
+        return None
+    bounds = _model_bounds(entity)
+    if isinstance(entity, InstancedProps):
+        return [_fit_shape(name, p, s, bounds) for p, s in zip(entity.positions, entity.scales)]
+    return [_fit_shape(name, entity.world_position, entity.world_scale, bounds)]
+
+
+def add_analytic_collider(entity, name=None):
+    """Replaces entity's Panda3D collider with analytic shapes (one per instance
+    for InstancedProps). Returns the shapes, or [] if the model isn't supported.
+    Only axis-aligned (unrotated) entities are converted.
+    """
+    new_shapes = _analytic_shapes(entity, name or primitive_name(entity))
+    if not new_shapes:
+        return []
+
+    entity.collider = None
+    for shape in new_shapes:
+        analytic_colliders.append((entity, shape))
+    return new_shapes
+
+
+def remove_analytic_collider(entity):
+    analytic_colliders[:] = [(e, s) for e, s in analytic_colliders if e is not entity]
+
+
+def use_analytic_colliders(entities=None):
+    """Converts every mesh- or box-collided cylinder/cone/capsule in the scene.
+    Returns the number of entities converted.
+    """
+    if entities is None:
+        entities = scene.entities
+    count = 0
+    for e in list(entities):
+        if e.collider and primitive_name(e) and add_analytic_collider(e):
+            count += 1
+    return count
+
+
+def _static_shapes(entity):
+    """Shapes for an unrotated entity's collider, or None if it can't be indexed."""
+    if any(entity.world_rotation) or not entity.model:
+        return None
+    if isinstance(entity, InstancedProps):
+        name = entity.collider_shape
+        if name not in ('box', 'sphere'):
+            return None
+        bounds = _model_bounds(entity)
+        return [_fit_shape(name, p, s, bounds) for p, s in zip(entity.positions, entity.scales)]
+
+    name = getattr(entity.collider, 'name', None)
+    model_name = str(entity.model.name).split('.')[0].lower()
+    if name == 'mesh' and model_name == 'plane':
+        name = 'plane'
+    if name not in ('box', 'sphere', 'plane'):
+        return None
+    return [_fit_shape(name, entity.world_position, entity.world_scale, _model_bounds(entity))]
+
+
+def collider_shapes(entity):
+    """The shapes build_static_grid() / use_analytic_colliders() would make for
+    entity's collider, or None if it has none or can't be represented
+    (rotated, mesh collider on a non-primitive model).
+    """
+    if not entity.collider:
+        return None
+    return _analytic_shapes(entity, primitive_name(entity)) or _static_shapes(entity)
+
+
+def build_static_grid(entities=None, cell_size=4, ignore=()):
+    """Indexes the static colliders of `entities` (default: the whole scene) plus
+    every analytic collider, and takes them out of Panda3D's traversal.
+    Call once after the level is built. Returns the SpatialGrid.
+    """
+    global static_grid
+    _grid_shapes.clear()
+    _disabled.clear()
+    if entities is None:
+        entities = scene.entities
+    grid = SpatialGrid(cell_size=cell_size)
+
+    for e in list(entities):
+        if e in ignore or not e.collider or not e.collision or e.has_ancestor(camera.ui):
+            continue
+        new_shapes = _static_shapes(e)
+        if not new_shapes:
+            continue
+        _index(grid, e, new_shapes)
+        e.collision = False
+
+    for e, shape in analytic_colliders:
+        _index(grid, e, [shape])
+    analytic_colliders.clear()
+
+    static_grid = grid
+    return grid
+
+
+def add_static_shapes(entity, new_shapes):
+    """Indexes world-space `new_shapes` as entity's colliders in static_grid
+    (an empty grid is made if build_static_grid() hasn't run). Returns them.
+    """
+    global static_grid
+    if static_grid is None:
+        static_grid = SpatialGrid()
+    _index(static_grid, entity, new_shapes)
+    return new_shapes
+
+
+def registered_shapes(entity):
+    """The shapes raycast() already tests for entity: analytic or in static_grid."""
+    return [s for e, s in analytic_colliders if e is entity] + list(_grid_shapes.get(entity, ()))
+
+
+def remove_static_shapes(entity):
+    """Takes entity's shapes out of static_grid."""
+    removed = _grid_shapes.pop(entity, ())
+    _unhook(entity)
+    if entity in _disabled:
+        _disabled.discard(entity)     # already out
+        return
+    for shape in removed:
+        static_grid.remove(shape)
+
+
+def _index(grid, entity, new_shapes):
+    # new_shapes into grid as entity's, unless it's disabled
+    for shape in new_shapes:
+        shape.entity = entity
+    if entity not in _grid_shapes:
+        _hook(entity)
+        if not entity.enabled:
+            _disabled.add(entity)
+    _grid_shapes.setdefault(entity, []).extend(new_shapes)
+    if entity not in _disabled:
+        for shape in new_shapes:
+            grid.insert(shape)
+
+
+def _set_indexed(entity, enabled):
+    # A registered entity was enabled / disabled: its shapes go back into / out of the grid
+    if entity not in _grid_shapes or enabled != (entity in _disabled):
+        return
+    if enabled:
+        _disabled.discard(entity)
+        for shape in _grid_shapes[entity]:
+            static_grid.insert(shape)
+    else:
+        _disabled.add(entity)
+        for shape in _grid_shapes[entity]:
+            static_grid.remove(shape)
+
+
+class _EnabledHook:
+    # entity.on_enable / on_disable while it has shapes in static_grid; calls
+    # the entity's own handler after
+    def __init__(self, entity, enabled, handler):
+        self.entity, self.enabled, self.handler = entity, enabled, handler
+
+    def __call__(self):
+        _set_indexed(self.entity, self.enabled)
+        if self.handler is not None:
+            self.handler()
+
+
+def _hook(entity):
+    for name, enabled in (('on_enable', True), ('on_disable', False)):
+        if not isinstance(getattr(entity, name, None), _EnabledHook):
+            setattr(entity, name, _EnabledHook(entity, enabled, getattr(entity, name, None)))
+
+
+def _unhook(entity):
+    for name in ('on_enable', 'on_disable'):
+        hook = vars(entity).get(name)
+        if isinstance(hook, _EnabledHook):
+            delattr(entity, name)
+            if hook.handler is not None and getattr(entity, name, None) != hook.handler:
+                setattr(entity, name, hook.handler)     # one the entity had set itself
+
+
+def unindexed_bounds(ignore=()):
+    """World-space (min, max) boxes of the colliders still left to Panda3D
+    (rotated, mesh), e.g. to keep a heightmap.HeightMap off them.
+    """
+    bounds = []
+    for e in scene.collidables:
+        if e in ignore or not e.enabled or not scene.isAncestorOf(e):
+            continue
+        found = e.getTightBounds(scene)
+        if found:
+            bounds.append((tuple(found[0]), tuple(found[1])))
+    return bounds
+
+
+# =============================
+# RAYCAST
+# =============================
+def raycast(origin, direction=(0, 0, 1), distance=9999, traverse_target=scene, ignore=None, debug=False, color=color.white):
+    """Drop-in for ursina.raycast that also tests analytic colliders and the static grid."""
+    if any(e.enabled and (ignore is None or e not in ignore) for e in scene.collidables):
+        hit = _ursina_raycast(origin, direction, distance, traverse_target, ignore, debug, color)
+    else:
+        hit = HitInfo(hit=False, distance=distance)   # nothing left for Panda3D to traverse
+    if not analytic_colliders and not static_grid:
+        return hit
+
+    ox, oy, oz = origin[0], origin[1], origin[2]
+    dx, dy, dz = direction[0], direction[1], direction[2]
+    length = math.sqrt(dx * dx + dy * dy + dz * dz)
+    dx, dy, dz = dx / length, dy / length, dz / length
+    max_distance = hit.distance if hit.hit else distance
+
+    vertical = dx == 0 and dz == 0
+    best = None
+    for entity, shape in analytic_colliders:
+        # Ground probes are vertical: reject on the footprint before any call
+        if vertical and not (shape.min[0] <= ox <= shape.max[0] and shape.min[2] <= oz <= shape.max[2]):
+            continue
+        if ignore and entity in ignore:
+            continue
+        if not entity.enabled or (traverse_target is not scene and not entity.has_ancestor(traverse_target)):
+            continue
+        result = shape.raycast(ox, oy, oz, dx, dy, dz, max_distance)
+        if result is not None:
+            max_distance = result[0]
+            best = entity, result
+
+    if static_grid and traverse_target is scene:
+        skip = [s for e in ignore for s in _grid_shapes.get(e, ())] if ignore else None
+        result = static_grid.raycast(ox, oy, oz, dx, dy, dz, max_distance, ignore=skip)
+        if result is not None:
+            best = result[2].entity, result[:2]
+
+    if best is None:
+        return hit
+
+    entity, (t, normal) = best
+    world_point = Vec3(ox + dx * t, oy + dy * t, oz + dz * t)
+    hit_info = HitInfo(hit=True)
+    hit_info.entity = entity
+    hit_info.entities = [entity] + [e for e in hit.entities if e is not entity]
+    hit_info.world_point = world_point
+    hit_info.point = entity.get_relative_point(scene, world_point)
+    hit_info.distance = t
+    hit_info.world_normal = Vec3(*normal)
+    hit_info.normal = Vec3(*entity.getRelativeVector(scene, Vec3(*normal))).normalized()
+    return hit_info
+
+
+class RaycastWorld:
+    """character.py collision queries against the live Ursina scene. Sweeps
+    only see indexed and analytic colliders, not ones left to Panda3D
+    (e.g. rotated boxes). `ignore` is fixed at construction.
+    """
+    def __init__(self, ignore=()):
+        self.ignore = list(ignore)
+        self._collidables = None        # (scene.collidables version, the ones not ignored)
+
+    def sweep_box(self, x, z, y0, y1, radius, dx, dz):
+        best = static_grid.sweep_box(x, z, y0, y1, radius, dx, dz) if static_grid else None
+        for entity, shape in analytic_colliders:
+            if entity in self.ignore or not entity.enabled:
+                continue
+            hit = shape.sweep_box(x, z, y0, y1, radius, dx, dz)
+            if hit is not None and (best is None or hit[0] < best[0]):
+                best = hit[0], hit[1], shape
+        return best
+
+    def _grid_only(self):
+        if not static_grid:
+            return False
+        collidables = scene.collidables
+        if self._collidables is None or self._collidables[0] != collidables.version:
+            self._collidables = collidables.version, [e for e in collidables if e not in self.ignore]
+        # UI colliders (under camera.ui, not scene) can't be hit by a world ray
+        for e in self._collidables[1]:
+            if e.enabled and scene.isAncestorOf(e):
+                return False
+        return True
+
+    def ground_patch(self, x, z, y):
+        # Only when every probe goes to the grid: Panda3D colliders have no patches
+        return static_grid.ground_patch(x, z, y) if self._grid_only() else None
+
+    def patch_valid(self, patch):
+        return patch[6] is static_grid and self._grid_only() and static_grid.patch_valid(patch)
+
+    def probe_down(self, x, y, z, distance):
+        if self._grid_only():
+            hit = static_grid.probe_down(x, y, z, distance)   # everything static is indexed
+            return hit and (hit[0], hit[1].entity, hit[2])
+        hit = raycast(Vec3(x, y, z), Vec3(0, -1, 0), distance=distance, ignore=self.ignore)
+        if not hit.hit:
+            return None
+        velocity = getattr(hit.entity, 'velocity', None)
+        return hit.world_point.y, hit.entity, velocity[1] if velocity is not None else 0.0
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import importlib.util
+    import random
+    import time as _time
+    from primitives import install
+
+    app = Ursina(window_type='none')
+    # Newer Ursina releases ship no 'cylinder'/'cone' model files
+    install()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location('castle', os.path.join(here, 'physcis4k.py'))
+    castle = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(castle)
+    castle.create_peach_castle()
+    castle.create_surroundings()
+    Entity(model='plane', scale=(100, 1, 100), position=(0, -1, 0), collider='mesh')
+
+    random.seed(1)
+    probes = [Vec3(random.uniform(-40, 40), random.uniform(0, 30), random.uniform(-40, 40)) for _ in range(2000)]
+
+    def run(label):
+        start = _time.perf_counter()
+        hits = [raycast(p, Vec3(0, -1, 0), distance=40) for p in probes]
+        elapsed = _time.perf_counter() - start
+        print(f'{label:>14}: {elapsed / len(probes) * 1e6:8.1f} us/ray  ({sum(bool(h.hit) for h in hits)} hits)')
+        return hits
+
+    mesh_hits = run('mesh')
+    converted = use_analytic_colliders()
+    analytic_hits = run('analytic')
+
+    start = _time.perf_counter()
+    for p in probes:
+        for entity, shape in analytic_colliders:
+            if shape.min[0] <= p.x <= shape.max[0] and shape.min[2] <= p.z <= shape.max[2]:
+                shape.raycast(p.x, p.y, p.z, 0, -1, 0, 40)
+    elapsed = _time.perf_counter() - start
+    print(f'{"shapes only":>14}: {elapsed / len(probes) * 1e6:8.1f} us/ray  ({len(analytic_colliders)} shapes)')
+
+    build_static_grid()
+    grid_hits = run('static grid')
+    moved = sum(1 for a, b in zip(analytic_hits, grid_hits)
+                if a.hit != b.hit or (a.hit and abs(a.world_point.y - b.world_point.y) > 1e-3))
+    print(f'static grid: {len(static_grid)} shapes, {len(scene.collidables)} Panda3D collidables left, '
+          f'{moved} probes differ from analytic')
+
+    # Differences come from the tessellation, uncapped procedural cylinders and
+    # the per-instance boxes that stood in for cylinders/cones before
+    differ = sum(1 for a, b in zip(mesh_hits, analytic_hits)
+                 if a.hit != b.hit or (a.hit and abs(a.world_point.y - b.world_point.y) > .05))
+    print(f'converted {converted} entities; {differ}/{len(probes)} probes land on a different surface')
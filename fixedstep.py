@@ -0,0 +1,53 @@
+"""
+fixedstep.py — fixed-rate simulation clock (no Ursina import).
+
+Feed it each rendered frame's dt; it says how many fixed physics steps to run
+and how far the renderer is between the last two physics states (alpha), so
+jump heights and collision don't depend on the render frame rate.
+
+    clock = FixedTimestep(rate=120)
+    for _ in range(clock.advance(time.dt)):
+        previous, current = current, step(current, clock.dt)
+    draw(lerp(previous, current, clock.alpha))
+"""
+
+
+class FixedTimestep:
+    """Accumulator clock. rate is in Hz (e.g. 60/120/240). When a hitch needs more
+    than max_substeps steps the excess time is dropped (the game slows down
+    instead of spiralling); `dropped` totals it.
+    """
+    def __init__(self, rate=120, max_substeps=8):
+        self.rate = rate
+        self.dt = 1 / rate
+        self.max_substeps = max_substeps
+        self.accumulator = 0.0
+        self.dropped = 0.0
+        self.steps = 0
+
+    def advance(self, frame_dt):
+        """Adds frame_dt and returns the number of fixed steps to run now."""
+        self.accumulator += frame_dt
+        steps = int(self.accumulator * self.rate + 1e-9)
+        if steps > self.max_substeps:
+            self.dropped += (steps - self.max_substeps) * self.dt
+            steps = self.max_substeps
+            self.accumulator = 0.0
+        else:
+            self.accumulator = max(0.0, self.accumulator - steps * self.dt)
+        self.steps += steps
+        return steps
+
+    @property
+    def alpha(self):
+        """0..1 blend from the previous to the current physics state."""
+        return min(1.0, self.accumulator * self.rate)
+
+
+def lerp(a, b, t):
+    return a + (b - a) * t
+
+
+def lerp_angle(a, b, t):
+    """Degrees, along the shorter way round."""
+    return a + ((b - a + 180) % 360 - 180) * t
@@ -3,6 +3,18 @@
 from ursina import *
 import math
 
+from character import CharacterController, CharacterState, interpolate, GroundCache
+from fixedstep import FixedTimestep
+from simthread import CharacterSim, SimulationThread
+import colliders
+from colliders import build_static_grid, RaycastWorld
+from heightmap import bake_heightmap, HeightMapWorld
+from level import load_level, LEVEL_FOLDER
+from bake import bake_lighting
+
+# Global toggle: Mario's physics on its own thread (simthread.py) instead of in update()
+PHYSICS_THREAD = False
+
 
 # =============================
 # ENVIRONMENT
@@ -20,7 +32,8 @@ def create_indoor_environment():
         color=color.rgb(150, 120, 90),
         scale=(room_size, 1, room_size),
         position=(0, -0.5, 0),   # top sits exactly at y=0
-        collider='box'
+        collider='box',
+        static=True
     )
 
     # Ceiling
@@ -30,7 +43,8 @@ def create_indoor_environment():
         color=color.rgb(160, 140, 120),
         scale=(room_size, wall_thickness, room_size),
         position=(0, wall_height, 0),
-        collider='box'
+        collider='box',
+        static=True
     )
 
     # Walls
@@ -42,7 +56,8 @@ def create_indoor_environment():
         color=color.rgb(180, 150, 130),
         scale=(room_size, wall_height, wall_thickness),
         position=(0, wall_height/2, room_size/2),
-        collider='box'
+        collider='box',
+        static=True
     ))
     # South
     walls.append(Entity(
@@ -51,7 +66,8 @@ def create_indoor_environment():
         color=color.rgb(180, 150, 130),
         scale=(room_size, wall_height, wall_thickness),
         position=(0, wall_height/2, -room_size/2),
-        collider='box'
+        collider='box',
+        static=True
     ))
     # East
     walls.append(Entity(
@@ -60,7 +76,8 @@ def create_indoor_environment():
         color=color.rgb(180, 150, 130),
         scale=(wall_thickness, wall_height, room_size),
         position=(room_size/2, wall_height/2, 0),
-        collider='box'
+        collider='box',
+        static=True
     ))
     # West
     walls.append(Entity(
@@ -69,7 +86,8 @@ def create_indoor_environment():
         color=color.rgb(180, 150, 130),
         scale=(wall_thickness, wall_height, room_size),
         position=(-room_size/2, wall_height/2, 0),
-        collider='box'
+        collider='box',
+        static=True
     ))
 
     return [floor, ceiling] + walls
@@ -82,7 +100,8 @@ def create_furniture():
         color=color.rgb(101, 67, 33),
         scale=(4, 1, 4),
         position=(0, 0.5, 0),
-        collider='box'
+        collider='box',
+        static=True
     )
 
     # Four green columns (decor)
@@ -92,7 +111,8 @@ def create_furniture():
             color=color.green,
             scale=(1, 3, 1),
             position=(8 * math.cos(i * math.pi/2), 1.5, 8 * math.sin(i * math.pi/2)),
-            collider='box'
+            collider='box',
+            static=True
         )
 
 
@@ -100,7 +120,7 @@ def create_furniture():
 # PLAYER CONTROLLER
 # =============================
 class Mario(Entity):
-    def __init__(self, **kwargs):
+    def __init__(self, physics_rate=120, max_substeps=8, heightmap=None, **kwargs):
         super().__init__(
             model='cube',
             color=color.blue,
@@ -110,18 +130,39 @@ class Mario(Entity):
             **kwargs
         )
 
-        # Movement
-        self.speed = 6
-        self.jump_speed = 10
-        self.gravity = -25
+        # Movement (engine-independent core in character.py)
+        self.controller = CharacterController(
+            speed=6,
+            jump_speed=10,
+            gravity=-25,
+            terminal=-20,
+            ground_snap=0.1,    # ground probe: 0.1 above to 0.1 below the feet
+            skin=0.1,
+            kill_y=-20,         # respawn below this
+            spawn_point=self.position,
+            radius=0.5,         # walls stop the 1x2x1 body (swept: no tunneling at any dt)
+            height=2,
+        )
+        self.state = CharacterState(*self.position)
+        self.previous_state = self.state
+        self.world = GroundCache(RaycastWorld(ignore=[self]))
+        if heightmap:   # ground probes over flat tops are a cell lookup (heightmap.py)
+            self.world = HeightMapWorld(heightmap, self.world)
+        # Fixed-rate physics, rendered interpolated between the last two states
+        self.clock = FixedTimestep(rate=physics_rate, max_substeps=max_substeps)
+        # PHYSICS_THREAD: the same steps on their own thread, against the static
+        # grid only (no Panda3D queries off the main thread)
+        self.sim = None
+        if PHYSICS_THREAD:
+            world = GroundCache(colliders.static_grid)
+            world = HeightMapWorld(heightmap, world) if heightmap else world
+            self.sim = CharacterSim(self.controller, self.state, world)
+            self.sim_thread = SimulationThread(rate=physics_rate, max_substeps=max_substeps)
+            self.sim_thread.add(self.sim)
+            self.sim_thread.start()
         self.velocity_y = 0
-        self.terminal = -20
         self.on_ground = False
 
-        # Respawn logic
-        self.kill_y = -20
-        self.spawn_point = Vec3(self.position)
-
         # Camera setup
         self.camera_pivot = Entity(parent=self, y=1.5)  # camera follow point
         camera.parent = self.camera_pivot
@@ -131,45 +172,26 @@ class Mario(Entity):
 
     def update(self):
         # Input direction
-        move_dir = Vec3(
-            held_keys['d'] - held_keys['a'],
-            0,
-            held_keys['w'] - held_keys['s']
-        )
-
-        if move_dir.length() > 0:
-            move_dir = move_dir.normalized()
-            self.look_at(self.position + move_dir)
-            self.position += self.forward * self.speed * time.dt
-
-        # Gravity
-        self.velocity_y += self.gravity * time.dt
-        if self.velocity_y < self.terminal:
-            self.velocity_y = self.terminal
-
-        # Apply vertical move
-        self.y += self.velocity_y * time.dt
-
-        # Ground detection
-        ray_origin = self.world_position + Vec3(0, 0.1, 0)
-        hit = raycast(ray_origin, direction=self.down, distance=0.2, ignore=[self])
-
-        if hit.hit:
-            self.y = hit.world_point.y
-            self.velocity_y = 0
-            self.on_ground = True
-        else:
-            self.on_ground = False
-
-        # Jump
-        if held_keys['space'] and self.on_ground:
-            self.velocity_y = self.jump_speed
-            self.on_ground = False
-
-        # Kill plane
-        if self.y < self.kill_y:
-            self.position = Vec3(self.spawn_point)
-            self.velocity_y = 0
+        move_x = held_keys['d'] - held_keys['a']
+        move_z = held_keys['w'] - held_keys['s']
+
+        if self.sim:
+            self.sim.input.set((move_x, move_z, bool(held_keys['space'])))
+            x, y, z, self.rotation_y, self.velocity_y, self.on_ground = self.sim.sample()
+            self.position = (x, y, z)
+            return
+        for _ in range(self.clock.advance(time.dt)):
+            self.previous_state = self.state
+            self.state = self.controller.step(self.state, move_x, move_z, held_keys['space'], self.clock.dt, self.world)
+        x, y, z, yaw = interpolate(self.previous_state, self.state, self.clock.alpha)
+        self.position = (x, y, z)
+        self.rotation_y = yaw
+        self.velocity_y = self.state.velocity_y
+        self.on_ground = self.state.on_ground
+
+    def on_destroy(self):
+        if self.sim:
+            self.sim_thread.stop()
 
 
 # =============================
@@ -181,16 +203,26 @@ def main():
     window.title = "Indoor Mario Test"
     window.color = color.rgb(120, 160, 200)
 
-    # Environment
-    create_indoor_environment()
-    create_furniture()
+    # Environment: create_indoor_environment() + create_furniture(), exported to
+    # levels/simple_room.json (`python level.py export`) and loaded from its
+    # compiled cache
+    level = load_level(os.path.join(LEVEL_FOLDER, 'simple_room.json'))
+
+    # Index every static collider once; Mario's probes only visit nearby cells
+    build_static_grid()
+
+    # Lighting: baked into the room's vertex colours once (cached with the
+    # level); the live lights only reach Mario
+    lights = [PointLight(position=(0, 6, -2), color=color.white),
+              AmbientLight(color=color.rgba(200, 200, 200, 0.5))]
+    bake_lighting(level, lights)
 
-    # Lighting
-    PointLight(position=(0, 6, -2), color=color.white)
-    AmbientLight(color=color.rgba(200, 200, 200, 0.5))
+    # Walkable tops baked into a heightmap (cached with the level): Mario's
+    # ground probes there are a cell lookup, with the raycast world near edges
+    heightmap = bake_heightmap(level, colliders.static_grid, exclude=colliders.unindexed_bounds())
 
     # Player
-    Mario(position=(0, 2, 0))
+    Mario(position=(0, 2, 0), heightmap=heightmap)
 
     Sky(color=color.rgb(200, 200, 200))  # soft indoor light
 
@@ -0,0 +1,167 @@
+"""
+freeze.py — merge a live scene's static Entities into a few large Geoms.
+
+- Entities built with static=True (the scene scripts' walls, floors, doors,
+  pillars, paintings and castle pieces) never move. freeze_static() copies
+  their models into one node, flattens it by render state (through palette.py,
+  so it usually ends up one Geom) and destroys the Entities: no transforms, no
+  update-loop visits and no Panda3D collision nodes left for them
+- Their colliders move to the static collision set first: shapes that
+  colliders.collider_shapes() can represent are owned by the frozen root (in
+  colliders.static_grid if it's built, else as analytic colliders for
+  build_static_grid() to index). An Entity whose collider can't be represented
+  (rotated, mesh collider on a custom model) stays as an invisible,
+  update-ignored collider
+- Entities with update(), scripts, instancing (own shader) or a live child that
+  isn't static are left alone
+- merge_geometry() is the flattening step shared with level.compile_level()
+- Run this file to compare each level built live before and after freezing
+"""
+
+from ursina import *
+
+import colliders
+from instancing import InstancedProps
+from palette import palettize
+
+
+def merge_geometry(node):
+    """Flattens everything under node into as few Geoms as its render states
+    allow, all colours sharing one palette texture. Collision nodes are dropped.
+    """
+    for np in node.findAllMatches('**/+CollisionNode'):
+        np.removeNode()
+    for np in node.findAllMatches('**'):
+        np.clearPythonTag('Entity')     # tagged nodes are never flattened away
+    node.flattenStrong()
+    palettize(node)       # one texture for every colour: the static level ends up in one render state
+
+
+def _freezable(entity):
+    return (entity.enabled and not isinstance(entity, InstancedProps) and not getattr(entity, 'scripts', None)
+            and not (hasattr(entity, 'update') and callable(entity.update)))
+
+
+def freeze_static(entities=None, name='static'):
+    """Merges `entities` (default: every Entity with static=True) into one
+    Entity and destroys them. Returns the new Entity; .frozen is how many
+    Entities it replaced, .kept the invisible collider-only ones left behind,
+    .freeze_time the seconds it took.
+    """
+    start = time.perf_counter()
+    if entities is None:
+        entities = [e for e in scene.entities if getattr(e, 'static', False)]
+    candidates = set(e for e in entities if _freezable(e))
+    # A frozen Entity takes its children with it: keep any with a live child
+    changed = True
+    while changed:
+        changed = False
+        for e in list(candidates):
+            if any(c not in candidates for c in e.children if isinstance(c, Entity)):
+                candidates.discard(e)
+                changed = True
+    frozen = [e for e in entities if e in candidates]
+
+    root = Entity(name=name, ignore=True)
+    merged = NodePath('merged')
+    found_shapes, kept = [], []
+    for e in frozen:
+        if e.model:
+            copy = e.model.copyTo(merged)
+            copy.setTransform(e.model.getTransform(root))
+            copy.setState(e.model.getState(root))
+        # Shapes already made for it (e.g. use_analytic_colliders() clears the collider)
+        found = colliders.registered_shapes(e) or colliders.collider_shapes(e)
+        if found:
+            found_shapes.extend(found)
+        elif e.collider:
+            kept.append(e)
+    merge_geometry(merged)
+    root.model = merged
+
+    grid = colliders.static_grid
+    for e in frozen:
+        colliders.remove_analytic_collider(e)
+        if grid:
+            colliders.remove_static_shapes(e)
+    if grid:
+        colliders.add_static_shapes(root, found_shapes)
+    else:
+        colliders.analytic_colliders.extend((root, shape) for shape in found_shapes)
+
+    for e in kept:
+        e.visible = False
+        e.ignore = True
+    gone = [e for e in frozen if e not in kept]
+    for e in gone:
+        if e.parent not in gone:      # destroy() takes the children along
+            destroy(e)
+
+    root.frozen = len(gone)
+    root.kept = kept
+    root.freeze_time = time.perf_counter() - start
+    return root
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import random
+    import sys
+    import time as _time
+    from panda3d.core import loadPrcFileData
+    import primitives
+    from audit import scene_stats, update_loop_cost
+    from level import level_builders
+
+    # Offscreen through EGL (Mesa runs it in software when there's no GPU)
+    loadPrcFileData('freeze', 'load-display p3headlessgl\naux-display p3tinydisplay\nsync-video false\ngl-finish true')
+    app = Ursina(window_type='offscreen', size=(960, 540), development_mode=False)
+    primitives.install()
+    builders = level_builders()
+
+    def frame_ms(frames=200):
+        times = []
+        for frame in range(-10, frames):
+            begin = _time.perf_counter()
+            app.step()
+            if frame >= 0:
+                times.append((_time.perf_counter() - begin) * 1000)
+        return sum(times) / len(times)
+
+    def probes(count=500):
+        random.seed(2)
+        hits = []
+        for _ in range(count):
+            hit = colliders.raycast(Vec3(random.uniform(-20, 20), 30, random.uniform(-20, 20)), Vec3(0, -1, 0), 60)
+            hits.append(round(hit.world_point.y, 3) if hit.hit else None)
+        return hits
+
+    for name in sys.argv[1:] or builders:
+        del colliders.analytic_colliders[:]
+        before = set(scene.entities)
+        builders[name]()
+        colliders.use_analytic_colliders()      # as the compiled levels' collider tables do
+        colliders.build_static_grid()
+        camera.position = (30, 15, -40) if name == 'peach_castle' else (-12, 6, -12)
+        camera.look_at(Vec3(0, 2, 0))
+        built = [e for e in scene.entities if e not in before]
+
+        def measure(entities):
+            return scene_stats(entities), update_loop_cost(scene.entities, 200), frame_ms(), probes()
+
+        live = measure(built)
+        root = freeze_static()
+        frozen = measure([e for e in scene.entities if e not in before])
+        moved = sum(a != b for a, b in zip(live[3], frozen[3]))
+
+        print(f'{name}: froze {root.frozen} entities in {root.freeze_time * 1000:.1f} ms '
+              f'({len(root.kept)} kept as colliders), {moved}/{len(live[3])} ground probes changed')
+        for label, (stats, loop, ms, _) in (('live', live), ('frozen', frozen)):
+            print(f'  {label:>6}: {stats["entities"]:>3} entities, {stats["draw_calls"]:>3} draw calls, '
+                  f'{stats["render_states"]:>3} states, update loop {loop * 1e6:5.1f} us, frame {ms:6.2f} ms')
+        for e in [e for e in scene.entities if e not in before]:
+            if e in scene.entities and e.parent == scene:
+                destroy(e)
+        colliders.static_grid = None
@@ -0,0 +1,409 @@
+"""
+heightmap.py — baked 2.5D walkability map for ground probes (no Ursina import).
+
+The levels are mostly flat tops: floor slabs, table tops, the bridge, the path
+and the castle base. HeightMap rasterizes static shapes.py shapes onto an xz
+grid of `cell_size` cells, each holding up to `max_layers` solid spans
+(bottom, top) stacked over it, highest first. A downward probe is then one cell
+lookup and a scan of a few floats instead of a spatial grid query.
+
+- A cell is exact when every shape reaching it covers all of it with a flat
+  top (boxes, and cylinders / discs inside their round edge). Cells on a
+  shape's edge, under a sloped or curved top (spheres, cones, capsules) or
+  with more than max_layers spans are left to the world, and so is a probe
+  starting inside a solid (its ray leaves through the bottom)
+- bind(grid) follows a spatialgrid.SpatialGrid: columns edited since (streamed
+  chunks) and those holding kinematic shapes (platforms.py) go to the grid
+- exclude(lo, hi) hands a box back to the world, e.g. colliders left to
+  Panda3D (colliders.unindexed_bounds())
+- HeightMapWorld answers character.py probes from the map and passes the rest
+  on; ground_below() is the same lookup vectorized for agents.py (a map baked
+  with bounds=True), testing the shapes listed on edge cells itself
+- bake_heightmap() caches the map next to a level.load_level() root's
+  compiled cache, keyed by the level and its shapes
+- Run this file to compare ground probes against the spatial grid
+"""
+
+import hashlib
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+
+# Bump when bake()'s output changes for the same inputs
+HEIGHTMAP_VERSION = 1
+
+# probe_down() result for probes the map can't answer
+UNKNOWN = object()
+
+
+def _footprint(shape, top, cells_x, cells_z, round_top=True):
+    """(touched, covered) over a block of cells given as (lower, upper) edge
+    arrays: which cells the shape's top reaches, and which it spans
+    entirely. A round top (cylinders, discs) is its ellipse, any other flat
+    top its rectangle; a shape with no flat top covers nothing.
+    """
+    (x_lo, x_hi), (z_lo, z_hi) = cells_x, cells_z
+    shape_2d = len(z_lo), len(x_lo)
+    if top is None:
+        return np.ones(shape_2d, dtype=bool), np.zeros(shape_2d, dtype=bool)
+    if round_top and shape.kind in ('cylinder', 'disc'):
+        px, pz = shape.position[0], shape.position[2]
+        a, b = abs(shape.scale[0]) / 2, abs(shape.scale[2]) / 2
+        # Nearest and farthest point of each cell, in units of the half-axes
+        near_x = ((np.clip(px, x_lo, x_hi) - px) / a) ** 2
+        near_z = ((np.clip(pz, z_lo, z_hi) - pz) / b) ** 2
+        far_x = np.maximum((x_lo - px) ** 2, (x_hi - px) ** 2) / a ** 2
+        far_z = np.maximum((z_lo - pz) ** 2, (z_hi - pz) ** 2) / b ** 2
+        return near_z[:, None] + near_x[None, :] <= 1, far_z[:, None] + far_x[None, :] <= 1
+    _, x0, z0, x1, z1 = top
+    covered = ((z_lo >= z0) & (z_hi <= z1))[:, None] & ((x_lo >= x0) & (x_hi <= x1))[None, :]
+    return np.ones(shape_2d, dtype=bool), covered
+
+
+class HeightMap:
+    """`tops` / `bottoms` (nz, nx, layers) are the spans of the shapes
+    reaching each cell, highest top first and padded with -inf / inf;
+    `surfaces` their index in `shapes` (-1 for padding). `exact` (nz, nx)
+    marks the cells that answer probes, `overflow` those reached by more
+    shapes than there are layers. Cell (0, 0) starts at `origin` (x, z).
+    """
+    def __init__(self, origin, cell_size, tops, bottoms, surfaces, exact, overflow, shapes=()):
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.cell_size = float(cell_size)
+        self.tops = tops
+        self.bottoms = bottoms
+        self.surfaces = surfaces
+        self.exact = exact
+        self.overflow = overflow
+        self.shapes = list(shapes)
+        self.nz, self.nx, self.layers = tops.shape
+        self.grid = None
+        self.stamp = 0
+        # Flat lists for the scalar path: list indexing beats numpy item access
+        self._tops = tops.ravel().tolist()
+        self._bottoms = bottoms.ravel().tolist()
+        self._surfaces = surfaces.ravel().tolist()
+        self._exact = exact.ravel().tolist()
+        # Contiguous per layer for the vectorized path, plus each shape's
+        # footprint and top (x0, x1, z0, z1, top) to test on edge cells
+        self._layer_tops = [np.ascontiguousarray(tops[:, :, k]).ravel() for k in range(self.layers)]
+        self._layer_surfaces = [np.ascontiguousarray(surfaces[:, :, k]).ravel() for k in range(self.layers)]
+        self._bounds = np.array([(s.min[0], s.max[0], s.min[2], s.max[2], s.max[1]) for s in self.shapes]
+                                + [(np.inf, -np.inf, np.inf, -np.inf, -np.inf)], dtype=np.float64)
+
+    # =============================
+    # BAKE
+    # =============================
+    @classmethod
+    def bake(cls, shapes, cell_size=.5, max_layers=4, bounds=False, margin=1e-6):
+        """Rasterizes `shapes` (kinematic ones are skipped). A shape reaches
+        every cell within `margin` of its footprint (a round top's ellipse,
+        else its bounds), so a probe on a cell's edge never misses a
+        neighbour. With `bounds`, every shape counts as its bounds' flat top,
+        as agents.py sees its grounds.
+        """
+        shapes = [s for s in shapes if not getattr(s, 'kinematic', False)]
+        if not shapes:
+            empty, flags = np.zeros((0, 0, max_layers)), np.zeros((0, 0), dtype=bool)
+            return cls((0, 0), cell_size, empty, empty, empty.astype(np.int32), flags, flags)
+        ox = math.floor(min(s.min[0] for s in shapes) / cell_size) * cell_size
+        oz = math.floor(min(s.min[2] for s in shapes) / cell_size) * cell_size
+        nx = math.floor((max(s.max[0] for s in shapes) - ox) / cell_size) + 1
+        nz = math.floor((max(s.max[2] for s in shapes) - oz) / cell_size) + 1
+        tops = np.full((nz, nx, max_layers), -np.inf)
+        bottoms = np.full((nz, nx, max_layers), np.inf)
+        surfaces = np.full((nz, nx, max_layers), -1, dtype=np.int32)
+        count = np.zeros((nz, nx), dtype=np.int64)
+        exact = np.ones((nz, nx), dtype=bool)
+        overflow = np.zeros((nz, nx), dtype=bool)
+        edges_x = ox + np.arange(nx + 1) * cell_size
+        edges_z = oz + np.arange(nz + 1) * cell_size
+
+        for index, shape in enumerate(shapes):
+            ix0 = max(0, math.floor((shape.min[0] - margin - ox) / cell_size))
+            ix1 = min(nx - 1, math.floor((shape.max[0] + margin - ox) / cell_size))
+            iz0 = max(0, math.floor((shape.min[2] - margin - oz) / cell_size))
+            iz1 = min(nz - 1, math.floor((shape.max[2] + margin - oz) / cell_size))
+            region = slice(iz0, iz1 + 1), slice(ix0, ix1 + 1)
+            # Each cell grown by the margin
+            cells_x = edges_x[ix0:ix1 + 1] - margin, edges_x[ix0 + 1:ix1 + 2] + margin
+            cells_z = edges_z[iz0:iz1 + 1] - margin, edges_z[iz0 + 1:iz1 + 2] + margin
+            top = (shape.max[1], shape.min[0], shape.min[2], shape.max[0], shape.max[2]) if bounds else shape.flat_top()
+            touched, covered = _footprint(shape, top, cells_x, cells_z, round_top=not bounds)
+            full = touched & (count[region] >= max_layers)
+            overflow[region] |= full
+            exact[region] &= ~touched | (covered & ~full)
+            rows, columns = np.nonzero(touched & ~full)
+            rows += iz0
+            columns += ix0
+            slots = count[rows, columns]
+            tops[rows, columns, slots] = shape.max[1] if top is None else top[0]
+            bottoms[rows, columns, slots] = shape.min[1]
+            surfaces[rows, columns, slots] = index
+            count[rows, columns] += 1
+
+        order = np.argsort(-tops, axis=2, kind='stable')
+        tops = np.take_along_axis(tops, order, axis=2)
+        bottoms = np.take_along_axis(bottoms, order, axis=2)
+        surfaces = np.take_along_axis(surfaces, order, axis=2)
+        return cls((ox, oz), cell_size, tops, bottoms, surfaces, exact, overflow, shapes)
+
+    def save(self, path):
+        np.savez(path, origin=self.origin, cell_size=self.cell_size, tops=self.tops, bottoms=self.bottoms,
+                 surfaces=self.surfaces, exact=self.exact, overflow=self.overflow)
+
+    @classmethod
+    def load(cls, path, shapes):
+        """A saved map; `shapes` must be the list it was baked from (its
+        static shapes, in the same order).
+        """
+        with np.load(path) as data:
+            return cls(data['origin'], float(data['cell_size']), data['tops'], data['bottoms'],
+                       data['surfaces'], data['exact'].copy(), data['overflow'],
+                       [s for s in shapes if not getattr(s, 'kinematic', False)])
+
+    # =============================
+    # RUNTIME EXCLUSIONS
+    # =============================
+    def bind(self, grid):
+        """Checks every probe against `grid`'s edits from now on and leaves
+        the columns of its kinematic shapes (which move without restamping
+        them) to it.
+        """
+        self.grid = grid
+        self.stamp = grid.stamp
+        cs = grid.cell_size
+        for shape in grid:
+            if getattr(shape, 'kinematic', False):
+                self.exclude((math.floor(shape.min[0] / cs) * cs, 0, math.floor(shape.min[2] / cs) * cs),
+                             ((math.floor(shape.max[0] / cs) + 1) * cs, 0, (math.floor(shape.max[2] / cs) + 1) * cs))
+        return self
+
+    def exclude(self, lo, hi, margin=1e-6):
+        """Leaves every cell reaching into the xz box lo..hi to the world."""
+        cs, (ox, oz) = self.cell_size, self.origin
+        ix0 = max(0, math.floor((lo[0] - margin - ox) / cs))
+        ix1 = min(self.nx - 1, math.floor((hi[0] + margin - ox) / cs))
+        iz0 = max(0, math.floor((lo[2] - margin - oz) / cs))
+        iz1 = min(self.nz - 1, math.floor((hi[2] + margin - oz) / cs))
+        if ix0 > ix1 or iz0 > iz1:
+            return
+        self.exact[iz0:iz1 + 1, ix0:ix1 + 1] = False
+        for iz in range(iz0, iz1 + 1):
+            start = iz * self.nx
+            self._exact[start + ix0:start + ix1 + 1] = [False] * (ix1 - ix0 + 1)
+
+    # =============================
+    # QUERIES
+    # =============================
+    def probe_down(self, x, y, z, distance):
+        """Like SpatialGrid.probe_down() (the surface is the shape), or UNKNOWN."""
+        cs = self.cell_size
+        ix = math.floor((x - self.origin[0]) / cs)
+        iz = math.floor((z - self.origin[1]) / cs)
+        if not (0 <= ix < self.nx and 0 <= iz < self.nz):
+            return UNKNOWN
+        i = iz * self.nx + ix
+        if not self._exact[i]:
+            return UNKNOWN
+        grid = self.grid
+        if grid is not None and grid.stamp != self.stamp and grid.changed_since(x, z, self.stamp):
+            return UNKNOWN
+        tops, bottoms = self._tops, self._bottoms
+        for k in range(i * self.layers, (i + 1) * self.layers):
+            top = tops[k]
+            if top <= y:
+                if top < y - distance:
+                    return None
+                return top, self.shapes[self._surfaces[k]], 0.0
+            if bottoms[k] <= y:
+                return UNKNOWN      # inside a solid: the ray hits its bottom from within
+        return None
+
+    def ground_below(self, x, y, z, distance):
+        """(highest top in [y - distance, y] under each point or -inf, which
+        points the map answered) for arrays x, y, z (distance may be one).
+        Like agents.AgentSystem's ground scan, every shape counts as its
+        bounds' top (bake with bounds=True) and solids are not tested; only
+        points on overflowing cells are left unanswered. bind() is not
+        consulted: give agents an unbound map.
+        """
+        cs = self.cell_size
+        ix = np.floor((x - self.origin[0]) / cs).astype(np.int64)
+        iz = np.floor((z - self.origin[1]) / cs).astype(np.int64)
+        inside = (ix >= 0) & (ix < self.nx) & (iz >= 0) & (iz < self.nz)
+        index = np.where(inside, iz * self.nx + ix, 0)
+        y = np.asarray(y, dtype=np.float64)
+        low = y - distance
+        best = np.full(x.shape, -np.inf)
+        for tops in self._layer_tops:
+            top = tops[index]
+            np.maximum(best, np.where((top <= y) & (top >= low), top, -np.inf), out=best)
+        best[~inside] = -np.inf     # nothing is baked outside the shapes' bounds
+
+        # Edge cells: test the footprints of the shapes listed there
+        edge = np.flatnonzero(inside & ~self.exact.ravel()[index])
+        if len(edge):
+            ex, ez, ey, cells = x[edge], z[edge], y[edge], index[edge]
+            elow = low[edge] if np.ndim(low) else low
+            found = np.full(len(edge), -np.inf)
+            for surfaces in self._layer_surfaces:
+                x0, x1, z0, z1, top = self._bounds[surfaces[cells]].T
+                hit = (ex >= x0) & (ex <= x1) & (ez >= z0) & (ez <= z1) & (top <= ey) & (top >= elow)
+                np.maximum(found, np.where(hit, top, -np.inf), out=found)
+            best[edge] = found
+        return best, ~(inside & self.overflow.ravel()[index])
+
+    @property
+    def coverage(self):
+        """Fraction of the map's cells that answer probes."""
+        return float(self.exact.mean()) if self.exact.size else 0.0
+
+
+class HeightMapWorld:
+    """character.py world answering ground probes from `heightmap` where it
+    knows the answer and passing the rest, and every sweep, to `world`.
+    """
+    def __init__(self, heightmap, world):
+        self.heightmap = heightmap
+        self.world = world
+        self.queries = 0        # probes passed to the world
+        self.answered = 0       # probes answered from the map
+
+    def probe_down(self, x, y, z, distance):
+        hit = self.heightmap.probe_down(x, y, z, distance)
+        if hit is UNKNOWN:
+            self.queries += 1
+            return self.world.probe_down(x, y, z, distance)
+        self.answered += 1
+        return hit
+
+    def sweep_box(self, x, z, y0, y1, radius, dx, dz):
+        return self.world.sweep_box(x, z, y0, y1, radius, dx, dz)
+
+
+# =============================
+# LEVEL CACHE
+# =============================
+def heightmap_key(level_key, shapes, settings):
+    records = [[type(s).__name__, [round(v, 4) for v in s.position], [round(v, 4) for v in s.scale]] for s in shapes]
+    source = json.dumps({'level': level_key, 'settings': settings, 'shapes': records,
+                         'version': HEIGHTMAP_VERSION}, sort_keys=True).encode()
+    return hashlib.sha1(source).hexdigest()[:16]
+
+
+def bake_heightmap(level, grid, cell_size=.5, max_layers=4, exclude=(), verbose=False):
+    """The HeightMap of `grid`'s static shapes, bound to it: read from next to
+    `level`'s compiled cache (a load_level() root) or baked and written there.
+    `exclude` is a list of (lo, hi) boxes left to the world. Call after
+    build_static_grid(). level.heightmap_time is in seconds (verbose prints it).
+    """
+    start = time.perf_counter()
+    shapes = [s for s in grid if not getattr(s, 'kinematic', False)]
+    settings = {'cell_size': cell_size, 'max_layers': max_layers}
+    path = os.path.join(level.cache_folder, heightmap_key(level.cache_key, shapes, settings) + '.height.npz')
+
+    cache_hit = os.path.isfile(path)
+    if cache_hit:
+        heightmap = HeightMap.load(path, shapes)
+    else:
+        heightmap = HeightMap.bake(shapes, cell_size, max_layers)
+        heightmap.save(path)
+    heightmap.bind(grid)
+    for lo, hi in exclude:
+        heightmap.exclude(lo, hi)
+
+    level.heightmap_time = time.perf_counter() - start
+    if verbose:
+        print(f'heightmap {level.name}: {"cached" if cache_hit else "baked"} in {level.heightmap_time * 1000:.1f} ms, '
+              f'{heightmap.nx}x{heightmap.nz} cells, {heightmap.coverage:.0%} exact')
+    return heightmap
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import random
+    from character import CharacterController, CharacterState, GroundCache
+    from shapes import Box, Cylinder, Cone, Disc
+    from spatialgrid import SpatialGrid
+
+    # The 3x1.0.py room, and castle grounds in the style of physcis4k.py:
+    # lawn, moat, bridge, path, a stepped castle base with towers and roofs
+    room = [
+        Box.from_center((0, -0.5, 0), (30, 1, 30)),
+        Box.from_center((0, 10, 0), (30, 1, 30)),
+        Box.from_center((0, 5, 15), (30, 10, 1)), Box.from_center((0, 5, -15), (30, 10, 1)),
+        Box.from_center((15, 5, 0), (1, 10, 30)), Box.from_center((-15, 5, 0), (1, 10, 30)),
+        Box.from_center((0, 0.5, 0), (4, 1, 4)),
+    ] + [Box.from_center((sx * 12, 5, sz * 12), (1.2, 10, 1.2)) for sx in (-1, 1) for sz in (-1, 1)] \
+      + [Cylinder((8 * math.cos(i * math.pi / 2), 0, 8 * math.sin(i * math.pi / 2)), (1, 3, 1)) for i in range(4)]
+    castle = [
+        Box((0, -1.001, 0), (100, 1e-3, 100)),
+        Disc((0, -.9, 12), (36, 1, 36)),
+        Box.from_center((0, -.5, -9), (4, .4, 8)),
+        Box.from_center((0, -.95, -25), (3, .1, 24)),
+    ] + [Box.from_center((0, i * 1.5 + .75, 16), (24 - i * 4, 1.5, 16 - i * 3)) for i in range(4)] \
+      + [Cylinder((sx * 11, 0, 16 + sz * 7), (3, 10, 3)) for sx in (-1, 1) for sz in (-1, 1)] \
+      + [Cone((sx * 11, 10, 16 + sz * 7), (4, 4, 4)) for sx in (-1, 1) for sz in (-1, 1)] \
+      + [Box.from_center((x, 1, z), (1.5, 2, 1.5)) for x in range(-40, 41, 10) for z in (-40, 40)]
+
+    for label, shapes in (('room', room), ('castle', castle)):
+        grid = SpatialGrid(shapes)
+        start = time.perf_counter()
+        heightmap = HeightMap.bake(shapes).bind(grid)
+        bake_ms = (time.perf_counter() - start) * 1000
+        lo = heightmap.origin
+        hi = (lo[0] + heightmap.nx * heightmap.cell_size, lo[1] + heightmap.nz * heightmap.cell_size)
+
+        # Probes as a character makes them: just above whatever top is below a
+        # random point (or a random height), reaching a little further down
+        random.seed(3)
+        probes = []
+        while len(probes) < 20_000:
+            x, z = random.uniform(lo[0], hi[0]), random.uniform(lo[1], hi[1])
+            hit = grid.probe_down(x, 20, z, 40) if random.random() < .8 else None
+            y = hit[0] + random.uniform(0, .1) if hit else random.uniform(-2, 12)
+            probes.append((x, y + .05, z, .3 + random.uniform(0, .2)))
+        world = HeightMapWorld(heightmap, grid)
+        # The map returns the top itself, the grid y - distance: compare to rounding
+        wrong = 0
+        for p in probes:
+            a, b = world.probe_down(*p), grid.probe_down(*p)
+            wrong += (a is None) != (b is None) or (a is not None and (a[1] is not b[1] or abs(a[0] - b[0]) > 1e-9))
+        timings = {}
+        for name, target in (('grid', grid), ('heightmap', HeightMapWorld(heightmap, grid))):
+            start = time.perf_counter()
+            for _ in range(5):
+                for x, y, z, d in probes:
+                    target.probe_down(x, y, z, d)
+            timings[name] = (time.perf_counter() - start) / (5 * len(probes))
+        print(f'{label:>7}: {heightmap.nx}x{heightmap.nz} cells baked in {bake_ms:5.1f} ms, '
+              f'{heightmap.coverage:4.0%} exact | probes: grid {timings["grid"] * 1e6:5.2f} us, '
+              f'heightmap {timings["heightmap"] * 1e6:5.2f} us '
+              f'({world.answered / (world.answered + world.queries):4.0%} answered), {wrong} answers differ')
+
+    # Two minutes of a character walking the room: the same trail either way
+    grid = SpatialGrid(room)
+    heightmap = HeightMap.bake(room).bind(grid)
+    trails = []
+    worlds = (('grid + cache', GroundCache(grid)), ('heightmap', HeightMapWorld(heightmap, GroundCache(grid))))
+    for label, world in worlds:
+        controller = CharacterController(spawn_point=(0, 2, 0), radius=.5)
+        state, trail = CharacterState(6, 2, 6), []
+        start = time.perf_counter()
+        for i in range(60 * 120):
+            phase = (i // 120) % 4
+            state = controller.step(state, (0, 1, 0, -1)[phase] + .3, (1, 0, -1, 0)[phase], i % 90 == 0, 1 / 60, world)
+            trail.append((state.x, state.y, state.z))
+        elapsed = time.perf_counter() - start
+        inner = world.world if isinstance(world, HeightMapWorld) else world
+        print(f'{label:>15}: {elapsed / len(trail) * 1e6:5.2f} us/step, '
+              f'{inner.queries / 120:5.1f} grid queries/s')
+        trails.append(trail)
+    print(f'{"difference":>15}: {max(max(abs(a - b) for a, b in zip(p, q)) for p, q in zip(*trails)):.2e}')
@@ -0,0 +1,220 @@
+"""
+instancing.py — hardware-instanced props for the Ursina test levels.
+
+- One prototype model + N (position, yaw, scale, colour) rows -> ONE draw call
+- Per-instance data lives in a float buffer texture, so N is not capped by
+  uniform array size (Ursina's stock instancing_shader stops at 256)
+- Optional per-instance box/sphere colliders, all in one CollisionNode
+- instanced_billboard_shader draws the rows as camera-facing quads (lod.py impostors)
+"""
+
+from ursina import *
+from array import array
+import math
+
+from panda3d.core import Texture as PandaTexture
+from panda3d.core import GeomEnums, BoundingBox, Point3
+from panda3d.core import CollisionBox, CollisionSphere
+from ursina.collider import Collider
+
+
+# Floats per instance: (x, y, z, yaw) (sx, sy, sz, 0) (r, g, b, a)
+INSTANCE_STRIDE = 12
+
+
+instanced_prop_shader = Shader(name='instanced_prop_shader', language=Shader.GLSL, vertex='''
+#version 140
+
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform samplerBuffer instance_data;
+in vec4 p3d_Vertex;
+in vec2 p3d_MultiTexCoord0;
+out vec2 texcoords;
+out vec4 instance_color;
+
+void main() {
+    int base = gl_InstanceID * 3;
+    vec4 pos_yaw = texelFetch(instance_data, base);
+    vec3 scale = texelFetch(instance_data, base + 1).xyz;
+    instance_color = texelFetch(instance_data, base + 2);
+
+    // Ursina rotation_y: clockwise seen from above (+z turns towards +x)
+    vec3 v = p3d_Vertex.xyz * scale;
+    float c = cos(pos_yaw.w);
+    float s = sin(pos_yaw.w);
+    v = vec3(v.x * c + v.z * s, v.y, -v.x * s + v.z * c);
+
+    gl_Position = p3d_ModelViewProjectionMatrix * vec4(v + pos_yaw.xyz, 1.);
+    texcoords = p3d_MultiTexCoord0;
+}
+''',
+fragment='''
+#version 140
+
+uniform sampler2D p3d_Texture0;
+uniform vec4 p3d_ColorScale;
+in vec2 texcoords;
+in vec4 instance_color;
+out vec4 fragColor;
+
+void main() {
+    fragColor = texture(p3d_Texture0, texcoords) * p3d_ColorScale * instance_color;
+}
+''')
+
+
+# Camera-facing variant for impostor quads: the quad's x axis follows the
+# camera's horizontal right vector, y stays world-up (cylindrical billboard);
+# texels under half alpha are cut out
+instanced_billboard_shader = Shader(name='instanced_billboard_shader', language=Shader.GLSL, vertex='''
+#version 140
+
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat4 p3d_ModelViewMatrix;
+uniform samplerBuffer instance_data;
+in vec4 p3d_Vertex;
+in vec2 p3d_MultiTexCoord0;
+out vec2 texcoords;
+out vec4 instance_color;
+
+void main() {
+    int base = gl_InstanceID * 3;
+    vec4 pos_yaw = texelFetch(instance_data, base);
+    vec3 scale = texelFetch(instance_data, base + 1).xyz;
+    instance_color = texelFetch(instance_data, base + 2);
+
+    vec3 right = vec3(p3d_ModelViewMatrix[0][0], p3d_ModelViewMatrix[1][0], p3d_ModelViewMatrix[2][0]);
+    right = normalize(vec3(right.x, 0., right.z));
+    vec3 v = right * p3d_Vertex.x * scale.x + vec3(0., p3d_Vertex.y * scale.y, 0.);
+
+    gl_Position = p3d_ModelViewProjectionMatrix * vec4(v + pos_yaw.xyz, 1.);
+    texcoords = p3d_MultiTexCoord0;
+}
+''',
+fragment='''
+#version 140
+
+uniform sampler2D p3d_Texture0;
+uniform vec4 p3d_ColorScale;
+in vec2 texcoords;
+in vec4 instance_color;
+out vec4 fragColor;
+
+void main() {
+    vec4 c = texture(p3d_Texture0, texcoords) * p3d_ColorScale * instance_color;
+    if (c.a < .5) discard;
+    fragColor = c;
+}
+''')
+
+
+# =============================
+# INSTANCED PROPS
+# =============================
+def as_floats(c):
+    """Color -> 0..1 float tuple (accepts 0..1 or 0..255 channels)."""
+    r, g, b, a = c[0], c[1], c[2], c[3] if len(c) > 3 else 1
+    if max(r, g, b) > 1:
+        return r / 255, g / 255, b / 255, 1
+    return r, g, b, a
+
+
+class InstancedProps(Entity):
+    """Draws `model` once per row of positions/rotations_y/scales/colors in one
+    instanced draw call. Rows are ursina-style values:
+      positions   [(x, y, z), ...]
+      rotations_y [degrees, ...]                (default 0)
+      scales      [(sx, sy, sz) or s, ...]      (default 1)
+      colors      [color.rgb(...), ...]          (default white)
+    collider='box'/'sphere' adds one axis-aligned collision solid per instance,
+    fitted to the prototype's bounds, to this entity's single CollisionNode.
+    shader=instanced_billboard_shader turns every instance towards the camera.
+    """
+    def __init__(self, model, positions, rotations_y=None, scales=None, colors=None, collider=None,
+                 shader=instanced_prop_shader, **kwargs):
+        super().__init__(model=model, color=color.white, **kwargs)
+        self.instance_texture = PandaTexture('instance_data')
+        self.shader = shader
+        self.instance_count = 0
+        self.set_instances(positions, rotations_y, scales, colors)
+        self.collider_shape = collider
+        if collider:
+            self.collider = self._instance_collider(collider)
+
+    def set_instances(self, positions, rotations_y=None, scales=None, colors=None):
+        """Replaces all instances. Prefer set_instance_buffer() for per-frame updates."""
+        n = len(positions)
+        data = array('f')
+        self.positions = []
+        self.rotations_y = []
+        self.scales = []
+        self.colors = []
+        for i in range(n):
+            x, y, z = positions[i]
+            yaw = math.radians(rotations_y[i]) if rotations_y is not None else 0.0
+            s = scales[i] if scales is not None else 1
+            sx, sy, sz = (s, s, s) if isinstance(s, (int, float)) else s
+            r, g, b, a = as_floats(colors[i]) if colors is not None else (1, 1, 1, 1)
+            data.extend((x, y, z, yaw, sx, sy, sz, 0, r, g, b, a))
+            self.positions.append((x, y, z))
+            self.rotations_y.append(math.degrees(yaw))
+            self.scales.append((sx, sy, sz))
+            self.colors.append((r, g, b, a))
+        self.set_instance_buffer(data, n)
+
+    def set_instance_buffer(self, data, count, bounds=None):
+        """Uploads `count` rows of INSTANCE_STRIDE float32s (array('f'), bytes or
+        anything exposing the buffer protocol, e.g. a float32 NumPy array).
+        bounds=((x0, y0, z0), (x1, y1, z1)) skips the per-row bounds scan, for
+        callers that update every frame and can compute it faster.
+        `data` may hold more rows than `count` (only the first `count` are drawn):
+        the buffer texture is sized by the data, so callers whose count varies
+        can pad to a fixed capacity and skip reallocating it.
+        """
+        data = memoryview(data).cast('B')
+        rows = max(len(data) // (INSTANCE_STRIDE * 4), count, 1)
+        if self.instance_texture.get_x_size() != rows * 3:
+            self.instance_texture.setup_buffer_texture(rows * 3, PandaTexture.T_float,
+                                                       PandaTexture.F_rgba32, GeomEnums.UH_dynamic)
+            self.set_shader_input('instance_data', self.instance_texture)
+        self.instance_texture.set_ram_image(bytes(data).ljust(rows * INSTANCE_STRIDE * 4, b'\0'))
+        self.instance_count = count
+        self.setInstanceCount(count)
+        if bounds is not None:
+            self.node().set_bounds(BoundingBox(Point3(*bounds[0]), Point3(*bounds[1])))
+            self.node().set_final(True)
+        else:
+            self._update_bounds(data.cast('f'), count)
+
+    def _update_bounds(self, floats, count):
+        # Panda culls on the prototype's bounds; widen them to cover every instance
+        if not self.model or not count or not self.model.getTightBounds():
+            return
+        start, end = self.model.getTightBounds()
+        r = max(abs(start[0]), abs(start[1]), abs(start[2]), abs(end[0]), abs(end[1]), abs(end[2]))
+        lo = [math.inf] * 3
+        hi = [-math.inf] * 3
+        for i in range(count):
+            o = i * INSTANCE_STRIDE
+            reach = r * max(floats[o + 4], floats[o + 5], floats[o + 6])
+            for k in range(3):
+                lo[k] = min(lo[k], floats[o + k] - reach)
+                hi[k] = max(hi[k], floats[o + k] + reach)
+        self.node().set_bounds(BoundingBox(Point3(*lo), Point3(*hi)))
+        self.node().set_final(True)
+
+    def _instance_collider(self, shape):
+        # Axis-aligned per instance (yaw is ignored); unit cube if the model has no bounds
+        bounds = self.model.getTightBounds() if self.model else None
+        start, end = bounds if bounds else (Vec3(-.5, -.5, -.5), Vec3(.5, .5, .5))
+        center = (Vec3(start) + Vec3(end)) / 2
+        half = (Vec3(end) - Vec3(start)) / 2
+        solids = []
+        for p, s in zip(self.positions, self.scales):
+            s = Vec3(*s)
+            c = Vec3(*p) + Vec3(center.x * s.x, center.y * s.y, center.z * s.z)
+            if shape == 'sphere':
+                solids.append(CollisionSphere(c, max(half.x * s.x, half.y * s.y, half.z * s.z)))
+            else:
+                solids.append(CollisionBox(c, max(0.001, half.x * s.x), max(0.001, half.y * s.y), max(0.001, half.z * s.z)))
+        return Collider(self, solids)
@@ -0,0 +1,350 @@
+"""
+level.py — declarative level files with a compiled on-disk cache.
+
+- A level is a JSON file (levels/*.json) listing primitives: model, texture,
+  colour, transform and collider type, plus instanced groups
+  (instancing.InstancedProps rows, with optional "lod" switch distances for
+  lod.LODProps)
+- load_level() compiles a level once into a flattened, palette-textured
+  (palette.py) Panda3D .bam plus a collider table of shapes.py shapes, keyed
+  by the file's content hash; later loads read only the cache and build no
+  per-entity Python objects
+- Cached colliders go to colliders.analytic_colliders, so raycast() sees them
+  straight away and build_static_grid() indexes them
+- `python level.py export` regenerates levels/*.json from the scene scripts'
+  create_* functions; `python level.py` reports cold and warm startup
+"""
+
+from ursina import *
+from panda3d.core import Filename
+import hashlib
+import json
+
+import shapes
+import colliders
+import primitives
+from instancing import InstancedProps, as_floats
+from lod import LODProps
+from meshgen import checker_texture
+from freeze import merge_geometry
+
+
+# Bump when the record layout or the compiled output changes
+FORMAT_VERSION = 1
+# Bump when compile_level()'s output changes for the same level file
+COMPILER_VERSION = 4
+
+LEVEL_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels')
+
+
+# =============================
+# RECORDS
+# =============================
+def _r(values):
+    return [round(float(v), 4) for v in values]
+
+
+def _texture_record(texture):
+    if not texture:
+        return None
+    checker = getattr(texture, 'checker', None)
+    if checker:
+        grid, a, b = checker
+        return {'checker': grid, 'colors': [list(a), list(b)]}
+    return os.path.splitext(texture.name)[0]
+
+
+def _texture(record):
+    if isinstance(record, dict):
+        a, b = record['colors']
+        return checker_texture(record['checker'], tuple(a), tuple(b))
+    return record
+
+
+def entity_record(entity):
+    """JSON-ready description of a static entity (world-space transform)."""
+    record = {'model': str(entity.model.name).split('.')[0]}
+    texture = _texture_record(entity.texture)
+    if texture:
+        record['texture'] = texture
+    if tuple(entity.color) != (1, 1, 1, 1):
+        record['color'] = _r(as_floats(entity.color))
+    record['position'] = _r(entity.world_position)
+    if any(entity.world_rotation):
+        record['rotation'] = _r(entity.world_rotation)
+    record['scale'] = _r(entity.world_scale)
+    if entity.collider:
+        record['collider'] = entity.collider.name
+    return record
+
+
+def instanced_record(props):
+    record = {'model': str(props.model.name).split('.')[0]}
+    texture = _texture_record(props.texture)
+    if texture:
+        record['texture'] = texture
+    record['positions'] = [_r(p) for p in props.positions]
+    if any(props.rotations_y):
+        record['rotations_y'] = _r(props.rotations_y)
+    record['scales'] = [_r(s) for s in props.scales]
+    record['colors'] = [_r(c) for c in props.colors]
+    if props.collider_shape:
+        record['collider'] = props.collider_shape
+    if isinstance(props, LODProps):
+        record['lod'] = list(props.distances)
+    return record
+
+
+def capture(build, *args, **kwargs):
+    """Runs build() and returns the entities it created, in creation order."""
+    before = set(id(e) for e in scene.entities)
+    build(*args, **kwargs)
+    return [e for e in scene.entities if id(e) not in before]
+
+
+def save_level(path, entities, name=None):
+    """Writes `entities` (Entity / InstancedProps with a model) as a level file,
+    one record per line.
+    """
+    static, instanced = [], []
+    for e in entities:
+        if not e.model or isinstance(e.parent, LODProps):   # LOD levels are rebuilt on load
+            continue
+        if isinstance(e, InstancedProps):
+            instanced.append(instanced_record(e))
+        else:
+            static.append(entity_record(e))
+
+    def block(records):
+        return ',\n'.join('    ' + json.dumps(r, separators=(', ', ': ')) for r in records)
+
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    with open(path, 'w') as f:
+        f.write(f'{{\n  "format": {FORMAT_VERSION},\n  "name": {json.dumps(name)},\n'
+                f'  "entities": [\n{block(static)}\n  ],\n  "instanced": [\n{block(instanced)}\n  ]\n}}\n')
+    return path
+
+
+# =============================
+# BUILD / COMPILE
+# =============================
+def build_entities(data, parent=scene):
+    """Constructs every record as a live Entity (the uncached path).
+    Cylinders, cones and spheres share primitives.py meshes tessellated for
+    their size. Returns (entities, instanced_props).
+    """
+    primitives.install()
+    entities = []
+    for r in data['entities']:
+        entities.append(Entity(
+            parent=parent,
+            model=primitives.tessellated(r['model'], r['scale']),
+            texture=_texture(r.get('texture')),
+            color=Color(*r.get('color', (1, 1, 1, 1))),
+            position=r['position'],
+            rotation=r.get('rotation', (0, 0, 0)),
+            scale=r['scale'],
+            collider=r.get('collider'),
+        ))
+    props = [_build_instanced(r, parent, r.get('collider')) for r in data['instanced']]
+    return entities, props
+
+
+def _build_instanced(record, parent, collider, model=None):
+    lod = {'distances': record['lod'], 'model_name': record['model']} if 'lod' in record else {}
+    largest = [max(s[axis] for s in record['scales']) for axis in range(3)] if record['scales'] else (1, 1, 1)
+    return (LODProps if lod else InstancedProps)(
+        model=model or primitives.tessellated(record['model'], largest),
+        texture=_texture(record.get('texture')),
+        positions=record['positions'],
+        rotations_y=record.get('rotations_y'),
+        scales=record['scales'],
+        colors=record['colors'],
+        collider=collider,
+        parent=parent,
+        **lod
+    )
+
+
+def _shape_record(shape):
+    return [type(shape).__name__, _r(shape.position), _r(shape.scale)]
+
+
+def compile_level(data, bam_path, table_path):
+    """Builds the level once, flattens its static geometry into bam_path and
+    writes the collider table (plus what can't be baked) to table_path.
+    """
+    staging = Entity(name='level_staging')
+    entities, props = build_entities(data, parent=staging)
+
+    table = {'shapes': [], 'fallback': [], 'instanced': []}
+    for e, record in zip(entities, data['entities']):
+        found = colliders.collider_shapes(e)
+        if found:
+            table['shapes'].extend(_shape_record(s) for s in found)
+        elif e.collider:
+            table['fallback'].append(record)    # e.g. rotated: stays a Panda3D collider
+    for p, record in zip(props, data['instanced']):
+        found = colliders.collider_shapes(p)
+        if found:
+            table['shapes'].extend(_shape_record(s) for s in found)
+        elif p.collider:
+            table['fallback'].append(record)
+        table['instanced'].append({k: v for k, v in record.items() if k != 'collider'})
+
+    # Plain entities are flattened together; instanced groups keep their own
+    # shader, so only their prototype meshes are stored (skips re-parsing them)
+    for p in props:
+        p.detachNode()
+    baked = NodePath('level')
+    merge_geometry(staging.copyTo(baked))
+    prototypes = baked.attachNewNode('prototypes')
+    for p in props:
+        (p.model or NodePath(p.name)).copyTo(prototypes)   # keep one child per group
+    baked.writeBamFile(Filename.fromOsSpecific(bam_path))
+    destroy(staging)
+    for p in props:
+        destroy(p)
+
+    with open(table_path, 'w') as f:
+        json.dump(table, f)
+    return table
+
+
+# =============================
+# LOAD
+# =============================
+def level_hash(source):
+    return hashlib.sha1(f'level{FORMAT_VERSION}.{COMPILER_VERSION}:'.encode() + source).hexdigest()[:16]
+
+
+def load_level(path, cache_folder=None, use_colliders=True, verbose=False):
+    """Loads a level file through the compiled cache and returns its root Entity.
+    root.cache_hit tells whether the cache was warm, root.load_time is in seconds;
+    root.cache_key / root.cache_folder let derived caches (bake.py) sit alongside.
+    use_colliders=False skips the collider table (viewers); verbose prints the
+    load time.
+    """
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        source = f.read()
+    cache_folder = cache_folder or os.path.join(os.path.dirname(os.path.abspath(path)), '.cache')
+    key = level_hash(source)
+    bam_path = os.path.join(cache_folder, key + '.bam')
+    table_path = os.path.join(cache_folder, key + '.json')
+
+    cache_hit = os.path.isfile(bam_path) and os.path.isfile(table_path)
+    if cache_hit:
+        with open(table_path) as f:
+            table = json.load(f)
+    else:
+        data = json.loads(source)
+        if data.get('format') != FORMAT_VERSION:
+            raise ValueError(f'{path}: level format {data.get("format")}, expected {FORMAT_VERSION}')
+        os.makedirs(cache_folder, exist_ok=True)
+        table = compile_level(data, bam_path, table_path)
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    baked = loader.loadModel(Filename.fromOsSpecific(bam_path))
+    prototypes = baked.find('prototypes')
+    prototypes.detachNode()
+    root = Entity(name=name, model=baked)
+    for record, model in zip(table['instanced'], prototypes.getChildren()):
+        _build_instanced(record, root, None, model)
+    if use_colliders:
+        for kind, position, scale in table['shapes']:
+            colliders.analytic_colliders.append((root, getattr(shapes, kind)(position, scale)))
+        for record in table['fallback']:
+            if 'positions' in record:
+                record = {k: v for k, v in record.items() if k != 'lod'}
+                _build_instanced(record, root, record['collider']).visible = False
+            else:
+                Entity(parent=root, model=record['model'], position=record['position'],
+                       rotation=record.get('rotation', (0, 0, 0)), scale=record['scale'],
+                       collider=record['collider'], visible=False)
+
+    root.cache_hit = cache_hit
+    root.cache_key, root.cache_folder = key, cache_folder
+    root.load_time = time.perf_counter() - start
+    if verbose:
+        print(f'level {name}: {"warm" if cache_hit else "cold"} load in {root.load_time * 1000:.1f} ms')
+    return root
+
+
+# =============================
+# EXPORT / BENCHMARK
+# =============================
+def _load_script(filename):
+    import importlib.util
+    here = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location(os.path.splitext(filename)[0].replace('.', '_'), os.path.join(here, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def level_builders():
+    """{level name: function building it as live entities} from the scene scripts'
+    create_* functions (what export_levels() captures and audit.py measures).
+    """
+    castle = _load_script('physcis4k.py')
+    indoor = _load_script('3x1.0.py')
+    simple = _load_script('floor0a.py')
+
+    def castle_grounds():
+        Entity(model='plane', texture='white_cube', color=color.green, scale=(100, 1, 100),
+               position=(0, -1, 0), collider='mesh', static=True)
+        castle.create_peach_castle()
+        castle.create_surroundings()
+
+    def indoor_hall():
+        indoor.create_indoor_environment()
+        indoor.create_furniture()
+
+    def simple_room():
+        simple.create_indoor_environment()
+        simple.create_furniture()
+
+    return {'peach_castle': castle_grounds, 'indoor_hall': indoor_hall, 'simple_room': simple_room}
+
+
+def export_levels():
+    """Regenerates levels/*.json from the Python level builders."""
+    os.makedirs(LEVEL_FOLDER, exist_ok=True)
+    for name, build in level_builders().items():
+        entities = capture(build)
+        path = save_level(os.path.join(LEVEL_FOLDER, name + '.json'), entities, name)
+        print(f'wrote {path} ({len(entities)} entities)')
+        for e in entities:
+            destroy(e)
+
+
+if __name__ == '__main__':
+    import subprocess
+    import sys
+    import tempfile
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'export':
+        app = Ursina(window_type='none')
+        primitives.install()     # Newer Ursina releases ship no 'cylinder'/'cone' model files
+        export_levels()
+
+    elif len(sys.argv) > 2 and sys.argv[1] == 'load':
+        # One startup: python + ursina import, window, level load
+        started = float(sys.argv[4])
+        app = Ursina(window_type='none')
+        root = load_level(sys.argv[2], cache_folder=sys.argv[3])
+        app.step()
+        print(f'RESULT {root.load_time * 1000:.1f} {(time.time() - started) * 1000:.1f} '
+              f'{len(colliders.analytic_colliders)}')
+
+    else:
+        cache = tempfile.mkdtemp(prefix='levelcache')
+        print(f'{"level":>14} {"":>5} | {"load_level":>10} {"startup":>9}  (ms)')
+        for name in ('peach_castle', 'indoor_hall', 'simple_room'):
+            path = os.path.join(LEVEL_FOLDER, name + '.json')
+            for label in ('cold', 'warm', 'warm'):
+                out = subprocess.run([sys.executable, __file__, 'load', path, cache, str(time.time())],
+                                     capture_output=True, text=True).stdout
+                load_ms, startup_ms, shape_count = next(l for l in out.splitlines() if l.startswith('RESULT')).split()[1:]
+                print(f'{name:>14} {label:>5} | {float(load_ms):>10.1f} {float(startup_ms):>9.1f}  ({shape_count} collider shapes)')
@@ -0,0 +1,251 @@
+"""
+lod.py — distance-based levels of detail for instanced props.
+
+- LODProps is an InstancedProps whose rows are split by distance from `camera`
+  into up to three levels: the full prototype, a low-poly stand-in
+  (low_detail_model) and a camera-facing impostor quad
+- Impostor textures come from rendering the prototype once into an offscreen
+  buffer (render_impostor), shared per model / texture
+- A row only changes level once its distance is past the threshold by
+  `hysteresis` (a fraction of it), so props don't flicker at the boundary
+- Each level is one draw call; a level's buffer is uploaded again only when
+  rows enter or leave it
+- Run this file to benchmark 2000 trees ringing the castle with and without LOD
+"""
+
+from ursina import *
+from panda3d.core import FrameBufferProperties, OrthographicLens, Camera as PandaCamera
+from panda3d.core import Texture as PandaTexture
+import numpy as np
+
+from instancing import InstancedProps, INSTANCE_STRIDE, instanced_billboard_shader
+from primitives import shape_of, primitive_model
+
+
+# =============================
+# LEVEL MODELS
+# =============================
+def low_detail_model(name):
+    """Low-poly stand-in for a builtin primitive (8 segments, sharing
+    primitives.py's vertex data), or None (e.g. 'cube', which is already as
+    cheap as it gets).
+    """
+    shape = shape_of(name)
+    return primitive_model(shape, 8) if shape else None
+
+
+_impostors = {}
+
+
+def render_impostor(model, texture=None, size=128, key=None):
+    """Renders `model` (front view, white, unlit) into a size x size RGBA texture
+    once and returns (Texture, quad Mesh); the quad spans the model's width and
+    height so instance scales carry over. None without a window to render with
+    or without geometry.
+    """
+    key = key or model
+    texture_name = getattr(texture, 'name', texture)
+    if (key, texture_name, size) in _impostors:
+        return _impostors[key, texture_name, size]
+    base = application.base
+    if not base or not getattr(base, 'win', None) or not model:
+        return None
+
+    stage = NodePath('impostor_stage')
+    prop = model.copyTo(stage)
+    if not prop.getTightBounds():      # nothing to draw
+        stage.removeNode()
+        return None
+    prop.clearShader()
+    prop.setColor(1, 1, 1, 1, 1)
+    prop.setLightOff(1)
+    if texture:
+        prop.setTexture(texture._texture, 1)
+    lo, hi = prop.getTightBounds()
+    width = max(hi.x - lo.x, hi.z - lo.z)
+    height = hi.y - lo.y
+    center = (lo + hi) / 2
+
+    lens = OrthographicLens()
+    lens.setFilmSize(width, height)
+    lens.setNearFar(.01, (hi.z - lo.z) + 2)
+    eye = stage.attachNewNode(PandaCamera('impostor_camera', lens))
+    eye.setPos(center.x, center.y, lo.z - 1)
+    eye.lookAt(Vec3(center.x, center.y, hi.z), Vec3(0, 1, 0))
+
+    properties = FrameBufferProperties()
+    properties.setRgbaBits(8, 8, 8, 8)
+    properties.setDepthBits(16)
+    image = PandaTexture('impostor')
+    buffer = base.win.makeTextureBuffer('impostor', size, size, image, True, properties)
+    buffer.setClearColor((0, 0, 0, 0))
+    buffer.setClearColorActive(True)
+    buffer.makeDisplayRegion().setCamera(eye)
+    base.graphicsEngine.renderFrame()
+    base.graphicsEngine.renderFrame()     # the RAM copy lands on the next sync
+    base.graphicsEngine.removeWindow(buffer)
+    stage.removeNode()
+
+    x0, x1 = center.x - width / 2, center.x + width / 2
+    quad = Mesh(vertices=[(x0, lo.y, 0), (x1, lo.y, 0), (x1, hi.y, 0), (x0, hi.y, 0)],
+                triangles=[(0, 1, 2), (0, 2, 3)], uvs=[(0, 0), (1, 0), (1, 1), (0, 1)])
+    result = _impostors[key, texture_name, size] = Texture(image), quad
+    return result
+
+
+# =============================
+# LOD PROPS
+# =============================
+class LODProps(InstancedProps):
+    """InstancedProps drawn at up to three levels of detail. `distances` are the
+    switch distances (full -> low poly, low poly -> impostor). A model without a
+    low-poly stand-in goes straight to the impostor at the last distance; without
+    a window (no impostor) the low-poly level is the farthest.
+    The full row set (positions, scales, colliders) stays on this entity; it
+    draws the near rows itself and owns one child InstancedProps per other level.
+    """
+    def __init__(self, model, positions, distances=(40, 90), hysteresis=.1, impostor=True,
+                 model_name=None, impostor_size=128, refresh_distance=.5, **kwargs):
+        super().__init__(model, positions, **kwargs)
+        self.distances = tuple(distances)
+        self.hysteresis = hysteresis
+        self.refresh_distance = refresh_distance
+        self.model_name = model_name or (model if isinstance(model, str) else str(self.model.name).split('.')[0])
+
+        self.levels = [self]
+        thresholds = []
+        low = low_detail_model(self.model_name)
+        if low and self.distances:
+            self.levels.append(InstancedProps(low, [], texture=self.texture, parent=self, name=f'{self.name}_low'))
+            thresholds.append(self.distances[0])
+        billboard = render_impostor(self.model, self.texture, impostor_size, key=self.model_name) if impostor else None
+        if billboard and self.distances:
+            texture, quad = billboard
+            self.levels.append(InstancedProps(quad, [], texture=texture, shader=instanced_billboard_shader,
+                                              double_sided=True, parent=self, name=f'{self.name}_impostor'))
+            thresholds.append(self.distances[-1])
+        self.thresholds = np.array(thresholds, dtype=np.float32)
+        self.refresh(force=True)
+
+    def set_instances(self, positions, rotations_y=None, scales=None, colors=None):
+        super().set_instances(positions, rotations_y, scales, colors)
+        n = len(self.positions)
+        rows = np.zeros((n, INSTANCE_STRIDE), dtype=np.float32)
+        if n:
+            rows[:, 0:3] = self.positions
+            rows[:, 3] = np.radians(self.rotations_y)
+            rows[:, 4:7] = self.scales
+            rows[:, 8:12] = self.colors
+        self._rows = rows
+        self._staging = np.zeros_like(rows)
+        bounds = self.model.getTightBounds() if self.model else None
+        radius = max(max(abs(v) for v in bounds[0]), max(abs(v) for v in bounds[1])) if bounds else .5
+        self._reach = rows[:, 4:7].max(axis=1) * radius if n else np.zeros(0, dtype=np.float32)
+        self.level = np.full(n, -1, dtype=np.int8)
+        self._eye = None
+        if hasattr(self, 'thresholds'):
+            self.refresh(force=True)
+
+    def counts(self):
+        """Rows drawn at each level, nearest first."""
+        return [int(np.count_nonzero(self.level == i)) for i in range(len(self.levels))]
+
+    def refresh(self, force=False):
+        """Re-buckets rows against the camera; cheap when the camera hasn't moved."""
+        eye = camera.world_position
+        eye = np.array((eye.x, eye.y, eye.z), dtype=np.float32)
+        if not force and self._eye is not None and np.abs(eye - self._eye).max() < self.refresh_distance:
+            return
+        self._eye = eye
+
+        distance = np.sqrt(((self._rows[:, :3] - eye) ** 2).sum(axis=1))
+        finest = np.searchsorted(self.thresholds * (1 + self.hysteresis), distance, side='right')
+        coarsest = np.searchsorted(self.thresholds * (1 - self.hysteresis), distance, side='right')
+        level = np.where(self.level < 0, np.searchsorted(self.thresholds, distance, side='right'),
+                         np.clip(self.level, finest, coarsest)).astype(np.int8)
+        changed = level != self.level
+        if not force and not changed.any():
+            return
+        touched = range(len(self.levels)) if force else np.union1d(self.level[changed], level[changed])
+        self.level = level
+        for i in touched:
+            self._upload(int(i))
+
+    def _upload(self, i):
+        # Every level's buffer holds all rows (the tail is unused), so a level
+        # gaining or losing rows never reallocates its buffer texture
+        mask = self.level == i
+        count = int(np.count_nonzero(mask))
+        self._staging[:count] = self._rows[mask]
+        bounds = None
+        if count:
+            rows, reach = self._staging[:count], self._reach[mask][:, None]
+            bounds = (tuple((rows[:, :3] - reach).min(axis=0)), tuple((rows[:, :3] + reach).max(axis=0)))
+        self.levels[i].set_instance_buffer(self._staging, count, bounds=bounds)
+        # An empty level would still be submitted; hide its model (not the
+        # entity, which for level 0 also parents the other levels)
+        if self.levels[i].model:
+            self.levels[i].model.show() if count else self.levels[i].model.hide()
+
+    def update(self):
+        self.refresh()
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import importlib.util
+    import sys
+    import time as _time
+    from panda3d.core import loadPrcFileData, Filename
+    from primitives import install
+
+    # Offscreen through EGL (Mesa runs it in software when there's no GPU);
+    # gl-finish makes each frame's time include finishing its rendering
+    loadPrcFileData('lod', 'load-display p3headlessgl\naux-display p3tinydisplay\nsync-video false\ngl-finish true')
+    app = Ursina(window_type='offscreen', size=(960, 540), development_mode=False)
+    install()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location('castle', os.path.join(here, 'physcis4k.py'))
+    castle = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(castle)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    trees = castle.tree_ring_positions(count)
+    Entity(model='plane', texture='white_cube', color=color.green, scale=(400, 1, 400), y=-1)
+    castle.create_peach_castle()
+
+    def forest(props_type, **kwargs):
+        return [
+            props_type('cylinder', [(x, 1.5, z) for x, z in trees], scales=[(1, 3, 1)] * count,
+                       colors=[color.rgb(101, 67, 33)] * count, **kwargs),
+            props_type('sphere', [(x, 4, z) for x, z in trees], scales=[(3, 3, 3)] * count,
+                       colors=[color.green] * count, **kwargs),
+        ]
+
+    def run(label, groups, frames=240, warmup=20):
+        # Orbit between the castle and the first ring at Mario height, looking out over the trees
+        times = []
+        for frame in range(-warmup, frames):
+            angle = frame / frames * 2 * math.pi
+            camera.position = (25 * math.sin(angle), 3, 25 * math.cos(angle))
+            camera.rotation = (5, math.degrees(angle), 0)
+            start = _time.perf_counter()
+            app.step()
+            if frame >= 0:
+                times.append((_time.perf_counter() - start) * 1000)
+        if len(sys.argv) > 2:
+            app.win.saveScreenshot(Filename.fromOsSpecific(f'{sys.argv[2]}_{label}.png'))
+        times.sort()
+        levels = ''
+        if isinstance(groups[0], LODProps):
+            levels = ', rows per level ' + ' / '.join(str(sum(g.counts()[i] for g in groups if i < len(g.levels)))
+                                                       for i in range(3))
+        print(f'{label:>6}: {count} trees, mean {sum(times) / len(times):6.2f} ms, '
+              f'p50 {times[len(times) // 2]:6.2f} ms, p99 {times[int(len(times) * .99)]:6.2f} ms{levels}')
+        for g in groups:
+            destroy(g)
+
+    run('full', forest(InstancedProps))
+    run('lod', forest(LODProps, distances=(40, 90)))
@@ -0,0 +1,104 @@
+"""
+meshgen.py — generated geometry shared by the Ursina test levels.
+
+- Checkered floor as ONE entity / ONE draw call for any grid size
+  (a plane with a generated 1-texel-per-tile checker texture)
+- Low-poly UV sphere matching the builtin 'sphere' (radius .5, centred), for
+  distant levels of detail
+"""
+
+from ursina import *
+from PIL import Image
+import math
+
+
+# =============================
+# CHECKER FLOOR
+# =============================
+_checker_textures = {}
+
+
+def _rgba32(c):
+    """Color -> 0..255 RGBA tuple (accepts 0..1 or 0..255 channels)."""
+    r, g, b, a = c[0], c[1], c[2], c[3]
+    if max(r, g, b) > 1:
+        return int(r), int(g), int(b), 255
+    return int(round(r * 255)), int(round(g * 255)), int(round(b * 255)), int(round(a * 255))
+
+
+def checker_texture(grid, color_a=color.rgb(30, 30, 30), color_b=color.rgb(240, 240, 240)):
+    """Returns a grid x grid Texture with one texel per tile.
+    Tile (gx, gz) uses color_a when (gx + gz) is even, like the old per-tile loop.
+    Textures are cached per (grid, colors) so rebuilding a room is free.
+    """
+    key = (grid, tuple(color_a), tuple(color_b))
+    if key in _checker_textures:
+        return _checker_textures[key]
+
+    a = _rgba32(color_a)
+    b = _rgba32(color_b)
+    image = Image.new('RGBA', (grid, grid))
+    pixels = image.load()
+    for gx in range(grid):
+        for gz in range(grid):
+            # PIL rows run top-down, texture v runs bottom-up (v = z + 0.5 on 'plane')
+            pixels[gx, grid - 1 - gz] = a if (gx + gz) % 2 == 0 else b
+
+    texture = Texture(image)
+    texture.filtering = None   # nearest: crisp tile edges
+    texture.checker = grid, a, b   # lets level.py save it by recipe
+    _checker_textures[key] = texture
+    return texture
+
+
+def create_checker_floor(size, grid, y=0.01, color_a=color.rgb(30, 30, 30), color_b=color.rgb(240, 240, 240), **kwargs):
+    """Creates a size x size checkered floor centered on the origin.
+    Node and draw-call count is 1 regardless of grid (12x12 and 256x256 cost the same);
+    only the texture grows, at 4 bytes per tile.
+    """
+    return Entity(
+        model='plane',
+        texture=checker_texture(grid, color_a, color_b),
+        color=color.white,
+        scale=(size, 1, size),
+        position=(0, y, 0),
+        collider=None,
+        **kwargs
+    )
+
+
+# =============================
+# LOW-POLY SPHERE
+# =============================
+_spheres = {}
+
+
+def low_poly_sphere(rings=6, segments=8):
+    """UV sphere with the builtin 'sphere' model's size (radius .5, centred).
+    The default is 96 vertices against the builtin's 2880. Meshes are shared
+    per (rings, segments).
+    """
+    key = rings, segments
+    if key in _spheres:
+        return _spheres[key]
+
+    vertices, uvs, triangles = [], [], []
+    for ring in range(rings + 1):
+        v = ring / rings
+        y = -.5 * math.cos(v * math.pi)
+        r = .5 * math.sin(v * math.pi)
+        for segment in range(segments + 1):
+            u = segment / segments
+            vertices.append(Vec3(r * math.sin(u * 2 * math.pi), y, r * math.cos(u * 2 * math.pi)))
+            uvs.append((u, v))
+    row = segments + 1
+    for ring in range(rings):
+        for segment in range(segments):
+            a = ring * row + segment
+            b = a + row
+            triangles.extend((a, b, a + 1, a + 1, b, b + 1))
+
+    mesh = Mesh(vertices=vertices, triangles=triangles, uvs=uvs)
+    mesh.name = f'low_poly_sphere_{rings}x{segments}'
+    _spheres[key] = mesh
+    return mesh
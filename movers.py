@@ -0,0 +1,128 @@
+"""
+movers.py — draws and runs a platforms.PlatformSystem in Ursina.
+
+- Movers steps the platforms at a fixed rate (fixedstep.py) in its update()
+  and draws them with one instancing.InstancedProps per shape ('cube' boxes,
+  'cylinder' turntables): hundreds of platforms are two draw calls and one
+  vectorized tick, with no Entity (or update()) per platform
+- Each frame is drawn between the last two ticks, like Mario, so a rider and
+  its platform stay together
+- The shapes go into colliders.static_grid as this Entity's (make it after
+  build_static_grid(), which starts a new grid); probes and raycasts see them
+  there and get the platform's velocity back
+- run_on(thread) hands the ticks to a simthread.SimulationThread instead (the
+  Mario scenes' PHYSICS_THREAD), drawing from its published snapshot
+- Run this file for a demo of a few hundred platforms
+"""
+
+from ursina import *
+import numpy as np
+import time as _time
+
+import colliders
+import primitives
+from fixedstep import FixedTimestep
+from instancing import InstancedProps, INSTANCE_STRIDE, as_floats
+
+
+class Movers(Entity):
+    """`system` is a PlatformSystem (made without a grid) with its platforms
+    added; `colors` one colour for all or one per platform.
+    """
+    def __init__(self, system, colors=color.light_gray, physics_rate=120, max_substeps=8, **kwargs):
+        super().__init__(**kwargs)
+        self.system = system
+        colliders.add_static_shapes(self, system.shapes)
+        system.grid = colliders.static_grid
+        self.clock = FixedTimestep(rate=physics_rate, max_substeps=max_substeps)
+        self.sim_thread = None
+
+        n = len(system)
+        colors = colors if isinstance(colors, (list, tuple)) and len(colors) == n else [colors] * n
+        self._groups = []       # (InstancedProps, platform indices, float32 rows, round)
+        primitives.install()    # Ursina ships no 'cylinder' model (a warm level load never installs it)
+        for model, round_ in (('cube', False), ('cylinder', True)):
+            indices = np.array([i for i, s in enumerate(system.shapes) if (s.kind == 'cylinder') == round_],
+                               dtype=np.int64)
+            if not len(indices):
+                continue
+            rows = np.zeros((len(indices), INSTANCE_STRIDE), dtype=np.float32)
+            rows[:, 8:12] = [as_floats(colors[i]) for i in indices]
+            self._groups.append((InstancedProps(model, [], parent=self), indices, rows, round_))
+        self._upload(1.0)
+
+    def run_on(self, thread):
+        """Ticks on `thread` from now on (add before the riders' systems)."""
+        self.sim_thread = thread
+        thread.add(self.system)
+
+    def reset(self):
+        """Platforms back at time 0 with a fresh clock (replay.py)."""
+        self.system.reset()
+        self.clock = FixedTimestep(rate=self.clock.rate, max_substeps=self.clock.max_substeps)
+        self._upload(1.0)
+
+    def _upload(self, alpha):
+        system = self.system
+        if system.snapshot is None:
+            system.pack()
+        _, snapshot = system.snapshot.read()
+        n = len(system)
+        at, dt = snapshot[0, :2]
+        if alpha is None:
+            alpha = min(1.0, max(0.0, (_time.perf_counter() - at) / dt)) if dt else 1.0
+        previous, current = snapshot[1:n + 1], snapshot[n + 1:]
+        centers = previous[:, :3] + (current[:, :3] - previous[:, :3]) * alpha
+        yaw = previous[:, 3] + ((current[:, 3] - previous[:, 3] + 180) % 360 - 180) * alpha
+        size = system.size
+        for props, indices, rows, round_ in self._groups:
+            rows[:, :3] = centers[indices]
+            if round_:
+                rows[:, 1] -= size[indices, 1] / 2      # cylinders stand on their base
+            rows[:, 3] = np.radians(yaw[indices])
+            rows[:, 4:7] = size[indices]
+            reach = size[indices].max(axis=1, keepdims=True)
+            bounds = ((centers[indices] - reach).min(axis=0), (centers[indices] + reach).max(axis=0))
+            props.set_instance_buffer(rows, len(indices), bounds=bounds)
+
+    def update(self):
+        if self.sim_thread:
+            self._upload(None)
+            return
+        for _ in range(self.clock.advance(time.dt)):
+            self.system.tick(self.clock.dt)
+        self._upload(self.clock.alpha)
+
+    def on_destroy(self):
+        colliders.remove_static_shapes(self)
+
+
+# =============================
+# DEMO
+# =============================
+if __name__ == '__main__':
+    from platforms import PlatformSystem
+
+    app = Ursina()
+    window.color = color.rgb(40, 40, 48)
+    Entity(model='cube', scale=(80, 1, 80), position=(0, -.5, 0), color=color.rgb(90, 90, 100), collider='box')
+    colliders.build_static_grid()
+
+    system = PlatformSystem()
+    palette = [color.rgb(230, 120, 60), color.rgb(80, 160, 230), color.rgb(120, 200, 90)]
+    colors = []
+    for i in range(300):
+        x, z = (i % 20) * 3.5 - 33, (i // 20) * 4.5 - 33
+        if i % 3 == 0:
+            system.add((x, 2, z), size=(2.5, .4, 2.5), amplitude=(0, 1.5, 0), frequency=.2, phase=i * .3)
+        elif i % 3 == 1:
+            system.add((x, 3, z), size=(2.5, .4, 2.5), path=((0, 0, 0), (0, 0, 3)), speed=1.5)
+        else:
+            system.add((x, 1, z), size=(3, .3, 3), shape='cylinder', spin=40)
+        colors.append(palette[i % 3])
+    Movers(system, colors=colors)
+
+    Text(text='300 platforms, two draw calls', position=(-.85, .45), scale=1.2)
+    EditorCamera(rotation=(35, 0, 0))
+    camera.position = (0, 0, -70)
+    app.run()
@@ -0,0 +1,241 @@
+"""
+palette.py — one palette / atlas texture for a level's flat-coloured props.
+
+- palettize(node) gives every vertex colour of a flattened level (optionally
+  times a small texture such as white_cube) a tile in one shared RGBA atlas,
+  moves the UVs into it and turns the vertex colour white. Geoms that differed
+  only by colour or texture then share one render state, and flattenStrong()
+  merges them
+- A flat colour gets a single texel; a textured colour gets a tinted copy of
+  the texture. Tiles have a 1-texel edge gutter and the atlas is sampled
+  nearest, like Ursina's default filtering, so tiles never bleed
+- UVs outside 0..1 are clamped into the tile (cylinder caps and cube seams
+  hang over by up to half a tile, where a tinted white_cube is flat anyway);
+  textures larger than MAX_TILE or without a RAM image keep their own state
+- render_states(node) counts the distinct states a node's Geoms switch between
+- Run this file to see render states and Geoms per level with and without it
+"""
+
+from ursina import *
+from panda3d.core import GeomVertexReader, GeomVertexWriter, GeomVertexArrayFormat, GeomVertexFormat, GeomVertexData, Geom
+from panda3d.core import GeomNode, SceneGraphReducer, ColorAttrib, ColorScaleAttrib, TextureAttrib, RenderModeAttrib, SamplerState
+from panda3d.core import Texture as PandaTexture
+import numpy as np
+
+
+MAX_TILE = 128      # larger textures keep their own state
+GUTTER = 1
+
+
+# =============================
+# STATES
+# =============================
+def render_states(node):
+    """(geoms, distinct net render states) under node: each distinct state is
+    a state change per frame when they're drawn.
+    """
+    states, geoms = set(), 0
+    for geom_np in [node, *node.findAllMatches('**/+GeomNode')]:
+        if not isinstance(geom_np.node(), GeomNode):
+            continue
+        net = geom_np.getNetState()
+        for i in range(geom_np.node().getNumGeoms()):
+            states.add(net.compose(geom_np.node().getGeomState(i)))
+            geoms += 1
+    return geoms, len(states)
+
+
+# =============================
+# ATLAS
+# =============================
+def _texture_pixels(texture):
+    """(h, w, 4) uint8 rows bottom-up, or None without a RAM image (one loaded
+    from disk is read back even after its upload to the GPU dropped it).
+    """
+    if not texture.mightHaveRamImage():
+        return None
+    w, h = texture.getXSize(), texture.getYSize()
+    data = texture.getRamImageAs('RGBA')
+    return np.frombuffer(bytes(data), dtype=np.uint8).reshape(h, w, 4)
+
+
+class PaletteAtlas:
+    """Collects (texture, colour) tiles, then packs them into one texture."""
+    def __init__(self):
+        self.tiles = {}         # key -> (h, w, 4) uint8 image
+        self.rects = {}         # key -> (u0, v0, u1, v1), after pack()
+        self.texture = None
+
+    def add(self, texture, pixels, rgba8):
+        key = (texture.getName() if texture else None, rgba8)
+        if key not in self.tiles:
+            tint = np.array(rgba8, dtype=np.float32) / 255
+            image = np.ones((1, 1, 4), dtype=np.float32) * 255 if pixels is None else pixels.astype(np.float32)
+            self.tiles[key] = np.clip(image * tint + .5, 0, 255).astype(np.uint8)
+        return key
+
+    def pack(self):
+        """Shelf-packs the tiles (tallest first) into a power-of-two square."""
+        order = sorted(self.tiles, key=lambda k: (-self.tiles[k].shape[0], -self.tiles[k].shape[1], str(k)))
+        padded = {k: np.pad(self.tiles[k], ((GUTTER, GUTTER), (GUTTER, GUTTER), (0, 0)), mode='edge') for k in order}
+        area = sum(p.shape[0] * p.shape[1] for p in padded.values())
+        size = 16
+        while True:
+            while size * size < area:
+                size *= 2
+            spots, x, y, shelf = {}, 0, 0, 0
+            for k in order:
+                h, w = padded[k].shape[:2]
+                if x + w > size:
+                    x, y, shelf = 0, y + shelf, 0
+                spots[k] = (x, y)
+                x, shelf = x + w, max(shelf, h)
+            if y + shelf <= size and all(padded[k].shape[1] <= size for k in order):
+                break
+            size *= 2
+
+        image = np.zeros((size, size, 4), dtype=np.uint8)
+        for k, (x, y) in spots.items():
+            h, w = padded[k].shape[:2]
+            image[y:y + h, x:x + w] = padded[k]
+            inner_h, inner_w = h - 2 * GUTTER, w - 2 * GUTTER
+            self.rects[k] = ((x + GUTTER) / size, (y + GUTTER) / size,
+                             (x + GUTTER + inner_w) / size, (y + GUTTER + inner_h) / size)
+
+        texture = PandaTexture('palette')
+        texture.setup2dTexture(size, size, PandaTexture.T_unsigned_byte, PandaTexture.F_rgba8)
+        texture.setRamImageAs(image.tobytes(), 'RGBA')
+        texture.setMagfilter(SamplerState.FT_nearest)
+        texture.setMinfilter(SamplerState.FT_nearest)
+        texture.setWrapU(SamplerState.WM_clamp)
+        texture.setWrapV(SamplerState.WM_clamp)
+        self.texture = texture
+        return texture
+
+
+# =============================
+# PASS
+# =============================
+def _with_texcoord(data):
+    fmt = GeomVertexFormat(data.getFormat())
+    array = GeomVertexArrayFormat()
+    array.addColumn('texcoord', 2, Geom.NT_float32, Geom.C_texcoord)
+    fmt.addArray(array)
+    return data.convertTo(GeomVertexFormat.registerFormat(fmt))
+
+
+def _read(data, column, width):
+    reader = GeomVertexReader(data, column)
+    read = {2: reader.getData2, 4: reader.getData4}[width]
+    return np.array([tuple(read()) for _ in range(data.getNumRows())], dtype=np.float64).reshape(-1, width)
+
+
+def palettize(node, max_tile=MAX_TILE):
+    """Moves node's eligible Geoms onto one palette texture (see the module
+    docstring) and flattens them together. Returns the PaletteAtlas, or None
+    if nothing was eligible.
+    """
+    atlas = PaletteAtlas()
+    jobs = []       # (GeomNode, index, keys per row, uvs)
+    for geom_np in [node, *node.findAllMatches('**/+GeomNode')]:
+        geom_node = geom_np.node()
+        if not isinstance(geom_node, GeomNode):
+            continue
+        for i in range(geom_node.getNumGeoms()):
+            state = geom_node.getGeomState(i)
+            data = geom_node.getGeom(i).getVertexData()
+            attrib = state.getAttrib(TextureAttrib)
+            texture = attrib.getTexture() if attrib and attrib.getNumOnStages() == 1 else None
+            if attrib and attrib.getNumOnStages() > 1:
+                continue
+            pixels = None
+            if texture:
+                pixels = _texture_pixels(texture)
+                if pixels is None or max(pixels.shape[:2]) > max_tile or not data.hasColumn('texcoord'):
+                    continue
+                uvs = np.clip(_read(data, 'texcoord', 2), 0, 1)
+            else:
+                uvs = None
+
+            color_attrib = state.getAttrib(ColorAttrib)
+            if color_attrib and color_attrib.getColorType() == ColorAttrib.T_flat:
+                colors = np.tile(tuple(color_attrib.getColor()), (data.getNumRows(), 1))
+            elif data.hasColumn('color') and not (color_attrib and color_attrib.getColorType() == ColorAttrib.T_off):
+                colors = _read(data, 'color', 4)
+            else:
+                colors = np.ones((data.getNumRows(), 4))
+            scale = state.getAttrib(ColorScaleAttrib)
+            if scale and scale.hasScale():
+                colors = colors * tuple(scale.getScale())
+            rgba8 = np.clip(np.round(colors * 255), 0, 255).astype(int)
+            keys = [atlas.add(texture, pixels, tuple(c)) for c in rgba8]
+            jobs.append((geom_node, i, keys, uvs))
+    if not jobs:
+        return None
+
+    atlas.pack()
+    on = TextureAttrib.make(atlas.texture)
+    for geom_node, i, keys, uvs in jobs:
+        geom = geom_node.modifyGeom(i)
+        data = geom.modifyVertexData()
+        if not data.hasColumn('texcoord'):
+            data = GeomVertexData(_with_texcoord(data))
+        texcoord = GeomVertexWriter(data, 'texcoord')
+        color = GeomVertexWriter(data, 'color') if data.hasColumn('color') else None
+        for row, key in enumerate(keys):
+            u0, v0, u1, v1 = atlas.rects[key]
+            u, v = (uvs[row] if uvs is not None else (.5, .5))
+            texcoord.setData2(u0 + (u1 - u0) * u, v0 + (v1 - v0) * v)
+            if color:
+                color.setData4(1, 1, 1, 1)
+        geom.setVertexData(data)
+        state = geom_node.getGeomState(i).removeAttrib(ColorScaleAttrib).setAttrib(on)
+        mode = state.getAttrib(RenderModeAttrib)
+        if mode and mode.getMode() == RenderModeAttrib.M_filled:
+            state = state.removeAttrib(RenderModeAttrib)    # the default for triangles; would split states
+        state = state.setAttrib(ColorAttrib.makeVertex() if color else ColorAttrib.makeFlat((1, 1, 1, 1)))
+        geom_node.setGeomState(i, state)
+    node.flattenStrong()
+    # Geoms that shared one vertex table each got a rewritten copy of all of
+    # it: drop the unused rows, then gather the tables again
+    reducer = SceneGraphReducer()
+    reducer.removeUnusedVertices(node.node())
+    reducer.collectVertexData(node.node())
+    reducer.unify(node.node(), False)
+    return atlas
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import json
+    import time as _time
+    from level import LEVEL_FOLDER, build_entities
+
+    app = Ursina(window_type='none')
+    for name in ('peach_castle', 'indoor_hall', 'simple_room'):
+        with open(os.path.join(LEVEL_FOLDER, name + '.json')) as f:
+            data = json.load(f)
+        staging = Entity(name='staging')
+        entities, props = build_entities(data, parent=staging)
+        for p in props:
+            p.detachNode()
+        per_entity = render_states(staging)
+
+        static = staging.copyTo(NodePath('level'))
+        for np_ in static.findAllMatches('**'):
+            np_.clearPythonTag('Entity')
+        static.flattenStrong()
+        flattened = render_states(static)
+        start = _time.perf_counter()
+        atlas = palettize(static)
+        elapsed = _time.perf_counter() - start
+        paletted = render_states(static)
+        size = atlas.texture.getXSize() if atlas else 0
+        print(f'{name:>13}: geoms / render states  per entity {per_entity[0]:>3} / {per_entity[1]:>2}, '
+              f'flattened {flattened[0]} / {flattened[1]}, palette {paletted[0]} / {paletted[1]} '
+              f'({len(atlas.tiles) if atlas else 0} tiles, {size}x{size} atlas, {elapsed * 1000:.1f} ms)')
+        destroy(staging)
+        for p in props:
+            destroy(p)
@@ -2,6 +2,21 @@ from ursina import *
 from ursina.prefabs.primitives import *
 import math
 
+from instancing import InstancedProps
+from lod import LODProps
+import colliders
+from colliders import build_static_grid, RaycastWorld
+from heightmap import bake_heightmap, HeightMapWorld
+from level import load_level, LEVEL_FOLDER
+from character import CharacterController, CharacterState, interpolate, GroundCache
+from fixedstep import FixedTimestep
+from simthread import CharacterSim, SimulationThread
+from platforms import PlatformSystem
+from movers import Movers
+from profiler import FrameProfiler
+from streaming import ChunkStreamer
+from bake import bake_lighting
+
 def create_peach_castle():
     # Base structure
     base = Entity(
@@ -10,7 +25,8 @@ def create_peach_castle():
         color=color.rgb(255, 200, 200),
         scale=(20, 4, 20),
         position=(0, 2, 0),
-        collider='box'
+        collider='box',
+        static=True
     )
     
     # Main tower base
@@ -20,7 +36,8 @@ def create_peach_castle():
         color=color.rgb(255, 180, 180),
         scale=(6, 4, 6),
         position=(0, 6, 0),
-        collider='mesh'
+        collider='mesh',
+        static=True
     )
     
     # Main tower
@@ -30,7 +47,8 @@ def create_peach_castle():
         color=color.rgb(255, 150, 150),
         scale=(4, 12, 4),
         position=(0, 10, 0),
-        collider='mesh'
+        collider='mesh',
+        static=True
     )
     
     # Tower top section
@@ -40,7 +58,8 @@ def create_peach_castle():
         color=color.rgb(255, 200, 200),
         scale=(4.5, 2, 4.5),
         position=(0, 18, 0),
-        collider='mesh'
+        collider='mesh',
+        static=True
     )
     
     # Tower roof (cone)
@@ -50,7 +69,8 @@ def create_peach_castle():
         color=color.rgb(255, 100, 100),
         scale=(5, 6, 5),
         position=(0, 22, 0),
-        collider='mesh'
+        collider='mesh',
+        static=True
     )
     
     # Gold star on top (iconic element)
@@ -59,52 +79,10 @@ def create_peach_castle():
         color=color.yellow,
         scale=(1.5, 0.3, 1.5),
         position=(0, 25.5, 0),
-        collider='sphere'
+        collider='sphere',
+        static=True
     )
     
-    # Side towers (4 corners)
-    for x in [-8, 8]:
-        for z in [-8, 8]:
-            # Tower base
-            side_base = Entity(
-                model='cube',
-                texture='white_cube',
-                color=color.rgb(255, 180, 180),
-                scale=(3, 2, 3),
-                position=(x, 3, z),
-                collider='box'
-            )
-            
-            # Side tower
-            side_tower = Entity(
-                model='cylinder',
-                texture='white_cube',
-                color=color.rgb(255, 150, 150),
-                scale=(2, 8, 2),
-                position=(x, 7, z),
-                collider='mesh'
-            )
-            
-            # Side tower top
-            side_top = Entity(
-                model='cylinder',
-                texture='white_cube',
-                color=color.rgb(255, 200, 200),
-                scale=(2.2, 1, 2.2),
-                position=(x, 11, z),
-                collider='mesh'
-            )
-            
-            # Side roof
-            side_roof = Entity(
-                model='cone',
-                texture='white_cube',
-                color=color.rgb(255, 100, 100),
-                scale=(2.5, 3, 2.5),
-                position=(x, 13, z),
-                collider='mesh'
-            )
-    
     # Main entrance
     entrance = Entity(
         model='cube',
@@ -112,7 +90,8 @@ def create_peach_castle():
         color=color.rgb(255, 180, 180),
         scale=(6, 5, 4),
         position=(0, 2.5, -10),
-        collider='box'
+        collider='box',
+        static=True
     )
     
     # Entrance arch
@@ -122,7 +101,8 @@ def create_peach_castle():
         color=color.rgb(255, 150, 150),
         scale=(4, 3, 2),
         position=(0, 3.5, -10.5),
-        collider='box'
+        collider='box',
+        static=True
     )
     
     # Remove the center of the arch to create an opening
@@ -131,7 +111,8 @@ def create_peach_castle():
         texture='white_cube',
         color=color.rgb(0, 0, 0),
         scale=(2.5, 2, 1.1),
-        position=(0, 3.5, -10.8)
+        position=(0, 3.5, -10.8),
+        static=True
     )
     
     # Bridge to entrance
@@ -141,7 +122,8 @@ def create_peach_castle():
         color=color.rgb(200, 150, 100),
         scale=(6, 0.5, 10),
         position=(0, 0.25, -5),
-        collider='box'
+        collider='box',
+        static=True
     )
     
     # Moat (using a flat cylinder)
@@ -151,7 +133,8 @@ def create_peach_castle():
         color=color.blue,
         scale=(25, 0.1, 25),
         position=(0, -0.5, 0),
-        collider='mesh'
+        collider='mesh',
+        static=True
     )
     
     # Windows on main tower
@@ -161,48 +144,96 @@ def create_peach_castle():
             color=color.blue,
             scale=(0.8, 0.8, 0.8),
             position=(0, y, -4.1),
-            rotation_x=90
+            rotation_x=90,
+            static=True
         )
     
-    # Decorative elements on base
-    for i in range(8):
-        angle = i * 45
-        x = 10 * math.cos(math.radians(angle))
-        z = 10 * math.sin(math.radians(angle))
-        decoration = Entity(
-            model='cube',
-            texture='white_cube',
-            color=color.rgb(255, 180, 180),
-            scale=(1, 2, 1),
-            position=(x, 3, z),
-            collider='box'
-        )
+    # Side towers (4 corners) and decorative elements on base.
+    # Repeated shapes are instanced: one draw call per prototype model
+    corners = [(x, z) for x in [-8, 8] for z in [-8, 8]]
+    decorations = [(10 * math.cos(math.radians(i * 45)), 10 * math.sin(math.radians(i * 45)))
+                   for i in range(8)]
 
-def create_surroundings():
-    # Create some trees around the castle
-    for i in range(12):
-        angle = i * 30
-        distance = 30
-        x = distance * math.cos(math.radians(angle))
-        z = distance * math.sin(math.radians(angle))
-        
-        # Tree trunk
-        trunk = Entity(
-            model='cylinder',
-            color=color.rgb(101, 67, 33),
-            scale=(1, 3, 1),
-            position=(x, 1.5, z),
-            collider='mesh'
-        )
-        
-        # Tree foliage
-        foliage = Entity(
-            model='sphere',
-            color=color.green,
-            scale=(3, 3, 3),
-            position=(x, 4, z),
-            collider='sphere'
-        )
+    # Tower bases + base decorations
+    InstancedProps(
+        model='cube',
+        texture='white_cube',
+        positions=[(x, 3, z) for x, z in corners + decorations],
+        scales=[(3, 2, 3)] * len(corners) + [(1, 2, 1)] * len(decorations),
+        colors=[color.rgb(255, 180, 180)] * (len(corners) + len(decorations)),
+        collider='box'
+    )
+
+    # Side towers + side tower tops
+    InstancedProps(
+        model='cylinder',
+        texture='white_cube',
+        positions=[(x, 7, z) for x, z in corners] + [(x, 11, z) for x, z in corners],
+        scales=[(2, 8, 2)] * len(corners) + [(2.2, 1, 2.2)] * len(corners),
+        colors=[color.rgb(255, 150, 150)] * len(corners) + [color.rgb(255, 200, 200)] * len(corners),
+        collider='box'
+    )
+
+    # Side roofs
+    InstancedProps(
+        model='cone',
+        texture='white_cube',
+        positions=[(x, 13, z) for x, z in corners],
+        scales=[(2.5, 3, 2.5)] * len(corners),
+        colors=[color.rgb(255, 100, 100)] * len(corners),
+        collider='box'
+    )
+
+# Trees switch to low-poly past the first distance and to impostors past the second
+TREE_LOD_DISTANCES = (40, 90)
+
+# Open country past the castle is streamed in chunks around Mario; these four
+# 50-unit chunks lie under the level's 100x100 ground and are never generated
+CHUNK_SIZE = 50
+CASTLE_CHUNKS = {(-1, -1), (-1, 0), (0, -1), (0, 0)}
+
+# Global toggle: Mario's physics on its own thread (simthread.py) instead of in update()
+PHYSICS_THREAD = False
+
+def tree_ring_positions(count, distance=30, spacing=6):
+    """(x, z) for `count` trees on concentric rings starting at `distance`.
+    The first ring holds 12 trees 30 degrees apart; outer rings keep the same density.
+    """
+    positions = []
+    ring = 0
+    while len(positions) < count:
+        radius = distance + ring * spacing
+        n = min(count - len(positions), round(12 * radius / distance))
+        for i in range(n):
+            angle = i * 360 / round(12 * radius / distance)
+            positions.append((radius * math.cos(math.radians(angle)), radius * math.sin(math.radians(angle))))
+        ring += 1
+    return positions
+
+def create_surroundings(tree_count=12):
+    # Create some trees around the castle (instanced, with distance LOD: at most
+    # 6 draw calls for any tree_count; see lod.py)
+    trees = tree_ring_positions(tree_count)
+
+    # Tree trunks
+    LODProps(
+        model='cylinder',
+        positions=[(x, 1.5, z) for x, z in trees],
+        scales=[(1, 3, 1)] * len(trees),
+        colors=[color.rgb(101, 67, 33)] * len(trees),
+        collider='box',
+        distances=TREE_LOD_DISTANCES
+    )
+
+    # Tree foliage
+    LODProps(
+        model='sphere',
+        positions=[(x, 4, z) for x, z in trees],
+        scales=[(3, 3, 3)] * len(trees),
+        colors=[color.green] * len(trees),
+        collider='sphere',
+        distances=TREE_LOD_DISTANCES
+    )
     
     # Path from bridge
     path = Entity(
@@ -211,11 +242,30 @@ def create_surroundings():
         color=color.rgb(200, 180, 140),
         scale=(6, 0.2, 30),
         position=(0, 0.1, -20),
-        collider='box'
+        collider='box',
+        static=True
     )
 
+def create_platforms():
+    """A lift and a slider beside the path to the castle, a turntable, and a
+    ring of bobbing stepping stones round the grounds (one Movers: after
+    build_static_grid()).
+    """
+    system = PlatformSystem()
+    colors = [color.rgb(200, 120, 60), color.rgb(200, 120, 60), color.rgb(170, 170, 190)]
+    system.add((6, 1, -18), size=(3, .5, 3), amplitude=(0, 2, 0), frequency=.15)
+    system.add((-8, 1, -26), size=(3, .5, 3), path=((0, 0, 0), (0, 0, 8)), speed=2)
+    system.add((9, -.8, -30), size=(5, .4, 5), shape='cylinder', spin=45)
+    for i in range(120):
+        angle = i * 2 * math.pi / 120
+        system.add((42 * math.cos(angle), 0, 42 * math.sin(angle)), size=(1.6, .4, 1.6),
+                   amplitude=(0, .6, 0), frequency=.3, phase=i * .4)
+        colors.append(color.rgb(150, 150, 160))
+    return Movers(system, colors=colors)
+
+
 class Mario(Entity):
-    def __init__(self, **kwargs):
+    def __init__(self, physics_rate=120, max_substeps=8, platforms=None, heightmap=None, **kwargs):
         super().__init__(
             model='cube',
             color=color.orange,
@@ -224,11 +274,43 @@ class Mario(Entity):
             collider='box',
             **kwargs
         )
-        self.speed = 10
+        # Movement (engine-independent core in character.py)
+        self.controller = CharacterController(
+            speed=10,
+            jump_speed=12.6,
+            gravity=-36,        # Approximated for Mario 64 feel
+            terminal=-22.5,
+            foot_offset=0.8,    # Half of scale_y
+            skin=0.8,           # probe from the body center...
+            ground_snap=0.2,    # ...to 0.2 below the feet
+            kill_y=None,
+            radius=0.5,         # walls stop the 1x1.6x1 body (swept: no tunneling at any dt)
+            height=1.6,
+        )
+        self.state = CharacterState(*self.position)
+        self.previous_state = self.state
+        self.world = GroundCache(RaycastWorld(ignore=[self]))
+        if heightmap:   # ground probes over flat tops are a cell lookup (heightmap.py)
+            self.world = HeightMapWorld(heightmap, self.world)
+        # Fixed-rate physics, rendered interpolated between the last two states
+        self.clock = FixedTimestep(rate=physics_rate, max_substeps=max_substeps)
+        # Moving platforms (a Movers) carry Mario by their motion between steps
+        self.platforms = platforms
+        self.anchor = None
+        # PHYSICS_THREAD: the same steps on their own thread, against the static
+        # grid only (no Panda3D queries off the main thread)
+        self.sim = None
+        if PHYSICS_THREAD:
+            self.sim_thread = SimulationThread(rate=physics_rate, max_substeps=max_substeps)
+            if platforms:
+                platforms.run_on(self.sim_thread)
+            world = GroundCache(colliders.static_grid)
+            world = HeightMapWorld(heightmap, world) if heightmap else world
+            self.sim = CharacterSim(self.controller, self.state, world,
+                                    platforms=platforms.system if platforms else None)
+            self.sim_thread.add(self.sim)
+            self.sim_thread.start()
         self.velocity_y = 0
-        self.gravity = -36  # Approximated for Mario 64 feel
-        self.jump_speed = 12.6
-        self.terminal = -22.5
         self.on_ground = False
 
         # Third-person camera setup
@@ -238,59 +320,46 @@ class Mario(Entity):
         camera.fov = 90
 
     def update(self):
-        # Horizontal movement relative to camera
-        move_dir = Vec3(
-            held_keys['d'] - held_keys['a'],
-            0,
-            held_keys['w'] - held_keys['s']
-        )
-        if move_dir != Vec3(0,0,0):
-            move_dir = move_dir.normalized()
-            # Rotate player to face movement direction
-            self.look_at(self.position + move_dir)
-            # Move forward in the direction the player is facing
-            self.position += self.forward * self.speed * time.dt
+        # Horizontal movement (world axes)
+        move_x = held_keys['d'] - held_keys['a']
+        move_z = held_keys['w'] - held_keys['s']
 
-        # Apply gravity
-        self.velocity_y += self.gravity * time.dt
-        if self.velocity_y < self.terminal:
-            self.velocity_y = self.terminal
-        self.y += self.velocity_y * time.dt
+        if self.sim:
+            self.sim.input.set((move_x, move_z, bool(held_keys['space'])))
+            x, y, z, self.rotation_y, self.velocity_y, self.on_ground = self.sim.sample()
+            self.position = (x, y, z)
+            return
+        # Gravity, ground check, platform carry and jump at a fixed rate
+        platforms = self.platforms.system if self.platforms else None
+        for _ in range(self.clock.advance(time.dt)):
+            self.previous_state = self.state
+            if platforms:
+                self.state = platforms.carry(self.state, self.anchor, self.controller.foot_offset)
+            self.state = self.controller.step(self.state, move_x, move_z, held_keys['space'], self.clock.dt, self.world)
+            if platforms:
+                self.anchor = platforms.anchor(self.state, self.controller.foot_offset)
+        x, y, z, yaw = interpolate(self.previous_state, self.state, self.clock.alpha)
+        self.position = (x, y, z)
+        self.rotation_y = yaw
+        self.velocity_y = self.state.velocity_y
+        self.on_ground = self.state.on_ground
 
-        # Ground collision check using raycast
-        ray = raycast(self.world_position, self.down, distance=1.0, ignore=[self])
-        if ray.hit:
-            self.y = ray.world_point.y + 0.8  # Half of scale_y
-            self.velocity_y = max(self.velocity_y, max(0, ray.entity.velocity.y if hasattr(ray.entity, 'velocity') else 0))
-            self.on_ground = True
-        else:
-            self.on_ground = False
-
-        # Jump if on ground and space pressed
-        if held_keys['space'] and self.on_ground:
-            self.velocity_y = self.jump_speed
-            self.on_ground = False
+    def on_destroy(self):
+        if self.sim:
+            self.sim_thread.stop()
 
 def main():
     app = Ursina()
     
     # Set up camera (removed initial static position)
     
-    # Create ground
-    ground = Entity(
-        model='plane',
-        texture='white_cube',
-        color=color.green,
-        scale=(100, 1, 100),
-        position=(0, -1, 0),
-        collider='mesh'
-    )
-    
-    # Create castle
-    create_peach_castle()
-    
-    # Create surroundings
-    create_surroundings()
+    # Ground, castle and surroundings (create_peach_castle() +
+    # create_surroundings(), exported to levels/peach_castle.json by
+    # `python level.py export`), loaded from the compiled cache. Its collider
+    # table already uses exact analytic shapes for cylinders / cones / the moat
+    level = load_level(os.path.join(LEVEL_FOLDER, 'peach_castle.json'))
+    # Index every static collider once; Mario's probes only visit nearby cells
+    build_static_grid()
     
     # Add sky
     Sky()
@@ -298,9 +367,27 @@ def main():
     # Add light
     sun = DirectionalLight()
     sun.look_at(Vec3(1, -1, -1))
+    # Castle and grounds get the sun (with shadows) baked in, cached with the
+    # level; Mario, the trees and streamed chunks stay live-lit
+    bake_lighting(level, [sun])
     
+    # Moving platforms, ticked before Mario each frame
+    platforms = create_platforms()
+
+    # Walkable tops baked into a heightmap (cached with the level) for Mario's
+    # ground probes; the platforms' columns, streamed chunks and anything left
+    # to Panda3D still go to the grid / raycast
+    heightmap = bake_heightmap(level, colliders.static_grid, exclude=colliders.unindexed_bounds())
+
     # Add Mario with physics
-    player = Mario(position=(0, 5, -20))
+    player = Mario(position=(0, 5, -20), platforms=platforms, heightmap=heightmap)
+
+    # Stream the surrounding country in (after build_static_grid(), which
+    # would otherwise drop the streamed colliders)
+    ChunkStreamer(target=player, chunk_size=CHUNK_SIZE, skip=CASTLE_CHUNKS)
+
+    # F3: frame profiler overlay, F4: dump the last 10 s to CSV
+    FrameProfiler()
     
     # Removed EditorCamera to use third-person view
     
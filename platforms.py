@@ -0,0 +1,331 @@
+"""
+platforms.py — kinematic moving platforms with NumPy (no Ursina import).
+
+Every platform's motion is evaluated in one vectorized pass per tick, from
+the time since the start:
+
+- path: a closed loop of waypoints (relative to its position) at `speed`
+- oscillation: `amplitude` * sin(2 pi `frequency` t + `phase`) on each axis
+- spin: `spin` degrees per second about its vertical axis (round platforms
+  only: the collision shapes are axis-aligned)
+
+A platform has all three; leave the ones it doesn't use at their defaults.
+Each one is a shapes.py Box or Cylinder. tick() moves the shapes that moved
+and re-buckets them with SpatialGrid.update(), which only bumps the column
+stamps while a shape stays in its cells. It also sets `velocity` (x, y, z)
+and `velocity_y` on each shape: what character.py gets back from probes.
+
+Characters ride by the platform's delta transform, not its velocity:
+anchor() remembers where a character stands in its platform's frame after
+a step, and carry() puts it back there, moved and turned with the platform,
+before the next one, however many ticks passed in between.
+
+movers.py draws a PlatformSystem in Ursina (or ticks it on a
+simthread.SimulationThread). Run this file for the headless benchmark.
+"""
+
+import math
+import numpy as np
+
+from character import CharacterState
+from shapes import Box, Cylinder
+from simthread import StateBuffer
+
+
+class PlatformSystem:
+    """Platforms added with add(), moving from tick() on. `grid` is the
+    spatialgrid.SpatialGrid their shapes are kept current in (None: the
+    shapes still move, e.g. for colliders.analytic_colliders).
+    """
+    def __init__(self, grid=None):
+        self.grid = grid
+        self.shapes = []
+        self.time = 0.0
+        self._specs = []
+        self._packed = False
+        self.snapshot = None
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def add(self, position, size=(3, .5, 3), shape='box', path=(), speed=2.0, amplitude=(0, 0, 0),
+            frequency=0.0, phase=0.0, spin=0.0, yaw=0.0):
+        """A platform centered on `position`, `size` across (a cylinder's is its
+        diameter). Returns its shape; the others (velocity, transform) are
+        indexed in the same order.
+        """
+        if spin and shape != 'cylinder':
+            raise ValueError("spinning platforms must be shape='cylinder' (collision shapes are axis-aligned)")
+        bottom = (position[0], position[1] - size[1] / 2, position[2])
+        collider = Cylinder(bottom, size) if shape == 'cylinder' else Box(bottom, size)
+        collider.velocity = (0.0, 0.0, 0.0)
+        collider.velocity_y = 0.0
+        collider.kinematic = True       # SpatialGrid makes no ground patches over it
+        self.shapes.append(collider)
+        self._specs.append((position, size, [tuple(p) for p in path], speed, amplitude, frequency, phase, spin, yaw))
+        self._packed = False
+        if self.grid is not None:
+            self.grid.insert(collider)
+        return collider
+
+    # =============================
+    # ARRAYS
+    # =============================
+    def pack(self):
+        """Builds the arrays after the last add() (the first tick() does it otherwise)."""
+        n = len(self._specs)
+        specs = self._specs
+        self.base = np.array([s[0] for s in specs], dtype=np.float64).reshape(n, 3)
+        self.size = np.array([s[1] for s in specs], dtype=np.float64).reshape(n, 3)
+        self.amplitude = np.array([s[4] for s in specs], dtype=np.float64).reshape(n, 3)
+        self.frequency = np.array([s[5] for s in specs], dtype=np.float64)
+        self.phase = np.array([s[6] for s in specs], dtype=np.float64)
+        self.spin = np.array([s[7] for s in specs], dtype=np.float64)
+        self.yaw0 = np.array([s[8] for s in specs], dtype=np.float64)
+        self.round = np.array([isinstance(s, Cylinder) for s in self.shapes])
+
+        # Paths: closed loops padded to the longest, as cumulative arc lengths
+        pathed = [i for i, s in enumerate(specs) if len(s[2]) > 1]
+        self._pathed = np.array(pathed, dtype=np.int64)
+        longest = max((len(specs[i][2]) + 1 for i in pathed), default=0)
+        self._points = np.zeros((len(pathed), longest, 3))
+        self._lengths = np.full((len(pathed), longest), np.inf)
+        self._speed = np.array([specs[i][3] for i in pathed], dtype=np.float64)
+        for row, i in enumerate(pathed):
+            loop = np.array(specs[i][2] + [specs[i][2][0]], dtype=np.float64)
+            self._points[row, :len(loop)] = loop
+            self._points[row, len(loop):] = loop[-1]
+            steps = np.linalg.norm(np.diff(loop, axis=0), axis=1)
+            self._lengths[row, :len(loop)] = np.concatenate([[0], np.cumsum(steps)])
+        self._total = self._lengths.max(axis=1, where=np.isfinite(self._lengths), initial=0) if pathed else np.zeros(0)
+
+        self.position, self.yaw = self._evaluate(self.time)
+        self.previous_position, self.previous_yaw = self.position.copy(), self.yaw.copy()
+        self.velocity = np.zeros((n, 3))
+        self._cells = self._cell_ranges(self.position)
+        self.snapshot = StateBuffer((2 * n + 1, 4))     # header (tick time, dt), previous rows, current rows
+        self._rows = np.zeros((2 * n + 1, 4))
+        self._packed = True
+        self._publish(0.0, 0.0)
+
+    def _evaluate(self, t):
+        """(centers (N, 3), yaw (N,) degrees) at time t."""
+        position = self.base + self.amplitude * np.sin(2 * math.pi * self.frequency * t + self.phase)[:, None]
+        if len(self._pathed):
+            s = np.mod(self._speed * t, np.where(self._total > 0, self._total, 1))
+            segment = np.clip((self._lengths <= s[:, None]).sum(axis=1) - 1, 0, self._lengths.shape[1] - 2)
+            rows = np.arange(len(self._pathed))
+            start, end = self._lengths[rows, segment], self._lengths[rows, segment + 1]
+            span = np.where(np.isfinite(end) & (end > start), end - start, np.inf)
+            fraction = (s - start) / span
+            a, b = self._points[rows, segment], self._points[rows, segment + 1]
+            position[self._pathed] += a + (b - a) * fraction[:, None]
+        return position, self.yaw0 + self.spin * t
+
+    def _cell_ranges(self, centers):
+        # The grid columns each platform's bounds cover, as SpatialGrid buckets them
+        if self.grid is None:
+            return None
+        half = self.size / 2
+        cs = self.grid.cell_size
+        return np.floor(np.concatenate([(centers - half)[:, [0, 2]], (centers + half)[:, [0, 2]]], axis=1) / cs)
+
+    def _publish(self, at, dt):
+        n = len(self.shapes)
+        rows = self._rows
+        rows[0, :2] = at, dt
+        rows[1:n + 1, :3], rows[1:n + 1, 3] = self.previous_position, self.previous_yaw
+        rows[n + 1:, :3], rows[n + 1:, 3] = self.position, self.yaw
+        self.snapshot.publish(rows)
+
+    # =============================
+    # TICK
+    # =============================
+    def tick(self, dt, at=0.0):
+        """Advances every platform by dt (SimulationThread's signature)."""
+        if not self._packed:
+            self.pack()
+        self.time += dt
+        self.previous_position, self.previous_yaw = self.position, self.yaw
+        self.position, self.yaw = self._evaluate(self.time)
+        delta = self.position - self.previous_position
+        self.velocity = delta / dt
+
+        # Only the shapes that moved (a pure spin leaves its bounds alone)
+        self._place(np.flatnonzero(np.abs(delta).max(axis=1) > 0))
+        self._publish(at, dt)
+
+    def reset(self):
+        """Back to time 0, every platform at its start and at rest (replays)."""
+        self.time = 0.0
+        if not self._packed:
+            return
+        self.position, self.yaw = self._evaluate(0.0)
+        self.previous_position, self.previous_yaw = self.position.copy(), self.yaw.copy()
+        self.velocity = np.zeros_like(self.position)
+        self._place(np.arange(len(self.shapes)))
+        self._publish(0.0, 0.0)
+
+    def _place(self, moved):
+        # The moved shapes onto self.position; only those that crossed into
+        # other columns are re-bucketed
+        if not len(moved):
+            return
+        half = self.size[moved] / 2
+        centers = self.position[moved]
+        shapes = self.shapes
+        for i, bottom, low, high, velocity in zip(moved.tolist(), (centers - [0, 1, 0] * half).tolist(),
+                                                  (centers - half).tolist(), (centers + half).tolist(),
+                                                  self.velocity[moved].tolist()):
+            shape = shapes[i]
+            shape.position, shape.min, shape.max = tuple(bottom), tuple(low), tuple(high)
+            shape.velocity, shape.velocity_y = tuple(velocity), velocity[1]
+        if self.grid is not None:
+            cells = self._cell_ranges(self.position)
+            for i in np.flatnonzero((cells != self._cells).any(axis=1)).tolist():
+                self.grid.update(shapes[i])
+            self._cells = cells
+
+    # =============================
+    # CARRY
+    # =============================
+    def anchor(self, state, foot_offset=0.0):
+        """(platform index, feet offset from its center in its own frame, yaw
+        relative to it) for a grounded character standing on a platform's top,
+        else None.
+        """
+        if not state.on_ground or not self.shapes:
+            return None
+        if not self._packed:
+            self.pack()
+        feet = state.y - foot_offset
+        offset = np.array((state.x, state.z)) - self.position[:, [0, 2]]
+        half = self.size[:, [0, 2]] / 2
+        inside = np.where(self.round, ((offset / half) ** 2).sum(axis=1) <= 1, (np.abs(offset) <= half).all(axis=1))
+        on_top = inside & (np.abs(self.position[:, 1] + self.size[:, 1] / 2 - feet) < 1e-3)
+        if not on_top.any():
+            return None
+        i = int(np.flatnonzero(on_top)[0])
+        yaw = math.radians(self.yaw[i])
+        c, s = math.cos(yaw), math.sin(yaw)
+        ox, oz = offset[i]
+        # Into the platform's frame: the inverse of the instancing shader's yaw
+        return i, ox * c - oz * s, feet - self.position[i, 1], ox * s + oz * c, state.yaw - self.yaw[i]
+
+    def carry(self, state, anchor, foot_offset=0.0):
+        """`state` moved to where `anchor` (from anchor()) is now."""
+        if anchor is None:
+            return state
+        i, lx, ly, lz, yaw = anchor
+        turn = math.radians(self.yaw[i])
+        c, s = math.cos(turn), math.sin(turn)
+        x, y, z = self.position[i]
+        # Vertical speed is relative to the platform while riding it
+        return CharacterState(x + lx * c + lz * s, y + ly + foot_offset, z - lx * s + lz * c, 0.0,
+                              state.on_ground, yaw + self.yaw[i], state.ground, state.teleported)
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import time
+    from character import CharacterController
+    from spatialgrid import SpatialGrid
+
+    def field(count, grid):
+        # A mix like a level's: lifts, sliders on 4-point loops and turntables
+        system = PlatformSystem(grid)
+        rng = np.random.default_rng(3)
+        side = int(math.ceil(math.sqrt(count)))
+        for i in range(count):
+            x, z = (i % side) * 6 - side * 3, (i // side) * 6 - side * 3
+            kind = i % 3
+            if kind == 0:
+                system.add((x, 2, z), amplitude=(0, 1.5, 0), frequency=rng.uniform(.1, .4), phase=rng.uniform(0, 6))
+            elif kind == 1:
+                system.add((x, 3, z), path=((0, 0, 0), (2, 0, 0), (2, 0, 2), (0, 0, 2)), speed=rng.uniform(1, 3))
+            else:
+                system.add((x, 1, z), size=(3, .4, 3), shape='cylinder', spin=rng.uniform(-90, 90))
+        return system
+
+    for count in (100, 300, 1000):
+        grid = SpatialGrid([Box.from_center((0, -.5, 0), (count * 1.2, 1, count * 1.2))])
+        system = field(count, grid)
+        system.tick(1 / 120)
+        ticks = 240
+        start = time.perf_counter()
+        for _ in range(ticks):
+            system.tick(1 / 120)
+        elapsed = (time.perf_counter() - start) / ticks
+        print(f'{count:>5} platforms: {elapsed * 1e3:5.2f} ms/tick ({elapsed * 1e6 / count:4.2f} us each, '
+              f'{elapsed * 120 * 100:4.1f}% of a frame at 120 Hz)')
+
+    # Riding: one character standing still on a lift, a slider and a turntable
+    grid = SpatialGrid([Box.from_center((0, -.5, 0), (60, 1, 60))])
+    system = PlatformSystem(grid)
+    system.add((0, 2, 0), amplitude=(0, 1.5, 0), frequency=.25)
+    system.add((10, 2, 0), path=((0, 0, 0), (6, 0, 0), (6, 0, 6), (0, 0, 6)), speed=3)
+    system.add((20, 1, 0), size=(6, .4, 6), shape='cylinder', spin=60)
+    controller = CharacterController(spawn_point=(0, 5, 0), radius=.5)
+    system.tick(1 / 120)
+    for i, label in enumerate(('lift', 'slider', 'turntable')):
+        x, y, z = system.position[i]
+        state, anchor = CharacterState(x + 1.5 * (i == 2), y + 1, z), None
+        gap = drift = 0.0
+        first = None
+        for tick in range(60 * 120):
+            system.tick(1 / 120)
+            state = system.carry(state, anchor)
+            state = controller.step(state, 0, 0, False, 1 / 120, grid)
+            anchor = system.anchor(state)
+            if tick > 120:
+                top = system.position[i, 1] + system.size[i, 1] / 2
+                gap = max(gap, abs(state.y - top))
+                first = first or anchor
+                drift = max(drift, math.hypot(anchor[1] - first[1], anchor[3] - first[3]) if anchor else math.inf)
+        print(f'{label:>10}: a minute riding it, largest gap to its top {gap:.1e}, '
+              f'largest drift across it {drift:.1e}')
+
+    # Threaded: 120 sliders ticking flat out on one thread while this one
+    # streams boxes in and out of the same grid, as ChunkStreamer does
+    # alongside a simthread.SimulationThread
+    import sys
+    import threading
+    grid = SpatialGrid([Box.from_center((0, -.5, 0), (200, 1, 200))])
+    system = PlatformSystem(grid)
+    for i in range(120):
+        system.add(((i % 12) * 5 - 30, 2, (i // 12) * 5 - 25), path=((0, 0, 0), (9, 0, 0), (9, 0, 9), (0, 0, 9)),
+                   speed=8)
+    system.pack()
+    stop, errors, ticks = threading.Event(), [], [0]
+
+    def ticking():
+        try:
+            while not stop.is_set():
+                system.tick(1 / 120)
+                ticks[0] += 1
+        except Exception as error:
+            errors.append(error)
+
+    sys.setswitchinterval(1e-5)     # switch threads as often as possible
+    thread = threading.Thread(target=ticking)
+    thread.start()
+    rng = np.random.default_rng(5)
+    streamed = 0
+    deadline = time.perf_counter() + 3
+    while time.perf_counter() < deadline and not errors:
+        chunk = [grid.insert(Box.from_center((x, .5, z), (2, 1, 2))) for x, z in rng.uniform(-35, 35, (20, 2))]
+        for box in chunk:
+            grid.remove(box)
+        streamed += len(chunk)
+    stop.set()
+    thread.join()
+    sys.setswitchinterval(.005)
+    cs = grid.cell_size
+    misplaced = sum(shape not in grid or grid._shape_cells[id(shape)][1][0] != (math.floor(shape.min[0] / cs),
+                                                                             math.floor(shape.min[2] / cs))
+                    for shape in system.shapes)
+    print(f'  threaded: {ticks[0]} ticks against {streamed} streamed boxes, errors {errors}, '
+          f'{misplaced} platforms misplaced in the grid')
+    assert not errors and not misplaced
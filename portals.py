@@ -0,0 +1,291 @@
+"""
+portals.py — room / portal visibility for multi-room indoor levels.
+
+- A Cell is one room: an Entity holding its geometry plus an axis-aligned box
+  that says whether the camera is inside it
+- A Portal is a doorway rectangle joining two cells
+- PortalCuller finds the camera's cell every frame and walks the portals out
+  of it, narrowing a screen-space rectangle at each one; only cells reached
+  with a non-empty rectangle are shown. Hidden cells are skipped by Panda3D's
+  cull traversal entirely, so render cost follows what is visible, not the
+  number of rooms. Colliders stay active in hidden cells
+- create_room() builds a room like 3x1.0.py's create_indoor_environment(),
+  with real doorway openings in the walls listed in `doors`
+- Run this file to benchmark a grid of rooms with and without culling
+"""
+
+from ursina import *
+from panda3d.core import LVecBase4f, Point3
+
+
+# =============================
+# CELLS AND PORTALS
+# =============================
+class Cell(Entity):
+    """A room. Parent its geometry to the cell; `region` is ((x0, y0, z0), (x1, y1, z1))
+    in world space (the space the camera has to be in to stand in this room).
+    """
+    def __init__(self, region, **kwargs):
+        super().__init__(**kwargs)
+        self.region = tuple(tuple(float(v) for v in corner) for corner in region)
+        self.portals = []     # (Portal, other Cell)
+
+    def contains(self, point):
+        lo, hi = self.region
+        return lo[0] <= point[0] <= hi[0] and lo[1] <= point[1] <= hi[1] and lo[2] <= point[2] <= hi[2]
+
+
+class Portal:
+    """A doorway between cells a and b; `corners` are its four world-space
+    corners in order around the opening.
+    """
+    def __init__(self, a, b, corners):
+        self.a, self.b = a, b
+        self.corners = [Point3(*c) for c in corners]
+        a.portals.append((self, b))
+        b.portals.append((self, a))
+
+    def screen_rect(self, cam, projection):
+        """(x0, y0, x1, y1) in normalized device coordinates covered by the
+        opening as seen from `cam` (a Panda3D camera NodePath), or None if
+        it is entirely behind the camera.
+        """
+        clip = []
+        for corner in self.corners:
+            p = cam.getRelativePoint(render, corner)
+            clip.append(projection.xform(LVecBase4f(p[0], p[1], p[2], 1)))
+
+        # Clip the polygon against the eye plane (w > near) before dividing
+        near = 1e-4
+        kept = []
+        for i, p in enumerate(clip):
+            q = clip[i - 1]
+            if (p[3] > near) != (q[3] > near):
+                t = (near - q[3]) / (p[3] - q[3])
+                kept.append(q + (p - q) * t)
+            if p[3] > near:
+                kept.append(p)
+        if not kept:
+            return None
+        xs = [p[0] / p[3] for p in kept]
+        ys = [p[1] / p[3] for p in kept]
+        return min(xs), min(ys), max(xs), max(ys)
+
+
+def _intersect(a, b):
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[2], b[2]), min(a[3], b[3])
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1, y1
+
+
+def _contains(outer, inner):
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+
+
+# =============================
+# CULLER
+# =============================
+class PortalCuller(Entity):
+    """Shows only the cells visible from the camera through chains of portals.
+    With the camera outside every cell, all cells are shown.
+    """
+    def __init__(self, cells=(), max_depth=32, **kwargs):
+        super().__init__(name='portal_culler', **kwargs)
+        self.cells = list(cells)
+        self.max_depth = max_depth
+        self.current = None
+        self.visible = set(self.cells)
+
+    def add(self, cell):
+        self.cells.append(cell)
+        self.visible.add(cell)
+        return cell
+
+    def find_cell(self, point):
+        if self.current and self.current.contains(point):
+            return self.current
+        return next((c for c in self.cells if c.contains(point)), None)
+
+    def visible_cells(self):
+        """Cells seen from the camera this frame."""
+        eye = camera.world_position
+        self.current = self.find_cell(eye)
+        if not self.current:
+            return set(self.cells)
+
+        cam = application.base.cam
+        projection = cam.node().getLens().getProjectionMat()
+        seen = {self.current: [(-1.0, -1.0, 1.0, 1.0)]}
+        stack = [(self.current, (-1.0, -1.0, 1.0, 1.0), 0)]
+        while stack:
+            cell, rect, depth = stack.pop()
+            if depth >= self.max_depth:
+                continue
+            for portal, other in cell.portals:
+                opening = portal.screen_rect(cam, projection)
+                narrowed = opening and _intersect(rect, opening)
+                if not narrowed:
+                    continue
+                # Skip rectangles already covered by an earlier visit to this cell
+                if any(_contains(r, narrowed) for r in seen.get(other, ())):
+                    continue
+                seen.setdefault(other, []).append(narrowed)
+                stack.append((other, narrowed, depth + 1))
+        return set(seen)
+
+    def update(self):
+        visible = self.visible_cells()
+        for cell in self.visible - visible:
+            cell.hide()
+        for cell in visible - self.visible:
+            cell.show()
+        self.visible = visible
+
+
+# =============================
+# ROOM BUILDER
+# =============================
+_sides = {
+    'north': ((0, 1), 'x'), 'south': ((0, -1), 'x'),
+    'east': ((1, 0), 'z'), 'west': ((-1, 0), 'z'),
+}
+
+
+def create_room(position=(0, 0, 0), size=30, wall_height=10, wall_thickness=1, doors=(),
+                door_width=4, door_height=6, **kwargs):
+    """A closed room (floor, ceiling, four walls, corner pillars) centred on
+    `position`, styled after 3x1.0.py's hall. Each side named in `doors`
+    ('north' = +z, 'south', 'east' = +x, 'west') gets a centred doorway.
+    Walls sit just inside the room's square, so neighbours `size` apart share
+    a boundary without overlapping. Returns a Cell; use connect() to add portals.
+    """
+    x, y, z = position
+    half = size / 2
+    cell = Cell(((x - half, y - 1, z - half), (x + half, y + wall_height, z + half)), **kwargs)
+    wall_color = color.rgb(200, 180, 165)
+
+    Entity(parent=cell, model='cube', texture='white_cube', color=color.rgb(150, 120, 90),
+           position=(x, y - .5, z), scale=(size, 1, size), collider='box')
+    Entity(parent=cell, model='cube', texture='white_cube', color=color.rgb(160, 140, 120),
+           position=(x, y + wall_height, z), scale=(size, 1, size), collider='box')
+    Entity(parent=cell, model='cube', color=color.rgb(170, 20, 20),
+           position=(x, y + .02, z), scale=(4, .02, size - 6))
+
+    for side, ((nx, nz), along) in _sides.items():
+        offset = half - wall_thickness / 2
+        cx, cz = x + nx * offset, z + nz * offset
+
+        def wall(center_along, length, y0, y1):
+            if length <= 0 or y1 <= y0:
+                return
+            px, pz = (cx + center_along, cz) if along == 'x' else (cx, cz + center_along)
+            sx, sz = (length, wall_thickness) if along == 'x' else (wall_thickness, length)
+            Entity(parent=cell, model='cube', texture='white_cube', color=wall_color,
+                   position=(px, y + (y0 + y1) / 2, pz), scale=(sx, y1 - y0, sz), collider='box')
+
+        if side in doors:
+            segment = (size - door_width) / 2
+            wall(-(door_width + segment) / 2, segment, 0, wall_height)
+            wall((door_width + segment) / 2, segment, 0, wall_height)
+            wall(0, door_width, door_height, wall_height)     # lintel
+        else:
+            wall(0, size, 0, wall_height)
+
+    for sx in (-1, 1):
+        for sz in (-1, 1):
+            Entity(parent=cell, model='cube', color=color.rgb(210, 190, 175),
+                   position=(x + sx * (half - 3), y + wall_height / 2, z + sz * (half - 3)),
+                   scale=(1.2, wall_height, 1.2), collider='box')
+    cell.door_width, cell.door_height = door_width, door_height
+    cell.floor_y = y
+    return cell
+
+
+def connect(a, b):
+    """Adds the portal for the doorway between rooms a and b from create_room()
+    (neighbours along x or z).
+    """
+    (ax0, _, az0), (ax1, _, az1) = a.region
+    (bx0, _, bz0), (bx1, _, bz1) = b.region
+    w, h, y = a.door_width / 2, a.door_height, a.floor_y
+    if abs(ax1 - bx0) < 1e-6 or abs(bx1 - ax0) < 1e-6:     # side by side along x
+        px = ax1 if abs(ax1 - bx0) < 1e-6 else ax0
+        cz = (az0 + az1) / 2
+        corners = [(px, y, cz - w), (px, y, cz + w), (px, y + h, cz + w), (px, y + h, cz - w)]
+    else:
+        pz = az1 if abs(az1 - bz0) < 1e-6 else az0
+        cx = (ax0 + ax1) / 2
+        corners = [(cx - w, y, pz), (cx + w, y, pz), (cx + w, y + h, pz), (cx - w, y + h, pz)]
+    return Portal(a, b, corners)
+
+
+def create_room_grid(columns, rows, size=30, **kwargs):
+    """columns x rows rooms, each joined to its neighbours by doorways.
+    Returns (cells by (column, row), portals).
+    """
+    cells = {}
+    for i in range(columns):
+        for j in range(rows):
+            doors = [side for side, ok in (('east', i < columns - 1), ('west', i > 0),
+                                           ('north', j < rows - 1), ('south', j > 0)) if ok]
+            cells[i, j] = create_room((i * size, 0, j * size), size, doors=doors, **kwargs)
+    portals = []
+    for (i, j), cell in cells.items():
+        if (i + 1, j) in cells:
+            portals.append(connect(cell, cells[i + 1, j]))
+        if (i, j + 1) in cells:
+            portals.append(connect(cell, cells[i, j + 1]))
+    return cells, portals
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import sys
+    import time as _time
+    from panda3d.core import loadPrcFileData, SceneGraphAnalyzer
+
+    # Offscreen through EGL (Mesa runs it in software when there's no GPU)
+    loadPrcFileData('portals', 'load-display p3headlessgl\naux-display p3tinydisplay\nsync-video false\ngl-finish true')
+    app = Ursina(window_type='offscreen', size=(960, 540), development_mode=False)
+
+    def draw_calls():
+        total = 0
+        for region in app.win.getActiveDisplayRegions():
+            culled = region.makeCullResultGraph()
+            if culled:
+                analyzer = SceneGraphAnalyzer()
+                analyzer.addNode(culled)
+                total += analyzer.getNumGeoms()
+        return total
+
+    def run(n, culling, frames=120):
+        cells, _ = create_room_grid(n, n)
+        culler = PortalCuller(cells.values()) if culling else None
+        times, draws, shown = [], [], []
+        for frame in range(-10, frames):
+            # Walk the first room's diagonal, turning to look through every doorway
+            t = max(frame, 0) / frames
+            camera.position = (-10 + 20 * t, 1.6, -10 + 20 * t)
+            camera.rotation = (0, 360 * t, 0)
+            start = _time.perf_counter()
+            app.step()
+            if frame >= 0:
+                times.append((_time.perf_counter() - start) * 1000)
+                draws.append(draw_calls())
+                shown.append(len(culler.visible) if culler else len(cells))
+        label = 'portals' if culling else 'all'
+        print(f'{n * n:>4} rooms {label:>8}: mean {sum(times) / frames:6.2f} ms, '
+              f'max {max(times):6.2f} ms, {sum(draws) / frames:6.1f} draw calls, '
+              f'{sum(shown) / frames:5.1f} rooms shown')
+        for cell in cells.values():
+            destroy(cell)
+        if culler:
+            destroy(culler)
+
+    for n in [int(a) for a in sys.argv[1:]] or (2, 4, 8):
+        run(n, False)
+        run(n, True)
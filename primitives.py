@@ -0,0 +1,186 @@
+"""
+primitives.py — shared, memoized procedural primitives.
+
+- primitive(shape, segments) builds a 'cylinder', 'cone' or 'sphere' mesh
+  once per (shape, segment count), keeps it in memory and in
+  levels/.cache/primitives, and returns the shared node
+- install() teaches Ursina's model loader the names 'cylinder', 'cone'
+  (DEFAULT_SEGMENTS) and '<shape>_<segments>', e.g. Entity(model='cone_16').
+  Every Entity gets a copy of the shared node, and Panda3D copies share the
+  Geom, so a hundred towers hold one vertex buffer
+- segments_for() picks a segment count from the projected size: enough that
+  the silhouette stays within `max_error` pixels of a circle at the reference
+  view, snapped to SEGMENT_STEPS so a level only ever makes a handful of meshes;
+  tessellated() turns a model name and scale into the name to load
+- Run this file to compare building towers with per-entity and shared meshes
+"""
+
+from ursina import *
+from ursina import mesh_importer
+from panda3d.core import Filename, GeomNode
+from copy import copy
+import re
+
+from meshgen import low_poly_sphere
+
+
+# Bump when the generated meshes change
+VERSION = 1
+
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels', '.cache', 'primitives')
+SEGMENT_STEPS = (6, 8, 12, 16, 24, 32, 48, 64)
+DEFAULT_SEGMENTS = 32       # what plain 'cylinder' / 'cone' resolve to
+
+# Reference view for segments_for(): Mario's third-person camera at 1080p
+VIEW_DISTANCE = 15
+VIEW_FOV = 40
+VIEW_HEIGHT = 1080
+
+_builders = {
+    'cylinder': lambda n: Cylinder(resolution=n),
+    'cone': lambda n: Cone(resolution=n),
+    'sphere': lambda n: low_poly_sphere(max(3, n * 3 // 4), n),
+}
+_name_pattern = re.compile(r'^(cylinder|cone|sphere)_(\d+)$')
+_meshes = {}
+
+
+# =============================
+# MESHES
+# =============================
+def primitive(shape, segments):
+    """The shared node for `shape` with `segments` around (don't reparent it;
+    use primitive_model() or a model name for entities).
+    """
+    key = shape, int(segments)
+    if key in _meshes:
+        return _meshes[key]
+    name = f'{shape}_{key[1]}'
+    path = os.path.join(CACHE_FOLDER, f'{name}.v{VERSION}.bam')
+    if os.path.isfile(path):
+        node = NodePath(loader.loadModel(Filename.fromOsSpecific(path)).find('**/+GeomNode').node())
+    else:
+        node = NodePath(_builders[shape](key[1]).node())
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        node.writeBamFile(Filename.fromOsSpecific(path))
+    node.setName(name)
+    _meshes[key] = node
+    return node
+
+
+def primitive_model(shape, segments):
+    """A model for one Entity: a new node sharing the primitive's vertex data."""
+    return copy(primitive(shape, segments))
+
+
+def parse(name):
+    """(shape, segments) for a primitive model name, else None."""
+    if name in ('cylinder', 'cone'):
+        return name, DEFAULT_SEGMENTS
+    match = _name_pattern.match(name)
+    if match and match.group(1) in _builders:
+        return match.group(1), int(match.group(2))
+    return None
+
+
+def shape_of(name):
+    """'cylinder', 'cone' or 'sphere' for a primitive model name (including
+    Ursina's builtin 'sphere'), else None.
+    """
+    parsed = parse(name)
+    return parsed[0] if parsed else ('sphere' if name == 'sphere' else None)
+
+
+class _PrimitiveMeshes(dict):
+    """Ursina's imported_meshes, building primitive names the first time they're looked up."""
+    def __contains__(self, name):
+        if dict.__contains__(self, name):
+            return True
+        parsed = isinstance(name, str) and parse(name)
+        if parsed:
+            self[name] = primitive(*parsed)
+            return True
+        return False
+
+
+def install():
+    """Makes model='cylinder', 'cone' and '<shape>_<segments>' load shared primitives
+    (Ursina ships no cylinder / cone model files). Safe to call more than once.
+    """
+    if not isinstance(mesh_importer.imported_meshes, _PrimitiveMeshes):
+        mesh_importer.imported_meshes = _PrimitiveMeshes(mesh_importer.imported_meshes)
+
+
+# =============================
+# TESSELLATION
+# =============================
+def segments_for(radius, distance=VIEW_DISTANCE, fov=VIEW_FOV, screen_height=VIEW_HEIGHT, max_error=1.0):
+    """Segment count keeping a circle of `radius` (world units) within max_error
+    pixels of round from `distance`: a chord's sagitta is about r * pi^2 / (2 n^2).
+    """
+    pixels = radius / (distance * math.tan(math.radians(fov) / 2)) * screen_height / 2
+    needed = math.pi * math.sqrt(max(pixels, 0) / (2 * max_error))
+    return next((s for s in SEGMENT_STEPS if s >= needed), SEGMENT_STEPS[-1])
+
+
+def tessellated(name, scale, **view):
+    """Model name to load for primitive `name` drawn at `scale`; other names
+    pass through. `view` overrides segments_for()'s reference view.
+    """
+    shape = shape_of(name)
+    if not shape:
+        return name
+    sx, sy, sz = (abs(float(v)) for v in scale)
+    radius = max(sx, sy, sz) / 2 if shape == 'sphere' else max(sx, sz) / 2
+    return f'{shape}_{segments_for(radius, **view)}'
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import random
+    import shutil
+    import sys
+    import time as _time
+    from streaming import resident_memory
+
+    app = Ursina(window_type='none')
+    install()
+
+    # Mesh generation: cold (build + write) and warm (read the .bam)
+    shutil.rmtree(CACHE_FOLDER, ignore_errors=True)
+    for label in ('cold', 'warm'):
+        _meshes.clear()
+        start = _time.perf_counter()
+        for shape in _builders:
+            for segments in SEGMENT_STEPS:
+                primitive(shape, segments)
+        print(f'{label} mesh cache: {len(_meshes)} meshes in {(_time.perf_counter() - start) * 1000:6.1f} ms')
+
+    def towers(count, shared):
+        random.seed(count)
+        start, memory = _time.perf_counter(), resident_memory()
+        entities = []
+        for i in range(count):
+            shape = ('cylinder', 'cone', 'sphere')[i % 3]
+            width = random.uniform(.5, 8)
+            scale = (width, random.uniform(.5, 8), width)
+            if shared:
+                model = tessellated(shape, scale)
+            else:   # what a scene does without the cache: its own mesh per entity
+                model = {'cylinder': lambda: Cylinder(resolution=32), 'cone': lambda: Cone(resolution=32),
+                         'sphere': lambda: 'sphere'}[shape]()
+            entities.append(Entity(model=model, scale=scale, x=i))
+        elapsed = _time.perf_counter() - start
+        grown = (resident_memory() - memory) / 2 ** 20
+        nodes = [n.node() for e in entities if e.model for n in [e.model, *e.model.findAllMatches('**/+GeomNode')]]
+        buffers = len({g.getVertexData().this for n in nodes if isinstance(n, GeomNode) for g in n.getGeoms()})
+        print(f'{"shared" if shared else "per-entity":>10} {count:>5} primitives: {elapsed * 1000:8.1f} ms, '
+              f'{elapsed / count * 1e6:6.0f} us each, +{grown:5.1f} MB, {buffers} vertex buffers')
+        for e in entities:
+            destroy(e)
+
+    for count in [int(a) for a in sys.argv[1:]] or (100, 1000, 3000):
+        towers(count, False)
+        towers(count, True)
@@ -0,0 +1,217 @@
+"""
+profiler.py — toggleable per-frame timing overlay.
+
+- F3 shows / hides the overlay; F4 writes the last `dump_seconds` to a CSV file
+- While shown, every frame is split into: watched classes' update() (Mario by
+  default), the ground-probe raycasts made inside them, other Entity updates,
+  cull (scene-graph traversal), draw (render) and the rest of the frame
+- The overlay shows rolling averages and a frame-time histogram
+- Hidden, nothing is patched and the profiler has no update(): the only cost is
+  its input() handler
+"""
+
+from ursina import *
+from panda3d.core import PythonCallbackObject
+from collections import deque
+import csv
+import time as _time
+
+import colliders
+
+
+PHASES = ('frame', 'watched', 'raycast', 'updates', 'cull', 'draw', 'other')
+HISTOGRAM_BINS = 17        # 2 ms bins; the last one collects everything slower
+HISTOGRAM_BIN_MS = 2
+
+
+class FrameProfiler(Entity):
+    """Phase timings for each frame while visible. `watch` names the Entity
+    classes whose update() gets its own row.
+    """
+    def __init__(self, watch=('Mario',), toggle_key='f3', dump_key='f4', dump_seconds=10,
+                 window=120, refresh=.25, **kwargs):
+        super().__init__(name='frame_profiler', eternal=True, **kwargs)
+        self.watch = tuple(watch)
+        self.toggle_key = toggle_key
+        self.dump_key = dump_key
+        self.dump_seconds = dump_seconds
+        self.window = window          # frames in the rolling averages and histogram
+        self.refresh = refresh        # seconds between overlay redraws
+        self.shown = False
+        self.rows = deque()           # (time, ms per PHASES..., raycast calls)
+        self._originals = {}
+        self._task = None
+        self._hud = None
+
+    # -- recording ---------------------------------------------------------
+
+    def _reset_frame(self):
+        self._watched = self._raycast = self._cull = self._draw = 0.0
+        self._raycasts = 0
+
+    def _timed(self, original, slot):
+        def timed(*args, **kwargs):
+            start = _time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = _time.perf_counter() - start
+                if slot == 'raycast':
+                    self._raycast += elapsed
+                    self._raycasts += 1
+                else:
+                    self._watched += elapsed
+        return timed
+
+    def _callback(self, slot):
+        def callback(data):
+            start = _time.perf_counter()
+            data.upcall()
+            elapsed = _time.perf_counter() - start
+            if slot == 'cull':
+                self._cull += elapsed
+            else:
+                self._draw += elapsed
+        return PythonCallbackObject(callback)
+
+    def _update_task(self, task):
+        now = _time.perf_counter()
+        if self._frame_start is not None:
+            self._record(now)
+        self._frame_start = now
+        self._reset_frame()
+        start = _time.perf_counter()
+        status = self._ursina_update(task)
+        self._updates = _time.perf_counter() - start
+        if now - self._last_refresh >= self.refresh:
+            self._last_refresh = now
+            self._draw_hud()
+        return status
+
+    def _record(self, now):
+        frame = now - self._frame_start
+        updates = self._updates - self._watched
+        watched = self._watched - self._raycast
+        other = frame - self._updates - self._cull - self._draw
+        self.rows.append((now, frame * 1000, watched * 1000, self._raycast * 1000, updates * 1000,
+                          self._cull * 1000, self._draw * 1000, other * 1000, self._raycasts))
+        while self.rows and self.rows[0][0] < now - self.dump_seconds:
+            self.rows.popleft()
+
+    def _install(self):
+        app = application.base
+        for entity in scene.entities:
+            cls = type(entity)
+            if cls.__name__ in self.watch and cls not in self._originals and 'update' in cls.__dict__:
+                self._originals[cls] = cls.update
+                cls.update = self._timed(cls.update, 'watched')
+        self._probe_down = colliders.RaycastWorld.probe_down
+        colliders.RaycastWorld.probe_down = self._timed(self._probe_down, 'raycast')
+        for region in app.win.getActiveDisplayRegions():
+            region.setCullCallback(self._callback('cull'))
+            region.setDrawCallback(self._callback('draw'))
+
+        self._ursina_update = app._update
+        app.taskMgr.remove(app._update_task)
+        self._task = app._update_task = app.taskMgr.add(self._update_task, 'update')
+        self._frame_start = None
+        self._last_refresh = 0.0
+        self._reset_frame()
+
+    def _uninstall(self):
+        app = application.base
+        app.taskMgr.remove(self._task)
+        app._update_task = app.taskMgr.add(self._ursina_update, 'update')
+        for region in app.win.getActiveDisplayRegions():
+            region.clearCullCallback()
+            region.clearDrawCallback()
+        colliders.RaycastWorld.probe_down = self._probe_down
+        for cls, update in self._originals.items():
+            cls.update = update
+        self._originals.clear()
+
+    # -- overlay -------------------------------------------------------------
+
+    def averages(self):
+        """Mean ms per phase (and raycast calls per frame) over the last `window` frames."""
+        recent = list(self.rows)[-self.window:]
+        if not recent:
+            return {}
+        columns = list(zip(*recent))
+        names = PHASES + ('raycast_calls',)
+        return {name: sum(column) / len(recent) for name, column in zip(names, columns[1:])}
+
+    def histogram(self):
+        """Frame counts per HISTOGRAM_BIN_MS bin over the last `window` frames."""
+        bins = [0] * HISTOGRAM_BINS
+        for row in list(self.rows)[-self.window:]:
+            bins[min(int(row[1] / HISTOGRAM_BIN_MS), HISTOGRAM_BINS - 1)] += 1
+        return bins
+
+    def _build_hud(self):
+        self._hud = Entity(parent=camera.ui, position=window.top_left + Vec2(.02, -.02), eternal=True)
+        Entity(parent=self._hud, model='quad', origin=(-.5, .5), scale=(.5, .42), color=color.black66, z=1)
+        self._text = Text(parent=self._hud, font='VeraMono.ttf', position=(.01, -.01), scale=.75, text='')
+        # bins slower than 60 fps are orange
+        self._bars = [Entity(parent=self._hud, model='quad', origin=(-.5, -.5),
+                             color=color.lime if i * HISTOGRAM_BIN_MS < 1000 / 60 else color.orange,
+                             position=(.02 + i * .027, -.4), scale=(.022, .001))
+                      for i in range(HISTOGRAM_BINS)]
+
+    def _draw_hud(self):
+        means = self.averages()
+        if not means:
+            return
+        fps = 1000 / means['frame'] if means['frame'] else 0
+        watched = '/'.join(self.watch) or 'watched'
+        self._text.text = '\n'.join((
+            f'frame   {means["frame"]:6.2f} ms  {fps:5.0f} fps',
+            f'{watched[:7]:<7} {means["watched"]:6.2f} ms',
+            f'raycast {means["raycast"]:6.2f} ms  {means["raycast_calls"]:4.1f}/frame',
+            f'updates {means["updates"]:6.2f} ms',
+            f'cull    {means["cull"]:6.2f} ms',
+            f'draw    {means["draw"]:6.2f} ms',
+            f'other   {means["other"]:6.2f} ms',
+            f'0 ms {"frame time":^19} {(HISTOGRAM_BINS - 1) * HISTOGRAM_BIN_MS}+',
+        ))
+        bins = self.histogram()
+        peak = max(bins) or 1
+        for bar, count in zip(self._bars, bins):
+            bar.scale_y = max(.001, .12 * count / peak)
+
+    # -- controls ------------------------------------------------------------
+
+    def show(self):
+        if self.shown:
+            return
+        if not self._hud:
+            self._build_hud()
+        self._hud.enabled = True
+        self.shown = True
+        self._install()
+
+    def hide(self):
+        if not self.shown:
+            return
+        self._uninstall()
+        self._hud.enabled = False
+        self.shown = False
+
+    def dump(self, path=None):
+        """Writes the recorded frames (last `dump_seconds`) to CSV; returns the path."""
+        path = path or f'profile_{_time.strftime("%Y%m%d_%H%M%S")}.csv'
+        start = self.rows[0][0] if self.rows else 0
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('t',) + tuple(f'{name}_ms' for name in PHASES) + ('raycast_calls',))
+            for row in self.rows:
+                writer.writerow((f'{row[0] - start:.4f}',) + tuple(f'{v:.4f}' for v in row[1:-1]) + (row[-1],))
+        print_info(f'profiler: wrote {len(self.rows)} frames to {path}')
+        return path
+
+    def input(self, key):
+        if key == self.toggle_key:
+            self.hide() if self.shown else self.show()
+        elif key == self.dump_key and self.rows:
+            self.dump()
+
@@ -1,4 +1,9 @@
 from ursina import *
+import math
+
+from instancing import InstancedProps
+from lod import LODProps
+from level import load_level, LEVEL_FOLDER
 from ursina.prefabs.primitives import *
 
 def create_peach_castle():
@@ -55,45 +60,6 @@ def create_peach_castle():
         position=(0, 25.5, 0)
     )
     
-    # Side towers (4 corners)
-    for x in [-8, 8]:
-        for z in [-8, 8]:
-            # Tower base
-            side_base = Entity(
-                model='cube',
-                texture='white_cube',
-                color=color.rgb(255, 180, 180),
-                scale=(3, 2, 3),
-                position=(x, 3, z)
-            )
-            
-            # Side tower
-            side_tower = Entity(
-                model='cylinder',
-                texture='white_cube',
-                color=color.rgb(255, 150, 150),
-                scale=(2, 8, 2),
-                position=(x, 7, z)
-            )
-            
-            # Side tower top
-            side_top = Entity(
-                model='cylinder',
-                texture='white_cube',
-                color=color.rgb(255, 200, 200),
-                scale=(2.2, 1, 2.2),
-                position=(x, 11, z)
-            )
-            
-            # Side roof
-            side_roof = Entity(
-                model='cone',
-                texture='white_cube',
-                color=color.rgb(255, 100, 100),
-                scale=(2.5, 3, 2.5),
-                position=(x, 13, z)
-            )
-    
     # Main entrance
     entrance = Entity(
         model='cube',
@@ -149,42 +115,79 @@ def create_peach_castle():
             rotation_x=90
         )
     
-    # Decorative elements on base
-    for i in range(8):
-        angle = i * 45
-        x = 10 * math.cos(math.radians(angle))
-        z = 10 * math.sin(math.radians(angle))
-        decoration = Entity(
-            model='cube',
-            texture='white_cube',
-            color=color.rgb(255, 180, 180),
-            scale=(1, 2, 1),
-            position=(x, 3, z)
-        )
+    # Side towers (4 corners) and decorative elements on base.
+    # Repeated shapes are instanced: one draw call per prototype model
+    corners = [(x, z) for x in [-8, 8] for z in [-8, 8]]
+    decorations = [(10 * math.cos(math.radians(i * 45)), 10 * math.sin(math.radians(i * 45)))
+                   for i in range(8)]
 
-def create_surroundings():
-    # Create some trees around the castle
-    for i in range(12):
-        angle = i * 30
-        distance = 30
-        x = distance * math.cos(math.radians(angle))
-        z = distance * math.sin(math.radians(angle))
-        
-        # Tree trunk
-        trunk = Entity(
-            model='cylinder',
-            color=color.rgb(101, 67, 33),
-            scale=(1, 3, 1),
-            position=(x, 1.5, z)
-        )
-        
-        # Tree foliage
-        foliage = Entity(
-            model='sphere',
-            color=color.green,
-            scale=(3, 3, 3),
-            position=(x, 4, z)
-        )
+    # Tower bases + base decorations
+    InstancedProps(
+        model='cube',
+        texture='white_cube',
+        positions=[(x, 3, z) for x, z in corners + decorations],
+        scales=[(3, 2, 3)] * len(corners) + [(1, 2, 1)] * len(decorations),
+        colors=[color.rgb(255, 180, 180)] * (len(corners) + len(decorations))
+    )
+
+    # Side towers + side tower tops
+    InstancedProps(
+        model='cylinder',
+        texture='white_cube',
+        positions=[(x, 7, z) for x, z in corners] + [(x, 11, z) for x, z in corners],
+        scales=[(2, 8, 2)] * len(corners) + [(2.2, 1, 2.2)] * len(corners),
+        colors=[color.rgb(255, 150, 150)] * len(corners) + [color.rgb(255, 200, 200)] * len(corners)
+    )
+
+    # Side roofs
+    InstancedProps(
+        model='cone',
+        texture='white_cube',
+        positions=[(x, 13, z) for x, z in corners],
+        scales=[(2.5, 3, 2.5)] * len(corners),
+        colors=[color.rgb(255, 100, 100)] * len(corners)
+    )
+
+# Trees switch to low-poly past the first distance and to impostors past the second
+TREE_LOD_DISTANCES = (40, 90)
+
+def tree_ring_positions(count, distance=30, spacing=6):
+    """(x, z) for `count` trees on concentric rings starting at `distance`.
+    The first ring holds 12 trees 30 degrees apart; outer rings keep the same density.
+    """
+    positions = []
+    ring = 0
+    while len(positions) < count:
+        radius = distance + ring * spacing
+        n = min(count - len(positions), round(12 * radius / distance))
+        for i in range(n):
+            angle = i * 360 / round(12 * radius / distance)
+            positions.append((radius * math.cos(math.radians(angle)), radius * math.sin(math.radians(angle))))
+        ring += 1
+    return positions
+
+def create_surroundings(tree_count=12):
+    # Create some trees around the castle (instanced, with distance LOD: at most
+    # 6 draw calls for any tree_count; see lod.py)
+    trees = tree_ring_positions(tree_count)
+
+    # Tree trunks
+    LODProps(
+        model='cylinder',
+        positions=[(x, 1.5, z) for x, z in trees],
+        scales=[(1, 3, 1)] * len(trees),
+        colors=[color.rgb(101, 67, 33)] * len(trees),
+        distances=TREE_LOD_DISTANCES
+    )
+
+    # Tree foliage
+    LODProps(
+        model='sphere',
+        positions=[(x, 4, z) for x, z in trees],
+        scales=[(3, 3, 3)] * len(trees),
+        colors=[color.green] * len(trees),
+        distances=TREE_LOD_DISTANCES
+    )
     
     # Path from bridge
     path = Entity(
@@ -203,20 +206,9 @@ def main():
     camera.rotation_y = 30
     camera.rotation_x = 20
     
-    # Create ground
-    ground = Entity(
-        model='plane',
-        texture='white_cube',
-        color=color.green,
-        scale=(100, 1, 100),
-        position=(0, -1, 0)
-    )
-    
-    # Create castle
-    create_peach_castle()
-    
-    # Create surroundings
-    create_surroundings()
+    # Ground, castle and surroundings from levels/peach_castle.json (compiled
+    # and cached on first run); the viewer needs no colliders
+    load_level(os.path.join(LEVEL_FOLDER, 'peach_castle.json'), use_colliders=False)
     
     # Add sky
     Sky()
@@ -0,0 +1,312 @@
+"""
+replay.py — deterministic input recording and replay for the Mario scenes.
+
+- An InputLog is every frame's dt and held keys (one bit per key in KEYS),
+  plus Mario's physics state at the start and the end, in a small binary file:
+  a JSON header followed by zlib-compressed (float64 dt, uint32 key mask) rows
+- record() / replay() wrap Ursina's update task like bench.py does: the
+  recorder stores each frame's dt and keys after the entity updates, the
+  replayer writes them back before, so Mario.update() and its fixed-step clock
+  see exactly the recorded sequence
+- Chunk streamers attach synchronously (ChunkStreamer.wait) while recording
+  and replaying, so the world Mario collides with doesn't depend on thread timing
+- A headless replay never renders: it calls the update loop directly, as
+  fast as it goes, any number of times; every run's final position is
+  compared with the recording to catch behaviour drift
+
+    python replay.py record 3x1.0.py -o hall.inputs     # play, close the window to save
+    python replay.py play hall.inputs --window          # watch it at recorded pace
+    python replay.py play hall.inputs --runs 1000       # headless throughput + drift check
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import struct
+import sys
+import time as _time
+import zlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+KEYS = ('w', 'a', 's', 'd', 'space')
+MAGIC = b'R9XI'
+FORMAT_VERSION = 1
+_row = struct.Struct('<dI')
+STATE_FIELDS = ('x', 'y', 'z', 'velocity_y', 'on_ground', 'yaw')
+
+
+# =============================
+# LOG
+# =============================
+class InputLog:
+    """Per-frame (dt, key mask) rows for `scene`, with Mario's start / final state."""
+    def __init__(self, scene=None, keys=KEYS, start=None, rate=None):
+        self.scene = scene
+        self.keys = tuple(keys)
+        self.start = start          # {field: value} for STATE_FIELDS
+        self.final = None
+        self.rate = rate            # Mario's physics rate while recording
+        self.frames = []            # (dt, mask)
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def duration(self):
+        return sum(dt for dt, mask in self.frames)
+
+    def append(self, dt, held_keys):
+        mask = 0
+        for bit, key in enumerate(self.keys):
+            if held_keys[key]:
+                mask |= 1 << bit
+        self.frames.append((dt, mask))
+
+    def apply(self, mask, held_keys):
+        """Writes a row's key mask into held_keys."""
+        for bit, key in enumerate(self.keys):
+            held_keys[key] = (mask >> bit) & 1
+
+    def save(self, path):
+        header = json.dumps({'format': FORMAT_VERSION, 'scene': self.scene, 'keys': self.keys, 'rate': self.rate,
+                             'start': self.start, 'final': self.final, 'frames': len(self.frames)}).encode()
+        body = zlib.compress(b''.join(_row.pack(dt, mask) for dt, mask in self.frames), 9)
+        with open(path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<I', len(header)) + header + body)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:4] != MAGIC:
+            raise ValueError(f'{path}: not an input log')
+        size, = struct.unpack_from('<I', data, 4)
+        header = json.loads(data[8:8 + size])
+        if header['format'] != FORMAT_VERSION:
+            raise ValueError(f'{path}: input log format {header["format"]}, expected {FORMAT_VERSION}')
+        log = cls(header['scene'], header['keys'], header['start'], header['rate'])
+        log.final = header['final']
+        log.frames = list(_row.iter_unpack(zlib.decompress(data[8 + size:])))
+        return log
+
+
+def state_dict(state):
+    return {field: getattr(state, field) for field in STATE_FIELDS}
+
+
+def drift(player, log):
+    """Distance between the player's physics position and the recorded final one."""
+    final = log.final
+    s = player.state
+    return ((s.x - final['x']) ** 2 + (s.y - final['y']) ** 2 + (s.z - final['z']) ** 2) ** .5
+
+
+# =============================
+# SCENE HOOKS (Ursina imported lazily, so the log is usable without it)
+# =============================
+def find_player(name='Mario'):
+    from ursina import scene
+    return next((e for e in scene.entities if type(e).__name__ == name), None)
+
+
+def _sync_streamers():
+    from ursina import scene
+    from streaming import ChunkStreamer
+    for e in scene.entities:
+        if isinstance(e, ChunkStreamer):
+            e.wait = True
+
+
+def reset(player, log):
+    """Puts the player back in the recorded start state with a fresh clock,
+    off any platform, with the platforms (a Movers) back at their start and
+    empty ground caches.
+    """
+    from character import CharacterState
+    from fixedstep import FixedTimestep
+    player.state = CharacterState(**log.start)
+    player.previous_state = player.state
+    player.clock = FixedTimestep(rate=player.clock.rate, max_substeps=player.clock.max_substeps)
+    player.position = (player.state.x, player.state.y, player.state.z)
+    player.rotation_y = player.state.yaw
+    player.anchor = None
+    if getattr(player, 'platforms', None):
+        player.platforms.reset()
+    world = getattr(player, 'world', None)
+    while world is not None:    # GroundCache / HeightMapWorld wrappers, down to the real world
+        if hasattr(world, 'invalidate'):
+            world.invalidate()
+        world = getattr(world, 'world', None)
+
+
+def record(app, player, log):
+    """Appends every following frame's dt and keys to log."""
+    from ursina import held_keys, time
+    _sync_streamers()
+    log.start = state_dict(player.state)
+    log.rate = player.clock.rate
+    update = app._update
+
+    def recording(task):
+        status = update(task)
+        log.append(time.dt, held_keys)
+        log.final = state_dict(player.state)
+        return status
+
+    app.taskMgr.remove(app._update_task)
+    app._update_task = app.taskMgr.add(recording, 'update')
+
+
+def replay(app, player, log, on_done=None):
+    """Plays log back through the running app, one row per frame, then calls
+    on_done(drift) and hands the keyboard back.
+    """
+    from ursina import application, held_keys, time
+    _sync_streamers()
+    reset(player, log)
+    application.calculate_dt = False
+    update = app._update
+    frame = [0]
+
+    def replaying(task):
+        if frame[0] < len(log.frames):
+            dt, mask = log.frames[frame[0]]
+            log.apply(mask, held_keys)
+            time.dt = time.dt_unscaled = dt
+        status = update(task)
+        frame[0] += 1
+        if frame[0] == len(log.frames):
+            log.apply(0, held_keys)
+            application.calculate_dt = True
+            app.taskMgr.remove(app._update_task)
+            app._update_task = app.taskMgr.add(update, 'update')
+            if on_done:
+                on_done(drift(player, log))
+        return status
+
+    app.taskMgr.remove(app._update_task)
+    app._update_task = app.taskMgr.add(replaying, 'update')
+
+
+def replay_headless(app, player, log, runs=1):
+    """Replays log `runs` times through the update loop alone (no task manager,
+    no rendering). Returns (seconds per run, drift per run).
+    """
+    from ursina import application, held_keys, time
+    _sync_streamers()
+    application.calculate_dt = False
+    update = app._update
+    frames = log.frames
+    apply = log.apply
+    times, drifts = [], []
+    for _ in range(runs):
+        reset(player, log)
+        start = _time.perf_counter()
+        for dt, mask in frames:
+            apply(mask, held_keys)
+            time.dt = time.dt_unscaled = dt
+            update(None)
+        times.append(_time.perf_counter() - start)
+        drifts.append(drift(player, log))
+    return times, drifts
+
+
+# =============================
+# COMMAND LINE
+# =============================
+def run_scene(script, make_app):
+    """Runs script's main() with Ursina swapped for make_app(**kwargs), which
+    returns the app (typically with its run() replaced).
+    """
+    sys.path.insert(0, HERE)
+    spec = importlib.util.spec_from_file_location('replay_scene', os.path.join(HERE, script))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.Ursina = make_app
+    module.main()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    rec = commands.add_parser('record', help='play a scene and record the session')
+    rec.add_argument('scene', help='scene script, e.g. 3x1.0.py')
+    rec.add_argument('-o', '--out', help='log file (default: <scene>.inputs)')
+    play = commands.add_parser('play', help='replay a recorded session')
+    play.add_argument('log')
+    play.add_argument('--runs', type=int, default=1, help='headless replays to time')
+    play.add_argument('--window', action='store_true', help='replay in a window at the recorded pace')
+    play.add_argument('--tolerance', type=float, default=1e-6, help='allowed final position drift')
+    args = parser.parse_args()
+
+    from panda3d.core import loadPrcFileData
+    import ursina
+
+    if args.command == 'record':
+        out = args.out or os.path.splitext(os.path.basename(args.scene))[0] + '.inputs'
+        log = InputLog(os.path.basename(args.scene))
+
+        def recording_ursina(**kwargs):
+            app = ursina.Ursina(**kwargs)
+            run = app.run
+
+            def record_run(info=True):
+                record(app, find_player(), log)
+                try:
+                    run(info)
+                finally:
+                    log.save(out)
+                    print(f'recorded {len(log)} frames ({log.duration:.1f} s) to {out}')
+            app.run = record_run
+            return app
+
+        run_scene(args.scene, recording_ursina)
+        return
+
+    log = InputLog.load(args.log)
+    result = {}
+    if args.window:
+        def replaying_ursina(**kwargs):
+            app = ursina.Ursina(**kwargs)
+            run = app.run
+
+            def replay_run(info=True):
+                replay(app, find_player(), log, on_done=lambda d: print(f'replay done, drift {d:.3g}'))
+                run(info)
+            app.run = replay_run
+            return app
+
+        run_scene(log.scene, replaying_ursina)
+        return
+
+    # A tiny software-rendered buffer just to initialise the camera; it is never drawn to
+    loadPrcFileData('replay', 'load-display p3tinydisplay\naudio-library-name null')
+
+    def headless_ursina(**kwargs):
+        kwargs.update(window_type='offscreen', size=(64, 64), development_mode=False)
+        app = ursina.Ursina(**kwargs)
+
+        def headless_run(info=False):
+            result['times'], result['drifts'] = replay_headless(app, find_player(), log, args.runs)
+        app.run = headless_run
+        return app
+
+    run_scene(log.scene, headless_ursina)
+    times, drifts = result['times'], result['drifts']
+    total = sum(times)
+    ticks = round(log.duration * log.rate) if log.rate else 0
+    print(f'{log.scene}: {len(log)} frames ({log.duration:.1f} s of play) x {args.runs} runs in {total:.2f} s: '
+          f'{len(log) * args.runs / total:,.0f} frames/s, {ticks * args.runs / total:,.0f} physics ticks/s, '
+          f'{log.duration * args.runs / total:,.0f}x real time')
+    worst = max(drifts)
+    if worst > args.tolerance:
+        print(f'DRIFT: final position off by up to {worst:.6g} (run {drifts.index(worst) + 1}); '
+              f'behaviour changed since the recording')
+        sys.exit(1)
+    print(f'final position matches the recording in every run (max drift {worst:.3g})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""
+shapes.py — analytic collision shapes (pure Python, no Ursina import).
+
+Each shape is axis-aligned and lives at a world position with a per-axis
+scale, in the same unit space as Ursina's procedural models (base at y=0):
+
+- Cylinder : radius .5, y in [0, 1]
+- Cone     : base radius .5 at y=0, apex at y=1
+- Capsule  : radius .5, segment y in [.5, 1.5] (total height 2)
+- Disc     : flat circle of radius .5 at y=0 (e.g. a squashed cylinder's top)
+- Box      : x, z in [-.5, .5], y in [0, 1] (Box.from_center for Ursina cubes)
+- Sphere   : radius .5 centered at y=.5 (an ellipsoid under non-uniform scale)
+
+`shape.raycast(ox, oy, oz, dx, dy, dz, max_distance)` returns
+(distance, world_normal) for the nearest surface the ray enters within
+max_distance, or None. The direction must be normalized.
+Non-uniform scale is exact: rays are intersected in unit space.
+
+`shape.sweep_box(x, z, y0, y1, radius, dx, dz)` sweeps a character's
+axis-aligned body (half-width radius, y in [y0, y1]) horizontally by (dx, dz)
+against the shape's bounds and returns (fraction, (nx, nz)) at first contact,
+or None. Exact for boxes, conservative (the bounding box) for round shapes.
+
+`shape.flat_top()` gives the height and an xz rectangle of a flat top (boxes,
+cylinders, discs) for ground caches, or None.
+"""
+
+import math
+
+
+# =============================
+# Helpers
+# =============================
+
+def _quadratic_roots(a, b, c):
+    """Real roots of a*t^2 + b*t + c in ascending order (empty if none)."""
+    if abs(a) < 1e-12:
+        if abs(b) < 1e-12:
+            return ()
+        return (-c / b,)
+    disc = b * b - 4 * a * c
+    if disc < 0:
+        return ()
+    root = math.sqrt(disc)
+    t0 = (-b - root) / (2 * a)
+    t1 = (-b + root) / (2 * a)
+    return (t0, t1) if t0 <= t1 else (t1, t0)
+
+
+# =============================
+# SHAPES
+# =============================
+class Shape:
+    """Base: world position (bottom-center for unit shapes) and per-axis scale."""
+    kind = 'shape'
+
+    def __init__(self, position=(0, 0, 0), scale=(1, 1, 1)):
+        self.position = tuple(position)
+        self.scale = tuple(scale)
+        self._update_bounds()
+
+    def _update_bounds(self):
+        px, py, pz = self.position
+        sx, sy, sz = self.scale
+        self.min = (px - .5 * abs(sx), py + min(0, self.height * sy), pz - .5 * abs(sz))
+        self.max = (px + .5 * abs(sx), py + max(0, self.height * sy), pz + .5 * abs(sz))
+
+    height = 1
+
+    def raycast(self, ox, oy, oz, dx, dy, dz, max_distance):
+        # Cheap slab test against the world bounds before the exact test
+        if not self._ray_hits_bounds(ox, oy, oz, dx, dy, dz, max_distance):
+            return None
+        px, py, pz = self.position
+        sx, sy, sz = self.scale
+        # Into unit space. t is unchanged because the map is linear.
+        hit = self._unit_raycast((ox - px) / sx, (oy - py) / sy, (oz - pz) / sz,
+                                 dx / sx, dy / sy, dz / sz, max_distance)
+        if hit is None:
+            return None
+        t, (nx, ny, nz) = hit
+        # Normals transform by the inverse transpose of the scale
+        nx, ny, nz = nx / sx, ny / sy, nz / sz
+        length = math.sqrt(nx * nx + ny * ny + nz * nz)
+        return t, (nx / length, ny / length, nz / length)
+
+    def _ray_hits_bounds(self, ox, oy, oz, dx, dy, dz, max_distance):
+        t_near, t_far = 0.0, max_distance
+        for o, d, lo, hi in ((ox, dx, self.min[0], self.max[0]),
+                             (oy, dy, self.min[1], self.max[1]),
+                             (oz, dz, self.min[2], self.max[2])):
+            if abs(d) < 1e-12:
+                if o < lo or o > hi:
+                    return False
+                continue
+            t0 = (lo - o) / d
+            t1 = (hi - o) / d
+            if t0 > t1:
+                t0, t1 = t1, t0
+            if t0 > t_near:
+                t_near = t0
+            if t1 < t_far:
+                t_far = t1
+            if t_near > t_far:
+                return False
+        return True
+
+    def sweep_box(self, x, z, y0, y1, radius, dx, dz):
+        lo, hi = self.min, self.max
+        if hi[1] <= y0 or lo[1] >= y1:
+            return None
+        # Slabs of the bounds grown by the body's half-width, crossed by its centre
+        # (x, then z; unrolled, this runs for every shape a character walks near)
+        t_near, t_far, normal = -math.inf, math.inf, None
+        a, b = lo[0] - radius, hi[0] + radius
+        if abs(dx) < 1e-12:
+            if x <= a or x >= b:
+                return None
+        else:
+            t0, t1 = (a - x) / dx, (b - x) / dx
+            if dx > 0:
+                t_near, t_far, normal = t0, t1, (-1, 0)
+            else:
+                t_near, t_far, normal = t1, t0, (1, 0)
+        a, b = lo[2] - radius, hi[2] + radius
+        if abs(dz) < 1e-12:
+            if z <= a or z >= b:
+                return None
+        else:
+            t0, t1 = (a - z) / dz, (b - z) / dz
+            if dz < 0:
+                t0, t1 = t1, t0
+            if t0 > t_near:
+                t_near = t0
+                normal = (0, -1) if dz > 0 else (0, 1)
+            if t1 < t_far:
+                t_far = t1
+        # Already overlapping (t_near < 0) is let go so the body can move out;
+        # t_near == t_far only grazes a corner
+        if normal is None or t_near < 0 or t_near >= t_far or t_near > 1:
+            return None
+        return t_near, normal
+
+    def _unit_raycast(self, px, py, pz, dx, dy, dz, max_distance):
+        raise NotImplementedError
+
+    def flat_top(self):
+        """(y, x0, z0, x1, z1): the top's height and the largest xz rectangle on
+        it that is flat, or None if the top isn't a horizontal plane.
+        """
+        return None
+
+    def __repr__(self):
+        return f'{type(self).__name__}(position={self.position}, scale={self.scale})'
+
+
+def _disc_hit(px, py, pz, dx, dy, dz, plane_y, radius_sq, max_distance, normal_y):
+    """Ray vs horizontal disc, only when crossing towards the side normal_y faces from."""
+    if dy * normal_y >= 0:
+        return None
+    t = (plane_y - py) / dy
+    if t < 0 or t > max_distance:
+        return None
+    x = px + t * dx
+    z = pz + t * dz
+    if x * x + z * z > radius_sq:
+        return None
+    return t, (0, normal_y, 0)
+
+
+def _nearest(*hits):
+    best = None
+    for h in hits:
+        if h is not None and (best is None or h[0] < best[0]):
+            best = h
+    return best
+
+
+class Cylinder(Shape):
+    kind = 'cylinder'
+
+    def _unit_raycast(self, px, py, pz, dx, dy, dz, max_distance):
+        side = None
+        for t in _quadratic_roots(dx * dx + dz * dz, 2 * (px * dx + pz * dz), px * px + pz * pz - .25):
+            if 0 <= t <= max_distance:
+                y = py + t * dy
+                x = px + t * dx
+                z = pz + t * dz
+                # entering: moving against the outward radial normal
+                if 0 <= y <= 1 and x * dx + z * dz < 0:
+                    side = t, (2 * x, 0, 2 * z)
+                    break
+        return _nearest(
+            side,
+            _disc_hit(px, py, pz, dx, dy, dz, 1, .25, max_distance, 1),
+            _disc_hit(px, py, pz, dx, dy, dz, 0, .25, max_distance, -1),
+        )
+
+    def flat_top(self):
+        return _round_top(self, self.max[1]) if self.scale[1] > 0 else None
+
+
+def _round_top(shape, y):
+    # The largest rectangle inside an ellipse with half-axes a, b is a/sqrt(2) x b/sqrt(2)
+    hx, hz = abs(shape.scale[0]) / 2 / math.sqrt(2), abs(shape.scale[2]) / 2 / math.sqrt(2)
+    px, pz = shape.position[0], shape.position[2]
+    return y, px - hx, pz - hz, px + hx, pz + hz
+
+
+class Cone(Shape):
+    kind = 'cone'
+
+    def _unit_raycast(self, px, py, pz, dx, dy, dz, max_distance):
+        # x^2 + z^2 = k^2 (1 - y)^2 with k = .5
+        k2 = .25
+        h = 1 - py
+        side = None
+        roots = _quadratic_roots(dx * dx + dz * dz - k2 * dy * dy,
+                                 2 * (px * dx + pz * dz) + 2 * k2 * h * dy,
+                                 px * px + pz * pz - k2 * h * h)
+        for t in roots:
+            if 0 <= t <= max_distance:
+                x = px + t * dx
+                y = py + t * dy
+                z = pz + t * dz
+                nx, ny, nz = 2 * x, 2 * k2 * (1 - y), 2 * z
+                if 0 <= y <= 1 and nx * dx + ny * dy + nz * dz <= 0:
+                    # the gradient vanishes at the apex; report straight up there
+                    side = t, (nx, ny, nz) if ny > 1e-9 else (0, 1, 0)
+                    break
+        return _nearest(side, _disc_hit(px, py, pz, dx, dy, dz, 0, .25, max_distance, -1))
+
+
+class Capsule(Shape):
+    kind = 'capsule'
+    height = 2
+
+    def _unit_raycast(self, px, py, pz, dx, dy, dz, max_distance):
+        side = None
+        for t in _quadratic_roots(dx * dx + dz * dz, 2 * (px * dx + pz * dz), px * px + pz * pz - .25):
+            if 0 <= t <= max_distance:
+                x = px + t * dx
+                y = py + t * dy
+                z = pz + t * dz
+                if .5 <= y <= 1.5 and x * dx + z * dz < 0:
+                    side = t, (2 * x, 0, 2 * z)
+                    break
+        caps = []
+        for cy in (.5, 1.5):
+            qy = py - cy
+            for t in _quadratic_roots(dx * dx + dy * dy + dz * dz, 2 * (px * dx + qy * dy + pz * dz),
+                                      px * px + qy * qy + pz * pz - .25):
+                if 0 <= t <= max_distance:
+                    x = px + t * dx
+                    y = py + t * dy
+                    z = pz + t * dz
+                    # only the outer hemisphere belongs to the surface
+                    if (y <= .5 if cy == .5 else y >= 1.5) and x * dx + (y - cy) * dy + z * dz < 0:
+                        caps.append((t, (x, y - cy, z)))
+                        break
+        return _nearest(side, *caps)
+
+
+class Disc(Shape):
+    """Two-sided flat disc: hit from above reports +y, from below -y."""
+    kind = 'disc'
+    height = 0
+
+    def _unit_raycast(self, px, py, pz, dx, dy, dz, max_distance):
+        return _nearest(
+            _disc_hit(px, py, pz, dx, dy, dz, 0, .25, max_distance, 1),
+            _disc_hit(px, py, pz, dx, dy, dz, 0, .25, max_distance, -1),
+        )
+
+    def flat_top(self):
+        return _round_top(self, self.position[1])
+
+
+class Box(Shape):
+    kind = 'box'
+
+    @classmethod
+    def from_center(cls, center, size):
+        """Box for a centered model like Ursina's 'cube' at `center` scaled by `size`."""
+        return cls((center[0], center[1] - size[1] / 2, center[2]), size)
+
+    def _unit_raycast(self, px, py, pz, dx, dy, dz, max_distance):
+        t_near, t_far = -math.inf, math.inf
+        near_normal = far_normal = None
+        for axis, o, d, lo, hi in ((0, px, dx, -.5, .5), (1, py, dy, 0, 1), (2, pz, dz, -.5, .5)):
+            if abs(d) < 1e-12:
+                if o < lo or o > hi:
+                    return None
+                continue
+            t0 = (lo - o) / d
+            t1 = (hi - o) / d
+            sign = -1
+            if t0 > t1:
+                t0, t1 = t1, t0
+                sign = 1
+            if t0 > t_near:
+                t_near = t0
+                near_normal = [0, 0, 0]
+                near_normal[axis] = sign
+            if t1 < t_far:
+                t_far = t1
+                far_normal = [0, 0, 0]
+                far_normal[axis] = -sign
+            if t_near > t_far:
+                return None
+        if near_normal is not None and 0 <= t_near <= max_distance:
+            return t_near, tuple(near_normal)
+        # Starting inside: report the exit face, like Panda3D's CollisionBox
+        if t_near < 0 and far_normal is not None and 0 <= t_far <= max_distance:
+            return t_far, tuple(far_normal)
+        return None
+
+    def flat_top(self):
+        return self.max[1], self.min[0], self.min[2], self.max[0], self.max[2]
+
+
+class Sphere(Shape):
+    kind = 'sphere'
+
+    def _unit_raycast(self, px, py, pz, dx, dy, dz, max_distance):
+        # Entry point, or the exit point when starting inside (like CollisionSphere)
+        qy = py - .5
+        for t in _quadratic_roots(dx * dx + dy * dy + dz * dz, 2 * (px * dx + qy * dy + pz * dz),
+                                  px * px + qy * qy + pz * pz - .25):
+            if 0 <= t <= max_distance:
+                return t, (px + t * dx, qy + t * dy, pz + t * dz)
+        return None
@@ -0,0 +1,323 @@
+"""
+simthread.py — fixed-rate simulation on its own thread (no Ursina import).
+
+Inline, physics runs inside Ursina's update(): a slow render frame delays the
+next steps and then runs them back to back (fixedstep.py). SimulationThread
+ticks its systems on a daemon thread against an absolute schedule instead, so
+steps keep their spacing while the main thread is drawing (Panda3D releases
+the GIL while it culls and draws).
+
+- InputSlot: the newest input from the render loop, stamped with when it
+  changed (one attribute store: no lock)
+- StateBuffer: double-buffered float64 snapshot for one writer. The writer
+  fills the back slot and then bumps `sequence`; a reader copies the front slot
+  and retries if a snapshot was published meanwhile (the one after it would
+  be written over the slot being copied), so the writer never waits
+- CharacterSim: a character.CharacterController and its world (plus the
+  platforms.PlatformSystem carrying it, if any), stepped by tick(); publishes
+  the previous and current states (x, y, z, yaw, velocity_y, on_ground) plus
+  the input stamp it used. sample() interpolates them for the renderer. The same object is ticked inline (FixedTimestep) or
+  by a SimulationThread, so both modes are measured the same way
+- AgentSim: an agents.AgentSystem and its brain, publishing (x, y, z, yaw)
+  rows for crowd.Crowd
+- On a thread the world must not touch the scene graph: use the static grid
+  (colliders.static_grid), not colliders.RaycastWorld's Panda3D fallback. The
+  main thread still edits that grid (streamed chunks, entities enabled or
+  disabled); SpatialGrid's lock keeps each query and ground patch whole
+- Run this file to compare input latency and step jitter inline and threaded
+  under a simulated render load, and to check snapshots are never torn
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from character import CharacterState, interpolate
+
+
+# =============================
+# HANDOFF
+# =============================
+class InputSlot:
+    """Latest input value as (stamp, value); the stamp is the perf_counter()
+    time it last changed.
+    """
+    def __init__(self, value=None):
+        self.latest = (0.0, value)
+
+    def set(self, value, now=None):
+        if value != self.latest[1]:
+            self.latest = (time.perf_counter() if now is None else now, value)
+
+
+class StateBuffer:
+    """Two float64 arrays of `shape`: publish() from one thread, read() from
+    any (see the module docstring).
+    """
+    def __init__(self, shape):
+        self.slots = np.zeros((2, *shape))
+        self.sequence = 0
+        self.retries = 0
+
+    def publish(self, values):
+        self.slots[(self.sequence + 1) & 1] = values
+        self.sequence += 1
+
+    def read(self, out=None):
+        """(sequence, copy of the newest snapshot)."""
+        while True:
+            sequence = self.sequence
+            if out is None:
+                out = self.slots[sequence & 1].copy()
+            else:
+                out[...] = self.slots[sequence & 1]
+            # Unchanged: the next publish, which overwrites this slot, can't
+            # have started (NumPy copies large arrays outside the GIL)
+            if self.sequence == sequence:
+                return sequence, out
+            self.retries += 1
+
+
+# =============================
+# SYSTEMS
+# =============================
+_FIELDS = 7     # x, y, z, yaw, velocity_y, on_ground, teleported
+
+
+def _row(state):
+    return state.x, state.y, state.z, state.yaw, state.velocity_y, state.on_ground, state.teleported
+
+
+def _state(row):
+    return CharacterState(row[0], row[1], row[2], row[4], bool(row[5]), row[3], teleported=bool(row[6]))
+
+
+class CharacterSim:
+    """One character's simulation. The render loop calls input.set((move_x,
+    move_z, jump)) and sample(); tick() belongs to whoever runs the steps.
+    `ticks` keeps the perf_counter() time of each recent step. With
+    `platforms`, tick that system first on the same thread.
+    """
+    def __init__(self, controller, state, world, platforms=None, history=4096):
+        self.controller = controller
+        self.state = state
+        self.world = world
+        self.platforms = platforms
+        self.anchor = None
+        self.input = InputSlot((0.0, 0.0, False))
+        self.snapshot = StateBuffer((3, _FIELDS))     # header (tick time, dt, input stamp), previous, current
+        self.ticks = deque(maxlen=history)
+        self.shown = 0.0        # input stamp behind the last sample()
+        self._frame = np.zeros((3, _FIELDS))
+        self._publish(self.state, 0.0, 0.0, 0.0)
+
+    def _publish(self, previous, at, dt, stamp):
+        frame = self._frame
+        frame[0, :3] = at, dt, stamp
+        frame[1] = _row(previous)
+        frame[2] = _row(self.state)
+        self.snapshot.publish(frame)
+
+    def tick(self, dt, at=0.0):
+        """One fixed step. `at` is its scheduled perf_counter() time (threaded)."""
+        self.ticks.append(time.perf_counter())
+        stamp, (move_x, move_z, jump) = self.input.latest
+        previous = state = self.state
+        platforms = self.platforms
+        if platforms is not None:
+            state = platforms.carry(state, self.anchor, self.controller.foot_offset)
+        self.state = self.controller.step(state, move_x, move_z, jump, dt, self.world)
+        if platforms is not None:
+            self.anchor = platforms.anchor(self.state, self.controller.foot_offset)
+        self._publish(previous, at, dt, stamp)
+
+    def sample(self, alpha=None, now=None):
+        """(x, y, z, yaw, velocity_y, on_ground) blended from the previous to
+        the current published state by alpha; without one, by how far `now`
+        (default: the time) is into the step after the last tick.
+        """
+        _, frame = self.snapshot.read()
+        at, dt, stamp = frame[0, :3]
+        if alpha is None:
+            now = time.perf_counter() if now is None else now
+            alpha = min(1.0, max(0.0, (now - at) / dt)) if dt else 1.0
+        current = _state(frame[2])
+        x, y, z, yaw = interpolate(_state(frame[1]), current, alpha)
+        self.shown = stamp
+        return x, y, z, yaw, current.velocity_y, current.on_ground
+
+
+class AgentSim:
+    """An agents.AgentSystem stepped by tick() with `brain` (see crowd.py);
+    snapshot rows are each agent's (x, y, z, yaw in radians).
+    """
+    def __init__(self, system, brain):
+        self.system = system
+        self.brain = brain
+        self.snapshot = StateBuffer((system.count, 4))
+        self._rows = np.zeros((system.count, 4))
+        self._publish()
+
+    def _publish(self):
+        self.system.write_instances(self._rows)
+        self.snapshot.publish(self._rows)
+
+    def tick(self, dt, at=0.0):
+        move, jump = self.brain(self.system, dt)
+        self.system.step(move, jump, dt)
+        self._publish()
+
+
+# =============================
+# THREAD
+# =============================
+class SimulationThread:
+    """Ticks every added system at `rate` Hz on a daemon thread. Steps are due
+    at origin + n / rate; when more than max_substeps are overdue the excess is
+    dropped (`dropped` totals it), as FixedTimestep does. `lateness` keeps how
+    late each recent step started, in seconds.
+    """
+    def __init__(self, rate=120, max_substeps=8, history=4096):
+        self.rate = rate
+        self.dt = 1 / rate
+        self.max_substeps = max_substeps
+        self.systems = []
+        self.steps = 0
+        self.dropped = 0.0
+        self.lateness = deque(maxlen=history)
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, system):
+        self.systems.append(system)
+        return system
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='simulation', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        due = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                now = time.perf_counter()
+                if now < due:
+                    self._stop.wait(due - now)
+                    continue
+                behind = int((now - due) * self.rate)
+                if behind >= self.max_substeps:
+                    self.dropped += behind * self.dt
+                    due += behind * self.dt
+                self.lateness.append(now - due)
+                for system in self.systems:
+                    system.tick(self.dt, due)
+                self.steps += 1
+                due += self.dt
+        except Exception as error:     # kept for the main thread: sample() just stops changing
+            self.error = error
+            raise
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import random
+    import statistics
+    from character import CharacterController, GroundCache
+    from fixedstep import FixedTimestep
+    from shapes import Box
+    from spatialgrid import SpatialGrid
+
+    def percentile(values, p):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] if ordered else 0.0
+
+    def run(label, threaded, seconds=6, rate=120):
+        # A 30x30 floor with a wall of pillars; 'rendering' is a 4-40 ms frame
+        # outside the GIL (as Panda3D's cull/draw is) plus 1 ms of Python.
+        # Input turns every 0.25 s; latency is from the change to the end of
+        # the first frame drawn from a step that used it
+        grid = SpatialGrid([Box.from_center((0, -.5, 0), (30, 1, 30))]
+                           + [Box.from_center((x, 1, 6), (1, 2, 1)) for x in range(-12, 13, 3)])
+        controller = CharacterController(spawn_point=(0, 2, 0), radius=.5)
+        sim = CharacterSim(controller, CharacterState(0, 2, 0), GroundCache(grid))
+        thread = SimulationThread(rate=rate).start() if threaded else None
+        if thread:
+            thread.add(sim)
+        clock = FixedTimestep(rate=rate)
+        random.seed(4)
+        latencies, frames, seen = [], 0, 0.0
+        start = last = time.perf_counter()
+        while last - start < seconds:
+            now = time.perf_counter()
+            turn = int((now - start) * 4)
+            sim.input.set(((1, 0, -1, 0)[turn % 4], (0, 1, 0, -1)[turn % 4], turn % 3 == 0))
+            if thread:
+                sim.sample(now=now)
+            else:
+                for _ in range(clock.advance(now - last)):
+                    sim.tick(clock.dt)
+                sim.sample(clock.alpha)
+            last = now
+            busy = time.perf_counter() + .001
+            while time.perf_counter() < busy:
+                pass
+            time.sleep(random.choice((.004, .008, .012, .016, .040)))
+            done = time.perf_counter()
+            if sim.shown != seen:
+                latencies.append((done - sim.shown) * 1000)
+                seen = sim.shown
+            frames += 1
+        if thread:
+            thread.stop()
+        gaps = [(b - a) * 1000 for a, b in zip(sim.ticks, list(sim.ticks)[1:])]
+        print(f'{label:>9}: {frames / seconds:5.1f} fps, input latency mean {statistics.mean(latencies):5.1f} ms '
+              f'p95 {percentile(latencies, 95):5.1f} ms, step spacing {statistics.mean(gaps):4.2f} ms '
+              f'sd {statistics.pstdev(gaps):5.2f} ms (ideal {1000 / rate:.2f} sd 0), '
+              f'{len(sim.ticks) and len(gaps) + 1} steps')
+
+    def handoff(shape=(10_000, 4), seconds=2):
+        # A writer publishing snapshots filled with their own sequence number
+        # as fast as it can; every snapshot read must hold one value throughout
+        buffer, stop = StateBuffer(shape), threading.Event()
+        values = np.zeros(shape)
+
+        def write():
+            while not stop.is_set():
+                values.fill(buffer.sequence + 1)
+                buffer.publish(values)
+
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+        reads = torn = 0
+        out = np.empty(shape)
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            sequence, snapshot = buffer.read(out)
+            reads += 1
+            torn += snapshot.min() != snapshot.max() or (sequence and snapshot[0, 0] != sequence)
+        stop.set()
+        writer.join()
+        print(f'handoff {shape}: {reads} reads, {buffer.sequence} snapshots, {buffer.retries} retries, {torn} torn')
+        assert not torn
+
+    run('inline', False)
+    run('threaded', True)
+    handoff()
+    handoff((1000, 2000))
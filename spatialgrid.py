@@ -0,0 +1,399 @@
+"""
+spatialgrid.py — uniform xz grid over static shapes (no Ursina import).
+
+Shapes from shapes.py are bucketed into square columns of `cell_size`.
+Downward ground probes look at one column; horizontal sweeps walk only the
+columns the ray crosses (2D DDA). Shapes covering more than `max_cells`
+columns (e.g. a huge ground plane) go in a small always-tested list instead.
+
+SpatialGrid implements character.py's world interface (probe_down, sweep_box)
+and adds raycast() for arbitrary directions. ground_patch() / patch_valid()
+let character.GroundCache answer ground probes without a query: every
+insert / remove stamps the columns it touches, so a patch is only trusted
+while its column is unchanged (move shapes with update(), not in place).
+Columns holding a `kinematic` shape (platforms.py) never give a patch.
+changed_since() lets baked data (heightmap.py) spot columns edited after it.
+Edits and queries hold the grid's lock, so platforms ticking and characters
+stepping on a simthread.SimulationThread share the grid with chunks
+streamed in (and entities disabled) on the main thread; a ground patch's
+stamp is read together with the shapes it was cut from.
+Run this file for the microbenchmark.
+"""
+
+import math
+import threading
+
+
+class SpatialGrid:
+    def __init__(self, shapes=(), cell_size=4, max_cells=256):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.cells = {}
+        self.large = []
+        self._shape_cells = {}
+        self._stamp = 0
+        self._cell_stamps = {}      # column -> stamp of its last insert / remove
+        self._large_stamp = 0
+        self._lock = threading.Lock()
+        for shape in shapes:
+            self._insert(shape)
+
+    def __len__(self):
+        return len(self._shape_cells)
+
+    def __contains__(self, shape):
+        return id(shape) in self._shape_cells
+
+    def __iter__(self):
+        return (shape for shape, keys in self._shape_cells.values())
+
+    def _cell_range(self, shape):
+        cs = self.cell_size
+        return (math.floor(shape.min[0] / cs), math.floor(shape.max[0] / cs),
+                math.floor(shape.min[2] / cs), math.floor(shape.max[2] / cs))
+
+    def insert(self, shape):
+        with self._lock:
+            return self._insert(shape)
+
+    def remove(self, shape):
+        with self._lock:
+            self._remove(shape)
+
+    def _insert(self, shape):
+        self._stamp += 1
+        x0, x1, z0, z1 = self._cell_range(shape)
+        if (x1 - x0 + 1) * (z1 - z0 + 1) > self.max_cells:
+            self.large.append(shape)
+            self._shape_cells[id(shape)] = (shape, None)
+            self._large_stamp = self._stamp
+            return shape
+        keys = [(ix, iz) for ix in range(x0, x1 + 1) for iz in range(z0, z1 + 1)]
+        for key in keys:
+            self.cells.setdefault(key, []).append(shape)
+            self._cell_stamps[key] = self._stamp
+        self._shape_cells[id(shape)] = (shape, keys)
+        return shape
+
+    def _remove(self, shape):
+        self._stamp += 1
+        shape, keys = self._shape_cells.pop(id(shape))
+        if keys is None:
+            self.large.remove(shape)
+            self._large_stamp = self._stamp
+            return
+        for key in keys:
+            bucket = self.cells[key]
+            bucket.remove(shape)
+            self._cell_stamps[key] = self._stamp
+            if not bucket:
+                del self.cells[key]
+
+    def update(self, shape):
+        """Re-buckets a shape after its position/scale (and bounds) changed.
+        One still in the same cells (a platform's small moves) only bumps their
+        stamps. A shape taken out of the grid (e.g. its entity disabled) is
+        left out.
+        """
+        with self._lock:
+            if id(shape) not in self._shape_cells:
+                return
+            keys = self._shape_cells[id(shape)][1]
+            if keys is not None:
+                x0, x1, z0, z1 = self._cell_range(shape)
+                if keys[0] == (x0, z0) and keys[-1] == (x1, z1):
+                    self._stamp += 1
+                    for key in keys:
+                        self._cell_stamps[key] = self._stamp
+                    return
+            self._remove(shape)
+            self._insert(shape)
+
+    # =============================
+    # QUERIES
+    # =============================
+    def probe_down(self, x, y, z, distance):
+        """Nearest surface below (x, y, z) within distance:
+        (hit_y, shape, shape_velocity_y) or None.
+        """
+        with self._lock:
+            return self._probe_down(x, y, z, distance)
+
+    def _probe_down(self, x, y, z, distance):
+        cs = self.cell_size
+        bucket = self.cells.get((math.floor(x / cs), math.floor(z / cs)), ())
+        best = None
+        best_t = distance
+        for candidates in (bucket, self.large):
+            for shape in candidates:
+                lo, hi = shape.min, shape.max
+                if not (lo[0] <= x <= hi[0] and lo[2] <= z <= hi[2]) or lo[1] > y or hi[1] < y - best_t:
+                    continue
+                if y >= hi[1] and shape.kind == 'box':
+                    best_t = y - hi[1]      # from above a box, the ray lands on its top
+                    best = shape
+                    continue
+                hit = shape.raycast(x, y, z, 0, -1, 0, best_t)
+                if hit is not None:
+                    best_t = hit[0]
+                    best = shape
+        if best is None:
+            return None
+        return y - best_t, best, getattr(best, 'velocity_y', 0.0)
+
+    def _column_stamp(self, key):
+        return max(self._cell_stamps.get(key, 0), self._large_stamp)
+
+    def ground_patch(self, x, z, y):
+        """Where a downward probe lands on the flat top at height y under (x, z),
+        as (x0, z0, x1, z1, y, ceiling, grid, column, stamp), or None: any probe
+        from (x', y', z') with x0 <= x' < x1, z0 <= z' < z1 and y <= y' <= ceiling
+        hits that top first, while patch_valid() holds. The rectangle stays in
+        (x, z)'s column and is cut back from anything else reaching above y.
+        """
+        with self._lock:
+            return self._ground_patch(x, z, y)
+
+    def _ground_patch(self, x, z, y):
+        cs = self.cell_size
+        key = (math.floor(x / cs), math.floor(z / cs))
+        candidates = [*self.large, *self.cells.get(key, ())]
+        surface = None
+        for shape in candidates:
+            top = shape.flat_top()
+            if top is not None and abs(top[0] - y) < 1e-6 and top[1] < x < top[3] and top[2] < z < top[4]:
+                surface = top
+                break
+        if surface is None or any(getattr(shape, 'kinematic', False) for shape in candidates):
+            return None     # moving platforms don't restamp the column on every move
+        y = surface[0]
+        # Half-open like the columns: a lower edge shared with a shape moves past it
+        x0 = max(math.nextafter(surface[1], math.inf), key[0] * cs)
+        z0 = max(math.nextafter(surface[2], math.inf), key[1] * cs)
+        x1, z1 = min(surface[3], (key[0] + 1) * cs), min(surface[4], (key[1] + 1) * cs)
+
+        # Anything over (x, z) caps the heights the patch answers for; anything
+        # else reaching above the top is cut out of the rectangle
+        ceiling = math.inf
+        around = []
+        for shape in candidates:
+            lo, hi = shape.min, shape.max
+            if hi[1] <= y + 1e-6 or lo[0] >= x1 or hi[0] < x0 or lo[2] >= z1 or hi[2] < z0:
+                continue
+            if lo[0] <= x <= hi[0] and lo[2] <= z <= hi[2]:
+                if lo[1] <= y + 1e-6:
+                    return None     # (its bounds) cross the top right here
+                ceiling = min(ceiling, lo[1])
+            else:
+                around.append(shape)
+        for shape in around:
+            lo, hi = shape.min, shape.max
+            if lo[1] >= ceiling or lo[0] >= x1 or hi[0] < x0 or lo[2] >= z1 or hi[2] < z0:
+                continue
+            # Keep the largest of the four rectangles on (x, z)'s side of it
+            cuts = []
+            if hi[0] <= x:
+                cuts.append(((x1 - hi[0]) * (z1 - z0), (math.nextafter(hi[0], math.inf), z0, x1, z1)))
+            if lo[0] >= x:
+                cuts.append(((lo[0] - x0) * (z1 - z0), (x0, z0, lo[0], z1)))
+            if hi[2] <= z:
+                cuts.append(((x1 - x0) * (z1 - hi[2]), (x0, math.nextafter(hi[2], math.inf), x1, z1)))
+            if lo[2] >= z:
+                cuts.append(((x1 - x0) * (lo[2] - z0), (x0, z0, x1, lo[2])))
+            x0, z0, x1, z1 = max(cuts)[1]
+        return x0, z0, x1, z1, y, ceiling, self, key, self._column_stamp(key)
+
+    def patch_valid(self, patch):
+        """Whether nothing was inserted into or removed from patch's column since."""
+        return patch[6] is self and self._column_stamp(patch[7]) == patch[8]
+
+    @property
+    def stamp(self):
+        """Increases with every insert / remove / update (see changed_since())."""
+        return self._stamp
+
+    def changed_since(self, x, z, stamp):
+        """Whether (x, z)'s column changed after the grid's `stamp` was read."""
+        cs = self.cell_size
+        return self._column_stamp((math.floor(x / cs), math.floor(z / cs))) > stamp
+
+    def sweep_box(self, x, z, y0, y1, radius, dx, dz):
+        """First shape a character body moving by (dx, dz) runs into:
+        (fraction, (nx, nz), shape) or None. See shapes.Shape.sweep_box.
+        """
+        with self._lock:
+            return self._sweep_box(x, z, y0, y1, radius, dx, dz)
+
+    def _sweep_box(self, x, z, y0, y1, radius, dx, dz):
+        cs = self.cell_size
+        # The body's swept footprint: a shape's bounds clear of it can't be hit
+        if dx < 0:
+            bx0, bx1 = x + dx - radius, x + radius
+        else:
+            bx0, bx1 = x - radius, x + dx + radius
+        if dz < 0:
+            bz0, bz1 = z + dz - radius, z + radius
+        else:
+            bz0, bz1 = z - radius, z + dz + radius
+        cells = self.cells
+        near = []
+        for ix in range(math.floor(bx0 / cs), math.floor(bx1 / cs) + 1):
+            for iz in range(math.floor(bz0 / cs), math.floor(bz1 / cs) + 1):
+                for shape in cells.get((ix, iz), ()):
+                    # Floors and ceilings (most of every bucket) never reach the
+                    # body's height; most of the rest of a column is off to the side
+                    hi = shape.max
+                    if hi[1] <= y0 or hi[0] < bx0 or hi[2] < bz0:
+                        continue
+                    lo = shape.min
+                    if lo[1] >= y1 or lo[0] > bx1 or lo[2] > bz1 or shape in near:
+                        continue
+                    near.append(shape)
+        for shape in self.large:
+            lo, hi = shape.min, shape.max
+            if not (hi[1] <= y0 or lo[1] >= y1 or hi[0] < bx0 or lo[0] > bx1 or hi[2] < bz0 or lo[2] > bz1):
+                near.append(shape)
+        best = None
+        for shape in near:
+            hit = shape.sweep_box(x, z, y0, y1, radius, dx, dz)
+            if hit is not None and (best is None or hit[0] < best[0]):
+                best = hit[0], hit[1], shape
+        return best
+
+    def raycast(self, ox, oy, oz, dx, dy, dz, max_distance, ignore=None):
+        """Nearest hit along a normalized direction: (distance, world_normal, shape) or None."""
+        with self._lock:
+            return self._raycast(ox, oy, oz, dx, dy, dz, max_distance, ignore)
+
+    def _raycast(self, ox, oy, oz, dx, dy, dz, max_distance, ignore=None):
+        best = None
+        best_t = max_distance
+        tested = set()
+        if ignore:
+            tested.update(id(s) for s in ignore)
+
+        def test(candidates):
+            nonlocal best, best_t
+            for shape in candidates:
+                if id(shape) in tested:
+                    continue
+                tested.add(id(shape))
+                hit = shape.raycast(ox, oy, oz, dx, dy, dz, best_t)
+                if hit is not None:
+                    best_t = hit[0]
+                    best = hit[0], hit[1], shape
+
+        test(self.large)
+
+        cs = self.cell_size
+        ix, iz = math.floor(ox / cs), math.floor(oz / cs)
+        horizontal = math.sqrt(dx * dx + dz * dz)
+        if horizontal < 1e-9:
+            test(self.cells.get((ix, iz), ()))
+            return best
+
+        # 2D DDA over the columns the ray's xz projection crosses
+        step_x = 1 if dx > 0 else -1
+        step_z = 1 if dz > 0 else -1
+        t_delta_x = cs / abs(dx) if dx else math.inf
+        t_delta_z = cs / abs(dz) if dz else math.inf
+        t_max_x = ((ix + (step_x > 0)) * cs - ox) / dx if dx else math.inf
+        t_max_z = ((iz + (step_z > 0)) * cs - oz) / dz if dz else math.inf
+        t = 0.0
+        while t <= best_t:
+            test(self.cells.get((ix, iz), ()))
+            if t_max_x < t_max_z:
+                t = t_max_x
+                t_max_x += t_delta_x
+                ix += step_x
+            else:
+                t = t_max_z
+                t_max_z += t_delta_z
+                iz += step_z
+        return best
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import random
+    import time
+    from shapes import Box
+    from character import StaticWorld
+
+    random.seed(3)
+    print(f'{"colliders":>9} {"room":>6} | {"probe linear":>12} {"probe grid":>10} | {"sweep linear":>12} {"sweep grid":>10}  (us/query)')
+    for count in (10, 100, 1000, 10000):
+        room = 30 * math.sqrt(count / 10)   # keep collider density constant as the room grows
+        boxes = [Box.from_center((0, -0.5, 0), (room, 1, room))]
+        for _ in range(count - 1):
+            sx, sy, sz = random.uniform(.5, 4), random.uniform(.5, 4), random.uniform(.5, 4)
+            boxes.append(Box.from_center((random.uniform(-room / 2, room / 2), sy / 2, random.uniform(-room / 2, room / 2)), (sx, sy, sz)))
+        linear = StaticWorld(boxes)
+        grid = SpatialGrid(boxes, cell_size=4)
+        points = [(random.uniform(-room / 2, room / 2), 5, random.uniform(-room / 2, room / 2)) for _ in range(2000)]
+        dirs = [(math.cos(a), 0, math.sin(a)) for a in (random.uniform(0, 2 * math.pi) for _ in points)]
+
+        def bench(fn):
+            start = time.perf_counter()
+            fn()
+            return (time.perf_counter() - start) / len(points) * 1e6
+
+        def linear_sweep():
+            for (x, y, z), (dx, dy, dz) in zip(points, dirs):
+                best = 2.0
+                for b in boxes:
+                    h = b.raycast(x, 1, z, dx, dy, dz, best)
+                    if h:
+                        best = h[0]
+
+        probe_linear = bench(lambda: [linear.probe_down(x, y, z, 10) for x, y, z in points])
+        probe_grid = bench(lambda: [grid.probe_down(x, y, z, 10) for x, y, z in points])
+        sweep_linear = bench(linear_sweep)
+        sweep_grid = bench(lambda: [grid.raycast(x, 1, z, dx, dy, dz, 2.0) for (x, y, z), (dx, dy, dz) in zip(points, dirs)])
+        print(f'{count:>9} {room:>6.0f} | {probe_linear:>12.1f} {probe_grid:>10.1f} | {sweep_linear:>12.1f} {sweep_grid:>10.1f}')
+
+    # Threaded: ground probes and patches on one thread while this one streams
+    # boxes in and out; between edits, every patch cut meanwhile that is still
+    # valid must agree with a probe
+    import sys
+    import threading
+    grid = SpatialGrid([Box.from_center((0, -0.5, 0), (60, 1, 60))])
+    stop, errors, patches = threading.Event(), [], []
+
+    def probing():
+        rng = random.Random(7)
+        try:
+            while not stop.is_set():
+                x, z = rng.uniform(-20, 20), rng.uniform(-20, 20)
+                hit = grid.probe_down(x, 5, z, 10)
+                patch = hit and grid.ground_patch(x, z, hit[0])
+                if patch:
+                    patches.append(patch)
+                grid.sweep_box(x, z, .1, 1.7, .5, rng.uniform(-1, 1), rng.uniform(-1, 1))
+        except Exception as error:
+            errors.append(error)
+
+    sys.setswitchinterval(1e-5)     # switch threads as often as possible
+    thread = threading.Thread(target=probing)
+    thread.start()
+    streamed, checked, valid, stale = [], 0, 0, 0
+    deadline = time.perf_counter() + 2
+    while time.perf_counter() < deadline and not errors:
+        for box in streamed:
+            grid.remove(box)
+        streamed = [grid.insert(Box.from_center((random.uniform(-20, 20), .5, random.uniform(-20, 20)), (2, 1, 2)))
+                    for _ in range(4)]
+        cut, checked = patches[checked:], len(patches)
+        for p in cut:
+            if grid.patch_valid(p):
+                valid += 1
+                hit = grid.probe_down((p[0] + p[2]) / 2, p[4] + 1e-3, (p[1] + p[3]) / 2, 1)
+                stale += hit is None or abs(hit[0] - p[4]) > 1e-6
+    stop.set()
+    thread.join()
+    sys.setswitchinterval(.005)
+    print(f'threaded: {len(patches)} patches cut during edits, {valid} still valid after them, {stale} stale, '
+          f'errors {errors}')
+    assert not errors and not stale
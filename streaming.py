@@ -0,0 +1,442 @@
+"""
+streaming.py — chunked world streaming around the player.
+
+- The world is a grid of square chunks `chunk_size` wide on xz. Chunk (i, j)
+  covers x in [i * size, (i + 1) * size), z likewise
+- ChunkStreamer keeps the chunks within `radius` of its target (Mario) resident:
+  missing ones are generated on a worker thread (vertex arrays, one GeomNode
+  and collider shapes; nothing touches the scene graph) and attached on the
+  main thread, nearest first, within `budget_ms` per frame
+- Chunks past radius + `unload_margin` are detached and their shapes leave
+  colliders.static_grid, so ground probes and raycasts only see resident chunks
+- stats() reports load latency (request to attached), worker and attach
+  times, resident geometry bytes and the process's resident memory
+- terrain_chunk() is the default generator: rolling grass, trees and rocks,
+  one draw call per chunk
+- Run this file to benchmark streaming against building the whole area up front
+"""
+
+from ursina import *
+from panda3d.core import GeomVertexArrayFormat, GeomVertexFormat, GeomVertexData, GeomTriangles, Geom, GeomNode
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import numpy as np
+import queue
+import random
+
+import shapes
+import colliders
+
+
+# =============================
+# CHUNK GEOMETRY (worker-safe: numpy and detached Panda3D geometry only)
+# =============================
+_array_format = GeomVertexArrayFormat()
+_array_format.addColumn('vertex', 3, Geom.NT_float32, Geom.C_point)
+_array_format.addColumn('normal', 3, Geom.NT_float32, Geom.C_normal)
+_array_format.addColumn('color', 4, Geom.NT_float32, Geom.C_color)
+VERTEX_FORMAT = GeomVertexFormat.registerFormat(GeomVertexFormat(_array_format))
+
+
+def _box_template():
+    """Unit box in shapes.Box space: x, z in [-.5, .5], y in [0, 1]."""
+    positions, normals, indices = [], [], []
+    for axis in range(3):
+        for sign in (-1, 1):
+            normal = [0, 0, 0]
+            normal[axis] = sign
+            u, v = [a for a in range(3) if a != axis]
+            if sign < 0:
+                u, v = v, u
+            base = len(positions)
+            for du, dv in ((-.5, -.5), (.5, -.5), (.5, .5), (-.5, .5)):
+                p = [0, 0, 0]
+                p[axis], p[u], p[v] = .5 * sign, du, dv
+                positions.append(p)
+                normals.append(normal)
+            indices += [base, base + 1, base + 2, base, base + 2, base + 3]
+    positions = np.array(positions, dtype=np.float32)
+    positions[:, 1] += .5
+    return positions, np.array(normals, dtype=np.float32), np.array(indices, dtype=np.uint32)
+
+
+def _cylinder_template(segments=8):
+    """Capped cylinder in shapes.Cylinder space: radius .5, y in [0, 1]."""
+    angles = np.linspace(0, 2 * np.pi, segments + 1, dtype=np.float32)
+    ring = np.stack((np.sin(angles), np.zeros_like(angles), np.cos(angles)), axis=1)
+    side = np.concatenate((ring * (.5, 1, .5), ring * (.5, 1, .5) + (0, 1, 0)))
+    positions, normals, indices = [side], [np.concatenate((ring, ring))], []
+    n = segments + 1
+    for s in range(segments):
+        indices += [s, s + 1, s + n + 1, s, s + n + 1, s + n]
+    for y, ny in ((0, -1), (1, 1)):
+        base = sum(len(p) for p in positions)
+        cap = np.concatenate(([(0, y, 0)], ring[:-1] * (.5, 1, .5) + (0, y, 0)))
+        positions.append(cap)
+        normals.append(np.tile((0, ny, 0), (len(cap), 1)))
+        for s in range(segments):
+            a, b = base + 1 + s, base + 1 + (s + 1) % segments
+            indices += [base, b, a] if ny < 0 else [base, a, b]
+    return (np.concatenate(positions).astype(np.float32), np.concatenate(normals).astype(np.float32),
+            np.array(indices, dtype=np.uint32))
+
+
+def _sphere_template(rings=6, segments=8):
+    """UV sphere in shapes.Sphere space: radius .5 centred at y=.5."""
+    v = np.linspace(0, np.pi, rings + 1)[:, None]
+    u = np.linspace(0, 2 * np.pi, segments + 1)[None, :]
+    normals = np.stack((np.sin(v) * np.sin(u), -np.cos(v) * np.ones_like(u), np.sin(v) * np.cos(u)), axis=2)
+    normals = normals.reshape(-1, 3).astype(np.float32)
+    row = segments + 1
+    indices = []
+    for r in range(rings):
+        for s in range(segments):
+            a = r * row + s
+            b = a + row
+            indices += [a, a + 1, b, a + 1, b + 1, b]
+    return normals * .5 + (0, .5, 0), normals, np.array(indices, dtype=np.uint32)
+
+
+_templates = {}
+
+
+def _template(name):
+    # The templates wind counter-clockwise (right-handed); Ursina's y-up-left
+    # coordinate system wants the opposite, so each triangle is flipped once here
+    if name not in _templates:
+        positions, normals, indices = {'box': _box_template, 'cylinder': _cylinder_template,
+                                       'sphere': _sphere_template}[name]()
+        _templates[name] = positions, normals, np.ascontiguousarray(indices.reshape(-1, 3)[:, ::-1]).ravel()
+    return _templates[name]
+
+
+class ChunkMesh:
+    """Accumulates vertex-coloured primitives into one vertex / index array pair."""
+    def __init__(self):
+        self.vertices, self.indices = [], []
+        self.count = 0
+
+    def add(self, name, position, scale, rgba):
+        positions, normals, indices = _template(name)
+        rows = np.empty((len(positions), 10), dtype=np.float32)
+        rows[:, 0:3] = positions * scale + position
+        n = normals / scale
+        rows[:, 3:6] = n / np.linalg.norm(n, axis=1)[:, None]
+        rows[:, 6:10] = rgba
+        self.vertices.append(rows)
+        self.indices.append(indices + self.count)
+        self.count += len(rows)
+
+    def add_grid(self, x0, z0, size, cells, y, shade):
+        """Flat square of cells x cells quads, coloured per vertex by shade(x, z)."""
+        steps = np.linspace(0, size, cells + 1, dtype=np.float32)
+        xs, zs = np.meshgrid(x0 + steps, z0 + steps, indexing='ij')
+        rows = np.zeros((len(steps) ** 2, 10), dtype=np.float32)
+        rows[:, 0], rows[:, 1], rows[:, 2] = xs.ravel(), y, zs.ravel()
+        rows[:, 4] = 1
+        rows[:, 6:10] = shade(rows[:, 0], rows[:, 2])
+        row = cells + 1
+        a = (np.arange(cells)[:, None] * row + np.arange(cells)[None, :]).ravel().astype(np.uint32)
+        quads = np.stack((a, a + row + 1, a + 1, a, a + row, a + row + 1), axis=1).ravel()
+        self.vertices.append(rows)
+        self.indices.append(quads + self.count)
+        self.count += len(rows)
+
+    def arrays(self):
+        if not self.vertices:
+            return np.zeros((0, 10), dtype=np.float32), np.zeros(0, dtype=np.uint32)
+        return np.concatenate(self.vertices), np.concatenate(self.indices)
+
+
+def geom_node(name, vertices, indices):
+    """GeomNode over (n, 10) float32 rows (position, normal, rgba) and uint32 indices."""
+    data = GeomVertexData(name, VERTEX_FORMAT, Geom.UH_static)
+    data.uncleanSetNumRows(len(vertices))
+    memoryview(data.modifyArray(0)).cast('B')[:] = np.ascontiguousarray(vertices, dtype=np.float32).tobytes()
+    triangles = GeomTriangles(Geom.UH_static)
+    triangles.setIndexType(Geom.NT_uint32)
+    index_array = triangles.modifyVertices()
+    index_array.uncleanSetNumRows(len(indices))
+    memoryview(index_array).cast('B')[:] = np.ascontiguousarray(indices, dtype=np.uint32).tobytes()
+    geom = Geom(data)
+    geom.addPrimitive(triangles)
+    node = GeomNode(name)
+    node.addGeom(geom)
+    return node
+
+
+# =============================
+# DEFAULT GENERATOR
+# =============================
+def _grass(x, z):
+    g = .55 + .1 * np.sin(x * .045) * np.cos(z * .06) + .05 * np.sin((x + z) * .13)
+    return np.stack((g * .25, g, g * .2, np.ones_like(g)), axis=1)
+
+
+def terrain_chunk(i, j, size, seed=0, ground_y=-1, trees=10, rocks=4):
+    """Open grass with scattered trees and rocks for chunk (i, j), the same
+    for the same seed. Returns (vertices, indices, collider shapes).
+    """
+    rng = random.Random(hash((seed, i, j)))
+    x0, z0 = i * size, j * size
+    mesh = ChunkMesh()
+    mesh.add_grid(x0, z0, size, 8, ground_y, _grass)
+    found = [shapes.Box((x0 + size / 2, ground_y - 1e-3, z0 + size / 2), (size, 1e-3, size))]
+
+    def spot(margin):
+        return rng.uniform(x0 + margin, x0 + size - margin), rng.uniform(z0 + margin, z0 + size - margin)
+
+    for _ in range(rng.randint(trees // 2, trees)):
+        x, z = spot(2)
+        height = rng.uniform(2.5, 4.5)
+        leaves = rng.uniform(2.5, 3.5)
+        mesh.add('cylinder', (x, ground_y, z), (1, height, 1), (.4, .26, .13, 1))
+        mesh.add('sphere', (x, ground_y + height - .5, z), (leaves,) * 3, (.1, rng.uniform(.45, .65), .1, 1))
+        found.append(shapes.Cylinder((x, ground_y, z), (1, height, 1)))
+        found.append(shapes.Sphere((x, ground_y + height - .5, z), (leaves,) * 3))
+    for _ in range(rng.randint(0, rocks)):
+        x, z = spot(3)
+        scale = rng.uniform(1, 4), rng.uniform(.5, 2.5), rng.uniform(1, 4)
+        grey = rng.uniform(.4, .6)
+        mesh.add('box', (x, ground_y, z), scale, (grey, grey, grey * .95, 1))
+        found.append(shapes.Box((x, ground_y, z), scale))
+
+    vertices, indices = mesh.arrays()
+    return vertices, indices, found
+
+
+# =============================
+# STREAMER
+# =============================
+def resident_memory():
+    """The process's resident set size in bytes (0 where it can't be read)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+class ChunkStreamer(Entity):
+    """Keeps the chunks around `target` resident. `generate(i, j, size)` runs on
+    the worker and returns (vertices, indices, shapes) as terrain_chunk() does,
+    or None for an empty chunk. Chunks in `skip` (e.g. under a hand-built
+    level) are never generated. Call after build_static_grid(), which would
+    drop streamed shapes from the grid. With `wait` set, every requested chunk
+    is attached in the frame it is requested (the worker still builds it), so
+    the world at each frame doesn't depend on thread timing, e.g. for replays.
+    """
+    def __init__(self, target=None, chunk_size=50, radius=150, unload_margin=None, budget_ms=2,
+                 generate=terrain_chunk, skip=(), workers=1, wait=False, **kwargs):
+        super().__init__(name='chunk_streamer', **kwargs)
+        self.target = target
+        self.chunk_size = chunk_size
+        self.radius = radius
+        self.unload_margin = chunk_size / 2 if unload_margin is None else unload_margin
+        self.budget_ms = budget_ms
+        self.generate = generate
+        self.skip = set(skip)
+        self.wait = wait
+        self.chunks = {}            # (i, j) -> chunk Entity (with .bytes)
+        self._pending = {}          # (i, j) -> (future, request time)
+        self._ready = {}            # (i, j) -> (result, request time)
+        self._done = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chunks')
+        self._center = None
+
+        self.loaded = self.unloaded = 0
+        self.latencies = deque(maxlen=256)      # ms from request to attached
+        self.worker_times = deque(maxlen=256)   # ms generating on the worker
+        self.frame_times = deque(maxlen=256)    # ms of main-thread streaming work per frame
+        self.resident_bytes = 0
+
+    def _focus(self):
+        p = self.target.world_position if self.target else camera.world_position
+        return p[0], p[2]
+
+    def _distance(self, key, x, z):
+        half = self.chunk_size / 2
+        return math.hypot((key[0] * self.chunk_size + half) - x, (key[1] * self.chunk_size + half) - z)
+
+    def wanted(self, x, z):
+        """Chunk keys whose centre is within radius of (x, z), nearest first."""
+        size, reach = self.chunk_size, self.radius
+        keys = [(i, j)
+                for i in range(math.floor((x - reach) / size), math.floor((x + reach) / size) + 1)
+                for j in range(math.floor((z - reach) / size), math.floor((z + reach) / size) + 1)
+                if (i, j) not in self.skip]
+        keys = [k for k in keys if self._distance(k, x, z) <= reach]
+        return sorted(keys, key=lambda k: self._distance(k, x, z))
+
+    def _work(self, key):
+        start = time.perf_counter()
+        result = self.generate(key[0], key[1], self.chunk_size)
+        if result is not None:
+            vertices, indices, found = result
+            node = geom_node(f'chunk_{key[0]}_{key[1]}', vertices, indices) if len(indices) else None
+            result = node, found, vertices.nbytes + indices.nbytes
+        return result, time.perf_counter() - start
+
+    def _request(self, key):
+        future = self._executor.submit(self._work, key)
+        self._pending[key] = future, time.perf_counter()
+        future.add_done_callback(lambda f: self._done.put((key, f)))
+
+    def _attach(self, key, result, requested):
+        node, found, size = result
+        chunk = Entity(parent=self, name=f'chunk_{key[0]}_{key[1]}', model=NodePath(node) if node else None)
+        colliders.add_static_shapes(chunk, found)
+        chunk.bytes = size
+        self.chunks[key] = chunk
+        self.resident_bytes += size
+        self.loaded += 1
+        self.latencies.append((time.perf_counter() - requested) * 1000)
+
+    def _detach(self, key):
+        chunk = self.chunks.pop(key)
+        colliders.remove_static_shapes(chunk)
+        self.resident_bytes -= chunk.bytes
+        self.unloaded += 1
+        destroy(chunk)
+
+    def refresh(self, x, z):
+        """Requests what is missing around (x, z) and cancels what left the radius."""
+        wanted = self.wanted(x, z)
+        keep = set(wanted)
+        for key in wanted:
+            if key not in self.chunks and key not in self._pending and key not in self._ready:
+                self._request(key)
+        for key in [k for k in self._pending if k not in keep]:
+            self._pending.pop(key)[0].cancel()     # a running one is dropped when it lands
+        for key in [k for k in self._ready if k not in keep]:
+            del self._ready[key]
+
+    def update(self):
+        start = time.perf_counter()
+        x, z = self._focus()
+        center = math.floor(x / self.chunk_size), math.floor(z / self.chunk_size)
+        if center != self._center:
+            self._center = center
+            self.refresh(x, z)
+
+        if self.wait:
+            for key in list(self._pending):
+                self._land(key, self._pending[key][0])    # blocks until built
+        while not self._done.empty():
+            key, future = self._done.get()
+            if not future.cancelled() and self._pending.get(key, (None,))[0] is future:
+                self._land(key, future)
+
+        limit = self.radius + self.unload_margin
+        for key in [k for k in self.chunks if self._distance(k, x, z) > limit]:
+            self._detach(key)
+
+        # Nearest first; at least one per frame so a slow attach can't stall streaming
+        budget = start + self.budget_ms / 1000
+        for key in sorted(self._ready, key=lambda k: self._distance(k, x, z)):
+            result, requested = self._ready.pop(key)
+            if result is not None:
+                self._attach(key, result, requested)
+            if time.perf_counter() > budget and not self.wait:
+                break
+        self.frame_times.append((time.perf_counter() - start) * 1000)
+
+    def _land(self, key, future):
+        _, requested = self._pending.pop(key)
+        try:
+            result, worker_time = future.result()
+        except Exception as e:
+            print_warning(f'chunk {key} failed: {e}')
+            return
+        self.worker_times.append(worker_time * 1000)
+        self._ready[key] = result, requested
+
+    def busy(self):
+        return bool(self._pending or self._ready)
+
+    def stats(self):
+        """Streaming counters, times in ms and memory in bytes."""
+        def summary(values):
+            ordered = sorted(values)
+            if not ordered:
+                return {'mean': 0.0, 'p95': 0.0, 'max': 0.0}
+            return {'mean': sum(ordered) / len(ordered), 'p95': ordered[int(.95 * (len(ordered) - 1))],
+                    'max': ordered[-1]}
+        return {
+            'resident': len(self.chunks),
+            'pending': len(self._pending) + len(self._ready),
+            'loaded': self.loaded,
+            'unloaded': self.unloaded,
+            'latency_ms': summary(self.latencies),
+            'worker_ms': summary(self.worker_times),
+            'frame_ms': summary(self.frame_times),
+            'resident_bytes': self.resident_bytes,
+            'collider_shapes': len(colliders.static_grid) if colliders.static_grid else 0,
+            'process_rss_bytes': resident_memory(),
+        }
+
+    def on_destroy(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for key in list(self.chunks):
+            self._detach(key)
+
+
+# =============================
+# BENCHMARK
+# =============================
+if __name__ == '__main__':
+    import sys
+    import time as _time
+    from panda3d.core import loadPrcFileData
+
+    # Offscreen through EGL (Mesa runs it in software when there's no GPU)
+    loadPrcFileData('streaming', 'load-display p3headlessgl\naux-display p3tinydisplay\nsync-video false\ngl-finish true')
+    app = Ursina(window_type='offscreen', size=(960, 540), development_mode=False)
+    DirectionalLight().look_at(Vec3(1, -1, -1))
+    extent = int(sys.argv[1]) if len(sys.argv) > 1 else 1000     # world is extent x extent
+    size = 50
+
+    player = Entity(position=(0, 0, 0))
+    camera.parent = player
+    camera.position = (0, 3, -10)
+    camera.rotation = (10, 0, 0)
+
+    def run(label, frames=600):
+        # Cross the world south to north in `frames` frames (a fast flight, not a walk)
+        times = []
+        for frame in range(-20, frames):
+            player.position = (0, 0, extent * (max(frame, 0) / frames - .5))
+            start = _time.perf_counter()
+            app.step()
+            if frame >= 0:
+                times.append((_time.perf_counter() - start) * 1000)
+        times.sort()
+        print(f'{label:>9}: mean {sum(times) / len(times):6.2f} ms, p99 {times[int(len(times) * .99)]:6.2f} ms, '
+              f'max {times[-1]:6.2f} ms')
+
+    # Everything up front: generate and attach every chunk before the first frame
+    rss = resident_memory()
+    start = _time.perf_counter()
+    up_front = ChunkStreamer(player, chunk_size=size, radius=extent * .71, budget_ms=1e9)
+    up_front.update()
+    while up_front.busy():
+        _time.sleep(.001)
+        up_front.update()
+    up_front.ignore = True      # stays resident while the player moves
+    stats = up_front.stats()
+    print(f'up front: {stats["resident"]} chunks in {(_time.perf_counter() - start) * 1000:.0f} ms, '
+          f'{stats["resident_bytes"] / 2 ** 20:.1f} MB geometry, {stats["collider_shapes"]} shapes, '
+          f'rss +{(resident_memory() - rss) / 2 ** 20:.1f} MB')
+    run('up front')
+    destroy(up_front)
+    app.step()
+
+    rss = resident_memory()
+    streamer = ChunkStreamer(player, chunk_size=size, radius=150)
+    run('streamed')
+    stats = streamer.stats()
+    print(f'streamed: {stats["resident"]} resident, {stats["loaded"]} loaded / {stats["unloaded"]} unloaded, '
+          f'latency mean {stats["latency_ms"]["mean"]:.1f} ms p95 {stats["latency_ms"]["p95"]:.1f} ms, '
+          f'worker {stats["worker_ms"]["mean"]:.2f} ms/chunk, main thread p95 {stats["frame_ms"]["p95"]:.2f} ms/frame, '
+          f'{stats["resident_bytes"] / 2 ** 20:.1f} MB geometry, {stats["collider_shapes"]} shapes, '
+          f'rss +{(resident_memory() - rss) / 2 ** 20:.1f} MB')